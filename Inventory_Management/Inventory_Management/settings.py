@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    'property_management.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,6 +55,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Share of requests whose query counts and timings are recorded for /metrics
+# and the Server-Timing header; 0 turns recording off
+METRICS_SAMPLE_RATE = 1.0
+
+# Bearer token letting a scraper (e.g. Prometheus) read /metrics without
+# logging in; None leaves /metrics to staff users
+METRICS_TOKEN = None
+
+# Client addresses are not trusted for access, see METRICS_TOKEN
+INTERNAL_IPS = []
+
 ROOT_URLCONF = 'Inventory_Management.urls'
 
 TEMPLATES = [
@@ -89,6 +102,32 @@ DATABASES = {
 }
 
 
+# Caches
+# 'default' holds map tiles, 'accommodations' the serialized published
+# accommodation details. Both are per-process LRU caches; point them at a shared
+# backend (django.core.cache.backends.redis.RedisCache, filebased, ...) when
+# running several server processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'accommodations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'accommodations',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+ACCOMMODATION_CACHE_ALIAS = 'accommodations'
+# Seconds between checks whether the in-process location tree is stale
+LOCATION_TREE_CHECK_INTERVAL = 1.0
+# Seconds between heartbeats of a running background job, seconds without
+# one after which the job counts as abandoned, and how often it is retried
+JOB_HEARTBEAT_INTERVAL = 30
+JOB_STALE_AFTER = 300
+JOB_MAX_ATTEMPTS = 3
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -129,6 +168,12 @@ STATIC_URL = 'static/'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Seconds browsers may cache media files (content-addressed blobs are cached for a year)
+MEDIA_CACHE_MAX_AGE = 3600
+# Let the front-end server send media bodies: '' (Django streams them), 'nginx'
+# (X-Accel-Redirect to MEDIA_ACCEL_PREFIX + path) or 'apache' (X-Sendfile)
+MEDIA_SENDFILE_BACKEND = ''
+MEDIA_ACCEL_PREFIX = '/protected-media/'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
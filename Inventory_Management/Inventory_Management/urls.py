@@ -15,11 +15,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from property_management.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include("property_management.urls")),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.*)$', serve_media, name='media'),
+]
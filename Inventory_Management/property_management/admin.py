@@ -1,10 +1,111 @@
-from django.contrib import admin
+import hashlib
+from django.contrib import admin, messages
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.admin import UserAdmin
-from django.db.models import Q
-from .models import Location, Accommodation, AccommodationImage, LocalizeAccommodation
-from import_export.admin import ImportExportModelAdmin
-from .resources import LocationResource
+from django.core.exceptions import PermissionDenied
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import Location, Accommodation, AccommodationImage, LocalizeAccommodation, Job
+from .exports import StreamingExport
+from .forms import AccommodationStreamExportForm, LocationBulkImportForm, LocationExportForm, StreamExportForm
+from .jobs import enqueue_job
+from .pagination import EstimatedCountPaginator
+from .permissions import get_permissions
+
+
+# Autocomplete matches are cached this many seconds, at most this many per term
+AUTOCOMPLETE_CACHE_TIMEOUT = 30
+AUTOCOMPLETE_RESULT_LIMIT = 200
+
+
+class PrefixAutocompleteMixin:
+    """
+    Answer admin autocomplete requests with an indexed prefix search.
+
+    The term is matched with istartswith on autocomplete_prefix_fields (backed
+    by trigram indexes on UPPER(column)), ranked by get_autocomplete_ordering().
+    The ranked ids are cached briefly, so typing and paging through results
+    does not repeat the search. The changelist search is left unchanged.
+    """
+    autocomplete_prefix_fields = ()
+
+    def get_autocomplete_ordering(self):
+        return ('pk',)
+
+    def get_search_results(self, request, queryset, search_term):
+        match = request.resolver_match
+        term = search_term.strip()
+        if not term or match is None or match.url_name != 'autocomplete':
+            return super().get_search_results(request, queryset, search_term)
+
+        digest = hashlib.md5(term.lower().encode()).hexdigest()
+        key = f'admin-autocomplete:{self.model._meta.label_lower}:{digest}'
+        ids = cache.get(key)
+        if ids is None:
+            condition = Q()
+            for field in self.autocomplete_prefix_fields:
+                condition |= Q(**{f'{field}__istartswith': term})
+            ranked = queryset.filter(condition).order_by(*self.get_autocomplete_ordering())
+            ids = list(ranked.values_list('pk', flat=True)[:AUTOCOMPLETE_RESULT_LIMIT])
+            cache.set(key, ids, AUTOCOMPLETE_CACHE_TIMEOUT)
+        if not ids:
+            return queryset.none(), False
+
+        # Filtering the current queryset again keeps per-user restrictions
+        position = Case(
+            *[When(pk=pk, then=Value(index)) for index, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=ids).order_by(position), False
+
+
+class StreamExportMixin:
+    """
+    Add a stream-export/ page downloading the model as CSV or NDJSON through
+    a StreamingExport, filtered by the fields of stream_export_form.
+    """
+    stream_export_name = None
+    stream_export_form = StreamExportForm
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        custom_urls = [
+            path(
+                'stream-export/',
+                self.admin_site.admin_view(self.stream_export_view),
+                name='%s_%s_stream_export' % info,
+            ),
+        ]
+        return custom_urls + super().get_urls()
+
+    def get_stream_export_filters(self, request, filters):
+        return filters
+
+    def stream_export_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        form = self.stream_export_form(request.GET if 'format' in request.GET else None)
+        if form.is_valid():
+            export = StreamingExport(
+                self.stream_export_name, form.cleaned_data['format'],
+                **self.get_stream_export_filters(request, form.filters()))
+            response = StreamingHttpResponse(export, content_type=export.content_type)
+            response['Content-Disposition'] = f'attachment; filename="{export.filename}"'
+            return response
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f'Export {self.model._meta.verbose_name_plural}',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/property_management/export_form.html', context)
 
 
 # Inline formset for handling multiple images
@@ -15,11 +116,91 @@ class AccommodationImageInline(admin.TabularInline):
 
 
 @admin.register(Location)
-class LocationAdmin(ImportExportModelAdmin, admin.ModelAdmin):
-    resource_class = LocationResource
+class LocationAdmin(PrefixAutocompleteMixin, StreamExportMixin, admin.ModelAdmin):
     list_display = ('id', 'title', 'location_type',
                     'country_code', 'state_abbr', 'city')
     search_fields = ('title', 'country_code', 'state_abbr', 'city')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_prefix_fields = ('title', 'city')
+    change_list_template = 'admin/property_management/location/change_list.html'
+    stream_export_name = 'locations'
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                'bulk-import/',
+                self.admin_site.admin_view(self.bulk_import_view),
+                name='property_management_location_bulk_import',
+            ),
+            path(
+                'queue-export/',
+                self.admin_site.admin_view(self.queue_export_view),
+                name='property_management_location_queue_export',
+            ),
+        ]
+        return custom_urls + urls
+
+    def get_autocomplete_ordering(self):
+        # Countries first, then states, then cities
+        rank = Case(
+            When(location_type__iexact='country', then=Value(0)),
+            When(location_type__iexact='state', then=Value(1)),
+            When(location_type__iexact='city', then=Value(2)),
+            default=Value(3),
+            output_field=IntegerField(),
+        )
+        return (rank, 'title', 'pk')
+
+    def bulk_import_view(self, request):
+        """
+        Queue an uploaded CSV/XLSX file for import by the background workers.
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        if request.method == 'POST':
+            form = LocationBulkImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                upload = form.cleaned_data['csv_file']
+                fmt = 'xlsx' if upload.name.lower().endswith('.xlsx') else 'csv'
+                job = enqueue_job(Job.KIND_LOCATION_IMPORT, user=request.user, upload=upload, format=fmt)
+                self.message_user(request, f'Import queued as job #{job.pk}.', messages.SUCCESS)
+                return redirect('admin:property_management_job_change', job.pk)
+        else:
+            form = LocationBulkImportForm()
+
+        return self._job_form_response(request, form, 'Bulk import locations')
+
+    def queue_export_view(self, request):
+        """
+        Queue an export of all locations for the background workers.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        if request.method == 'POST':
+            form = LocationExportForm(request.POST)
+            if form.is_valid():
+                job = enqueue_job(
+                    Job.KIND_LOCATION_EXPORT, user=request.user, format=form.cleaned_data['format'])
+                self.message_user(request, f'Export queued as job #{job.pk}.', messages.SUCCESS)
+                return redirect('admin:property_management_job_change', job.pk)
+        else:
+            form = LocationExportForm()
+
+        return self._job_form_response(request, form, 'Background export of locations')
+
+    def _job_form_response(self, request, form, title):
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': title,
+            'form': form,
+        }
+        return TemplateResponse(
+            request, 'admin/property_management/location/job_form.html', context)
 
     def has_add_permission(self, request):
         # Allow adding only for superusers
@@ -35,10 +216,7 @@ class LocationAdmin(ImportExportModelAdmin, admin.ModelAdmin):
 
     def has_view_permission(self, request, obj=None):
         # Allow viewing for superusers and members of the Property Owners group
-        return (
-            request.user.is_superuser or
-            request.user.groups.filter(name="Property Owners").exists()
-        )
+        return request.user.is_superuser or get_permissions(request).is_property_owner
     
     # def get_actions(self, request):
     #     """
@@ -55,12 +233,21 @@ class LocationAdmin(ImportExportModelAdmin, admin.ModelAdmin):
 
 
 @admin.register(Accommodation)
-class AccommodationAdmin(admin.ModelAdmin):
+class AccommodationAdmin(StreamExportMixin, admin.ModelAdmin):
     list_display = ('id', 'title', 'user', 'country_code',
                     'bedroom_count', 'review_score', 'published')
     search_fields = ('title', 'country_code')
     list_filter = ('published',)
+    list_select_related = ('user',)
+    # Searchable dropdowns instead of <select>s listing every row
+    autocomplete_fields = ('location', 'user')
+    # The partitioned table is too large for COUNT(*) on every page
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [AccommodationImageInline]
+    change_list_template = 'admin/property_management/accommodation/change_list.html'
+    stream_export_name = 'accommodations'
+    stream_export_form = AccommodationStreamExportForm
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -68,6 +255,28 @@ class AccommodationAdmin(admin.ModelAdmin):
             return qs
         return qs.filter(user=request.user)
 
+    def get_stream_export_filters(self, request, filters):
+        # Same restriction as get_queryset()
+        if not request.user.is_superuser:
+            filters['user'] = request.user.pk
+        return filters
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not AccommodationImage:
+            return super().save_formset(request, form, formset, change)
+
+        # New gallery images are stored in bulk (one INSERT and one array
+        # UPDATE); edited and deleted images go through the regular path
+        images = formset.save(commit=False)
+        for image in formset.deleted_objects:
+            image.delete()
+        for image in images:
+            if image.pk is not None:
+                image.save()
+        new_files = [image.image.file for image in images if image.pk is None]
+        if new_files:
+            AccommodationImage.objects.bulk_upload(form.instance, new_files)
+
     def save_model(self, request, obj, form, change):
         # If the user is a superuser, allow them to select a user
         if request.user.is_superuser:
@@ -77,6 +286,8 @@ class AccommodationAdmin(admin.ModelAdmin):
             obj.user = request.user
 
         obj.save()
+        if obj.user_id == request.user.pk:
+            get_permissions(request).add_accommodation(obj.pk)
 
     def get_fields(self, request, obj=None):
         fields = super().get_fields(request, obj)
@@ -98,22 +309,26 @@ class AccommodationAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         if request.user.is_superuser:
             return True
-        if obj is None or obj.user == request.user:
+        if obj is None or get_permissions(request).owns_accommodation(obj.pk):
             return True
         return False
 
     def has_delete_permission(self, request, obj=None):
         if request.user.is_superuser:
             return True
-        if obj is None or obj.user == request.user:
+        if obj is None or get_permissions(request).owns_accommodation(obj.pk):
             return False
         return False
 
 
 @admin.register(AccommodationImage)
 class AccommodationImageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'accommodation', 'image', 'uploaded_at')
+    list_display = ('id', 'accommodation', 'image', 'uploaded_at', 'width', 'height')
     search_fields = ('accommodation__title',)
+    readonly_fields = ('width', 'height', 'variants')
+    list_select_related = ('accommodation',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -124,14 +339,14 @@ class AccommodationImageAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         if request.user.is_superuser:
             return True
-        if obj is None or obj.accommodation.user == request.user:
+        if obj is None or get_permissions(request).owns_accommodation(obj.accommodation_id):
             return True
         return False
 
     def has_delete_permission(self, request, obj=None):
         if request.user.is_superuser:
             return True
-        if obj is None or obj.accommodation.user == request.user:
+        if obj is None or get_permissions(request).owns_accommodation(obj.accommodation_id):
             return False
         return False
 
@@ -140,6 +355,9 @@ class AccommodationImageAdmin(admin.ModelAdmin):
 class LocalizeAccommodationAdmin(admin.ModelAdmin):
     list_display = ('id', 'property', 'language')
     search_fields = ('language',)
+    list_select_related = ('property',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -150,13 +368,78 @@ class LocalizeAccommodationAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         if request.user.is_superuser:
             return True
-        if obj is None or obj.property.user == request.user:
+        if obj is None or get_permissions(request).owns_accommodation(obj.property_id):
             return True
         return False
 
     def has_delete_permission(self, request, obj=None):
         if request.user.is_superuser:
             return True
-        if obj is None or obj.property.user == request.user:
+        if obj is None or get_permissions(request).owns_accommodation(obj.property_id):
             return False
         return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'processed', 'created_by',
+                    'created_at', 'finished_at', 'download_link')
+    list_filter = ('status', 'kind')
+    list_select_related = ('created_by',)
+    readonly_fields = ('kind', 'status', 'options', 'input_file', 'processed', 'message',
+                       'created_by', 'created_at', 'started_at', 'heartbeat_at', 'attempts',
+                       'finished_at', 'download_link')
+    exclude = ('result_file',)
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(created_by=request.user)
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                '<int:job_id>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='property_management_job_download',
+            ),
+        ]
+        return custom_urls + urls
+
+    @admin.display(description='Result')
+    def download_link(self, obj):
+        if not obj.result_file:
+            return '-'
+        url = reverse('admin:property_management_job_download', args=[obj.pk])
+        return format_html('<a href="{}">Download</a>', url)
+
+    def download_view(self, request, job_id):
+        job = get_object_or_404(self.get_queryset(request), pk=job_id)
+        if not job.result_file:
+            raise Http404('This job has no result file.')
+        return FileResponse(
+            job.result_file.open('rb'), as_attachment=True,
+            filename=job.result_file.name.rsplit('/', 1)[-1])
+
+    def has_add_permission(self, request):
+        # Jobs are only created from the Location import/export pages
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_staff
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class OwnerUserAdmin(PrefixAutocompleteMixin, UserAdmin):
+    autocomplete_prefix_fields = ('username', 'email')
+
+    def get_autocomplete_ordering(self):
+        return ('username',)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class PropertyManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'property_management'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        # Register the partition pruning check
+        from . import checks  # noqa: F401
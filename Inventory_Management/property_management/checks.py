@@ -0,0 +1,95 @@
+from django.core.checks import Warning, register
+from django.db import DatabaseError, connection, transaction
+
+from .models import Accommodation, AccommodationImage, LocalizeAccommodation
+from .routing import relation_scans
+
+# Deployment checks only, so migrate (which runs the database checks before
+# applying anything) never EXPLAINs queries against an older schema
+PARTITION_PRUNING_TAG = 'partition_pruning'
+
+
+def hot_accommodation_queries(accommodation):
+    """
+    The id lookups behind the detail API, admin change views, related object
+    access and save(), for one accommodation, as {name: (routed, queryset)}.
+    Routed ones carry the feed get() adds from the feed cache and save()
+    from the loaded row; the others are what runs with a cold feed cache
+    and when other tables are joined to Accommodation by id.
+    """
+    pk, feed = accommodation.pk, accommodation.feed
+    return {
+        'get by id': (True, Accommodation.objects.filter(pk=pk, feed=feed)),
+        'published detail': (True, Accommodation.objects.filter(pk=pk, feed=feed, published=True)),
+        'cold cache get by id': (False, Accommodation.objects.filter(pk=pk)),
+        'id list': (False, Accommodation.objects.filter(pk__in=[pk])),
+        'image join': (False, AccommodationImage.objects.filter(accommodation_id=pk).select_related('accommodation')),
+        'localization join': (
+            False, LocalizeAccommodation.objects.filter(property_id=pk).select_related('property')),
+    }
+
+
+def id_indexes(cursor):
+    """
+    Names of the indexes whose first column is id, on any table.
+    """
+    cursor.execute("""
+        SELECT index_class.relname
+        FROM pg_index
+        JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+        JOIN pg_attribute ON pg_attribute.attrelid = pg_index.indrelid
+                         AND pg_attribute.attnum = pg_index.indkey[0]
+        WHERE pg_attribute.attname = 'id'
+    """)
+    return {name for name, in cursor.fetchall()}
+
+
+@register(PARTITION_PRUNING_TAG, deploy=True)
+def check_accommodation_partition_pruning(app_configs, databases=None, **kwargs):
+    """
+    EXPLAIN the hot Accommodation queries for a sample row. Warn about routed
+    queries reading more than one feed partition, and about unrouted ones
+    reading a partition other than through an index on id. The feed cache
+    is neither read nor filled. Runs with
+    "check --deploy --tag partition_pruning --database default", and finds
+    nothing while the table or its columns are not migrated yet.
+    """
+    if not databases or 'default' not in databases:
+        return []
+    try:
+        with transaction.atomic():
+            return _partition_pruning_warnings()
+    except DatabaseError:
+        return []
+
+
+def _partition_pruning_warnings():
+    accommodation = Accommodation.objects.only('id', 'feed').order_by().first()
+    if accommodation is None:
+        return []
+    partitions = {partition.name for partition in Accommodation.partitions.list()}
+    errors = []
+    with connection.cursor() as cursor:
+        indexes_on_id = id_indexes(cursor)
+        # Plan as for a large table, whatever the size of the sample data
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, (routed, queryset) in hot_accommodation_queries(accommodation).items():
+            scans = {
+                relation: indexes for relation, indexes in relation_scans(queryset).items()
+                if relation in partitions
+            }
+            if routed and len(scans) > 1:
+                errors.append(Warning(
+                    f'The {name} query on Accommodation reads {len(scans)} partitions',
+                    hint='Filter on feed as well as id so PostgreSQL can prune the other partitions.',
+                    obj=Accommodation,
+                    id='property_management.W001',
+                ))
+            elif not routed and any(not indexes <= indexes_on_id for indexes in scans.values()):
+                errors.append(Warning(
+                    f'The {name} query on Accommodation reads a partition without an index on id',
+                    hint='Every feed partition needs an index on id (see migration 0015).',
+                    obj=Accommodation,
+                    id='property_management.W002',
+                ))
+    return errors
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .metrics import registry
+from .models import Accommodation, LocalizeAccommodation
+from .serializers import accommodation_detail
+
+
+def detail_cache():
+    return caches[settings.ACCOMMODATION_CACHE_ALIAS]
+
+
+def detail_cache_key(accommodation_id):
+    return f'accommodation-detail:{accommodation_id}'
+
+
+def get_accommodation_detail(accommodation_id, language='en'):
+    """
+    Read-through cache of the serialized detail of a published accommodation.
+
+    All languages of one accommodation share a cache entry (a dict keyed by
+    language), so one delete invalidates every translation.
+    :return: The detail dict, or None if there is no such published accommodation.
+    """
+    cache = detail_cache()
+    key = detail_cache_key(accommodation_id)
+    entry = cache.get(key) or {}
+    if language in entry:
+        registry.increment('accommodation_cache_hits_total')
+        return entry[language]
+
+    registry.increment('accommodation_cache_misses_total')
+    try:
+        # get() reads only the row's partition when its feed is cached
+        accommodation = Accommodation.objects.get(pk=accommodation_id, published=True)
+    except Accommodation.DoesNotExist:
+        return None
+    localization = LocalizeAccommodation.objects.filter(property=accommodation, language=language).first()
+    entry[language] = accommodation_detail(accommodation, localization)
+    cache.set(key, entry)
+    return entry[language]
+
+
+def invalidate_accommodation_detail(accommodation_id):
+    """
+    Drop the cached detail of an accommodation now and again once the current
+    transaction commits, so a read racing the write cannot keep stale data.
+    """
+    key = detail_cache_key(accommodation_id)
+    detail_cache().delete(key)
+    transaction.on_commit(lambda: detail_cache().delete(key))
+
+
+def invalidate_accommodation_details(accommodation_ids):
+    """
+    Drop the cached details of many accommodations after a bulk write,
+    once the current transaction commits.
+    """
+    keys = [detail_cache_key(accommodation_id) for accommodation_id in accommodation_ids]
+    transaction.on_commit(lambda: detail_cache().delete_many(keys))
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from .models import Accommodation, Location
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+ExportSpec = namedtuple('ExportSpec', 'model columns ordering filters json_columns')
+ExportSpec.__doc__ = """
+What one export reads: (output column, SQL expression) pairs, the ORDER BY
+served by the primary key index, {filter name: SQL condition} and the
+output columns holding JSON text.
+"""
+
+# Column names match the feed and location importers, so exports can be loaded again
+EXPORTS = {
+    'accommodations': ExportSpec(
+        Accommodation,
+        (
+            ('id', 'id'), ('feed', 'feed'), ('title', 'title'), ('country_code', 'country_code'),
+            ('bedroom_count', 'bedroom_count'), ('review_score', 'review_score'), ('usd_rate', 'usd_rate'),
+            ('latitude', 'ST_Y(center::geometry)'), ('longitude', 'ST_X(center::geometry)'),
+            ('location', 'location_id'), ('amenities', 'amenities::text'), ('images', 'images'),
+            ('user_id', 'user_id'), ('published', 'published'),
+            ('created_at', 'created_at'), ('updated_at', 'updated_at'),
+        ),
+        'feed, id',
+        {
+            # A feed filter reads a single partition
+            'feed': 'feed = %s',
+            'country': 'country_code = %s',
+            'published': 'published = %s',
+            'user': 'user_id = %s',
+        },
+        # Django registers no jsonb decoder with psycopg2, so jsonb is read as
+        # text and decoded explicitly where the output needs values
+        {'amenities'},
+    ),
+    'locations': ExportSpec(
+        Location,
+        (
+            ('id', 'id'), ('title', 'title'), ('center', 'ST_AsText(center::geometry)'),
+            ('parent', 'parent_id'), ('location_type', 'location_type'), ('country_code', 'country_code'),
+            ('state_abbr', 'state_abbr'), ('city', 'city'),
+            ('created_at', 'created_at'), ('updated_at', 'updated_at'),
+        ),
+        'id',
+        {
+            'country': 'country_code = %s',
+        },
+        set(),
+    ),
+}
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_value(value):
+    # JSON cells, as read back by the feed importer; jsonb columns already arrive as JSON text
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class StreamingExport:
+    """
+    An export of a whole table as CSV or NDJSON, produced chunk by chunk.
+
+    Iterating yields the text of chunk_size rows at a time, read through a
+    server-side cursor, so memory use does not grow with the table and the
+    first bytes go out before the query has finished. Iterate it into a
+    StreamingHttpResponse or a file. The cursor is read inside a transaction
+    so PostgreSQL does not materialize the result as it would for a cursor
+    held across commits.
+    """
+
+    def __init__(self, name, file_format='csv', chunk_size=2000, **filters):
+        """
+        :param name: Key of EXPORTS.
+        :param filters: Values of the spec's filters; None means unfiltered.
+        :raises ValueError: For an unknown export, format or filter.
+        """
+        if name not in EXPORTS:
+            raise ValueError(f'Unknown export "{name}"')
+        if file_format not in EXPORT_CONTENT_TYPES:
+            raise ValueError(f'Unknown format "{file_format}"')
+        self.spec = EXPORTS[name]
+        unknown = set(filters) - set(self.spec.filters)
+        if unknown:
+            raise ValueError(f'{name} cannot be filtered by {", ".join(sorted(unknown))}')
+        self.name = name
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.filters = {key: value for key, value in filters.items() if value is not None}
+        self.rows = 0
+
+    @property
+    def content_type(self):
+        return EXPORT_CONTENT_TYPES[self.file_format]
+
+    @property
+    def filename(self):
+        return f'{self.name}.{self.file_format}'
+
+    def sql(self):
+        select = ', '.join(f'{expression} AS "{column}"' for column, expression in self.spec.columns)
+        conditions = [self.spec.filters[key] for key in self.filters]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return (
+            f'SELECT {select} FROM {self.spec.model._meta.db_table} {where} ORDER BY {self.spec.ordering}',
+            list(self.filters.values()),
+        )
+
+    def __iter__(self):
+        columns = [column for column, _ in self.spec.columns]
+        if self.file_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            yield buffer.getvalue()
+
+        sql, params = self.sql()
+        with transaction.atomic(), connection.chunked_cursor() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                self.rows += len(rows)
+                if self.file_format == 'csv':
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    writer.writerows([_csv_value(value) for value in row] for row in rows)
+                    yield buffer.getvalue()
+                else:
+                    yield ''.join(json.dumps(self._record(columns, row)) + '\n' for row in rows)
+
+    def _record(self, columns, row):
+        record = {}
+        for column, value in zip(columns, row):
+            if column in self.spec.json_columns and value is not None:
+                record[column] = json.loads(value)
+            else:
+                record[column] = _json_value(value)
+        return record
@@ -0,0 +1,610 @@
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, wait
+from decimal import Decimal, InvalidOperation
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .detail_cache import invalidate_accommodation_details
+from .geo import invalidate_tiles
+from .importers import ImportReport, copy_rows, parse_center
+from .location_tree import get_location_tree
+from .models import Accommodation
+from .partitions import partition_for
+
+# Columns loaded into the staging table, in COPY order
+FEED_COLUMNS = (
+    'id', 'title', 'country_code', 'bedroom_count', 'review_score', 'usd_rate',
+    'center', 'location_id', 'amenities', 'images', 'published', 'content_hash',
+)
+STAGING_DEFINITION = """
+    id varchar(20) NOT NULL,
+    title varchar(100) NOT NULL,
+    country_code varchar(2) NOT NULL,
+    bedroom_count integer NOT NULL,
+    review_score numeric(3, 1) NOT NULL,
+    usd_rate numeric(10, 2) NOT NULL,
+    center geography(Point, 4326) NOT NULL,
+    location_id varchar(20) NOT NULL,
+    amenities jsonb,
+    images jsonb NOT NULL,
+    published boolean NOT NULL,
+    content_hash varchar(32) NOT NULL
+"""
+# Columns rewritten when the content hash of a row changed
+UPDATED_COLUMNS = FEED_COLUMNS[1:]
+# Class of the advisory locks a merge takes on the hash of each id it
+# inserts, so two feeds inserting the same new id are merged one after the
+# other and the second one sees the first one's row
+FEED_ID_LOCK_CLASS = 20230401
+# Tiles are invalidated this many points at a time
+TILE_INVALIDATION_BATCH = 1000
+
+# Feed files are named after their feed, e.g. feed_42.ndjson or 42.csv
+FEED_FILE_RE = re.compile(r'(\d+)\.(ndjson|jsonl|csv)$', re.IGNORECASE)
+
+BOOLEAN_VALUES = {'true': True, 't': True, '1': True, 'yes': True, 'false': False, 'f': False, '0': False, 'no': False}
+
+
+class FeedIngestReport(ImportReport):
+    """
+    Outcome of one feed ingest: the import counters plus what the merge did
+    and how fast it went.
+    """
+
+    def __init__(self, feed):
+        super().__init__()
+        self.feed = feed
+        self.partition = None
+        self.inserted = 0
+        self.updated = 0
+        self.unpublished = 0
+        self.started = time.monotonic()
+        self.finished = None
+        # Seconds spent waiting for the id locks of other ingests
+        self.lock_wait = 0.0
+
+    @property
+    def unchanged(self):
+        return self.loaded - self.inserted - self.updated
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def _max_length(field_name):
+    return Accommodation._meta.get_field(field_name).max_length
+
+
+def _decimal(value, name, maximum):
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f'Invalid {name} "{value}"')
+    if not number.is_finite() or not 0 <= number <= maximum:
+        raise ValueError(f'{name} out of range ({value})')
+    return number
+
+
+def _json(value, name, types):
+    # CSV cells hold JSON text, NDJSON records the decoded value
+    if isinstance(value, str):
+        if not value.strip():
+            return None
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError(f'Invalid JSON in {name}')
+    if value is not None and not isinstance(value, types):
+        raise ValueError(f'Invalid {name}')
+    return value
+
+
+def _boolean(value, name):
+    if value in (None, ''):
+        return True
+    if isinstance(value, bool):
+        return value
+    try:
+        return BOOLEAN_VALUES[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError(f'Invalid {name} "{value}"')
+
+
+def clean_accommodation_row(row, feed):
+    """
+    Validate one feed record and return it as a tuple in FEED_COLUMNS order,
+    ending with the hash of its content. Checks against other records and
+    the database are made per batch by check_batch.
+    :raises ValueError: Describing the first problem found.
+    """
+    if not isinstance(row, dict):
+        raise ValueError('Invalid JSON record')
+    if row.get('feed') not in (None, '') and str(row['feed']).strip() != str(feed):
+        raise ValueError(f'Record of feed {row["feed"]}')
+
+    values = {name: str(row.get(name) or '').strip() for name in ('id', 'title', 'country_code')}
+    values['country_code'] = values['country_code'].upper()
+    values['location_id'] = str(row.get('location') or row.get('location_id') or '').strip()
+    for name in ('id', 'title', 'country_code', 'location_id'):
+        if not values[name]:
+            raise ValueError(f'Missing {name}')
+        limit = _max_length('id' if name == 'location_id' else name)
+        if len(values[name]) > limit:
+            raise ValueError(f'{name} is longer than {limit} characters')
+
+    try:
+        values['bedroom_count'] = int(row.get('bedroom_count'))
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid bedroom_count "{row.get("bedroom_count")}"')
+    if values['bedroom_count'] < 0:
+        raise ValueError('bedroom_count cannot be negative')
+    values['review_score'] = _decimal(row.get('review_score') or 0, 'review_score', Decimal('99.9'))
+    values['usd_rate'] = _decimal(row.get('usd_rate'), 'usd_rate', Decimal('99999999.99'))
+    values['center'] = parse_center(row)
+
+    values['amenities'] = _json(row.get('amenities'), 'amenities', (list, dict))
+    images = _json(row.get('images'), 'images', list) or []
+    if not all(isinstance(url, str) and len(url) <= 300 for url in images):
+        raise ValueError('images must be URLs of at most 300 characters')
+    values['images'] = images
+    values['published'] = _boolean(row.get('published'), 'published')
+
+    content = [values[name] for name in FEED_COLUMNS[:-1]]
+    values['content_hash'] = hashlib.md5(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+    values['amenities'] = None if values['amenities'] is None else json.dumps(values['amenities'])
+    values['images'] = json.dumps(images)
+    return tuple(values[name] for name in FEED_COLUMNS)
+
+
+def check_batch(cursor, batch, feed, report):
+    """
+    Validate a batch of cleaned records against the location tree and the
+    other feeds with one query, rejecting the records that fail.
+    :param batch: [(line number, values)].
+    :return: The values of the accepted records.
+    """
+    locations = get_location_tree().nodes
+    cursor.execute(
+        f'SELECT id, feed FROM {Accommodation._meta.db_table} WHERE id = ANY(%s) AND feed <> %s',
+        [[values[0] for _, values in batch], feed])
+    other_feeds = dict(cursor.fetchall())
+
+    accepted = []
+    for line, values in batch:
+        accommodation_id, location_id = values[0], values[7]
+        if location_id not in locations:
+            report.reject(line, accommodation_id, f'Unknown location "{location_id}"')
+        elif accommodation_id in other_feeds:
+            report.reject(line, accommodation_id, f'Already listed in feed {other_feeds[accommodation_id]}')
+        else:
+            accepted.append(values)
+    return accepted
+
+
+def read_feed_csv(fp):
+    # Line 1 is the header
+    yield from enumerate(csv.DictReader(fp), start=2)
+
+
+def read_feed_ndjson(fp):
+    """
+    Read one JSON object per line. `center` may be WKT, a [longitude,
+    latitude] pair or an object with longitude/latitude keys. Lines that are
+    not JSON objects are yielded as None so they get reported.
+    """
+    for line, text in enumerate(fp, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            center = record.get('center')
+            if isinstance(center, (list, tuple)) and len(center) >= 2:
+                record = {**record, 'center': None, 'longitude': center[0], 'latitude': center[1]}
+            elif isinstance(center, dict):
+                record = {**record, 'center': None, **center}
+        yield line, record
+
+
+# Maps a feed file format to the reader turning a text file object into (line, record)
+FEED_READERS = {
+    'csv': read_feed_csv,
+    'ndjson': read_feed_ndjson,
+}
+
+
+def _point(x, y):
+    return None if x is None else Point(x, y, srid=4326)
+
+
+def _invalidate_tiles(points):
+    points = [point for point in points if point is not None]
+    for start in range(0, len(points), TILE_INVALIDATION_BATCH):
+        invalidate_tiles(*points[start:start + TILE_INVALIDATION_BATCH])
+
+
+def ingest_accommodation_feed(fp, feed, owner, format='ndjson', batch_size=5000, unpublish_missing=True,
+                              progress=None, excluded_ids=None):
+    """
+    Load a partner feed into its Accommodation partition.
+
+    Records are streamed from the file, validated in Python and per batch,
+    and copied into a temporary staging table; one INSERT ... ON CONFLICT
+    (feed, id) then adds new rows and rewrites only the rows whose content
+    hash changed. Rows of the feed missing from the file are unpublished,
+    unless nothing could be loaded, so a truncated or broken file never
+    empties a feed. Records that were rejected are not unpublished.
+
+    Rows are written straight to the partition holding the feed, so other
+    feeds' partitions are never locked. The merge takes an advisory lock
+    per id it inserts, in sorted order, then rejects staged ids listed in
+    another feed again: check_batch runs without the locks, so two ingests
+    could otherwise both insert the same new id. Only merges sharing new
+    ids wait for each other. Like bulk_import_locations this bypasses
+    save() and its signals; the cached details and tiles of changed rows
+    are dropped once the merge commits.
+    :param fp: Text file object in the given format.
+    :param owner: User owning newly created accommodations.
+    :param batch_size: Number of records validated and sent per COPY.
+    :param progress: Optional callable receiving the report after each batch.
+    :param excluded_ids: Optional {id: reason} of records to reject, see ingest_feed_files.
+    :return: FeedIngestReport.
+    """
+    report = FeedIngestReport(feed)
+    partition = Accommodation.partitions.for_key(feed)
+    report.partition = partition.name
+    table = connection.ops.quote_name(partition.name)
+    staging = 'accommodation_feed_staging'
+    columns = ', '.join(FEED_COLUMNS)
+    excluded_ids = excluded_ids or {}
+    # Line of each id in the file
+    file_lines = {}
+    # Ids present in the file whose record was rejected: they are not unpublished
+    rejected_ids = set()
+    batch = []
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(f"CREATE TEMPORARY TABLE {staging} ({STAGING_DEFINITION})")
+
+        def flush():
+            if batch:
+                accepted = check_batch(cursor, batch, feed, report)
+                accepted_ids = {values[0] for values in accepted}
+                rejected_ids.update(values[0] for _, values in batch if values[0] not in accepted_ids)
+                if accepted:
+                    copy_rows(cursor, staging, accepted, FEED_COLUMNS)
+                    report.loaded += len(accepted)
+                batch.clear()
+            if progress:
+                progress(report)
+
+        for line, row in FEED_READERS[format](fp):
+            report.rows += 1
+            try:
+                values = clean_accommodation_row(row, feed)
+            except ValueError as e:
+                accommodation_id = str(row.get('id') or '').strip() if isinstance(row, dict) else ''
+                if accommodation_id:
+                    rejected_ids.add(accommodation_id)
+                report.reject(line, accommodation_id or None, str(e))
+                continue
+
+            if values[0] in file_lines:
+                report.reject(line, values[0], 'Duplicate id in file')
+                continue
+            file_lines[values[0]] = line
+            if values[0] in excluded_ids:
+                rejected_ids.add(values[0])
+                report.reject(line, values[0], excluded_ids[values[0]])
+                continue
+            batch.append((line, values))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+        updates = ', '.join(f'{name} = EXCLUDED.{name}' for name in UPDATED_COLUMNS)
+        staged = ', '.join(
+            'ARRAY(SELECT jsonb_array_elements_text(s.images))' if name == 'images' else f's.{name}'
+            for name in FEED_COLUMNS
+        )
+        now = timezone.now()
+        with transaction.atomic():
+            waiting = time.monotonic()
+            cursor.execute(f"""
+                SELECT count(pg_advisory_xact_lock(%s, key)) FROM (
+                    SELECT DISTINCT hashtext(s.id) AS key FROM {staging} s
+                    WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.feed = %s AND t.id = s.id)
+                    ORDER BY key
+                ) new_ids
+            """, [FEED_ID_LOCK_CLASS, feed])
+            report.lock_wait += time.monotonic() - waiting
+            cursor.execute(f"""
+                DELETE FROM {staging} s USING {Accommodation._meta.db_table} a
+                WHERE a.id = s.id AND a.feed <> %s
+                RETURNING s.id, a.feed
+            """, [feed])
+            for accommodation_id, other_feed in cursor.fetchall():
+                rejected_ids.add(accommodation_id)
+                report.loaded -= 1
+                report.reject(file_lines[accommodation_id], accommodation_id, f'Already listed in feed {other_feed}')
+
+            # The CTEs see the rows as they were before the upsert, which
+            # gives the old centers of moved accommodations
+            cursor.execute(f"""
+                WITH previous AS (
+                    SELECT t.id, t.center FROM {table} t JOIN {staging} s ON s.id = t.id
+                    WHERE t.feed = %s AND t.content_hash IS DISTINCT FROM s.content_hash
+                ), upserted AS (
+                    INSERT INTO {table} ({columns}, feed, user_id, created_at, updated_at)
+                    SELECT {staged}, %s, %s, %s, %s FROM {staging} s
+                    ON CONFLICT (feed, id) DO UPDATE SET {updates}, updated_at = EXCLUDED.updated_at
+                    WHERE {table}.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+                    RETURNING id, center, xmax = 0 AS inserted
+                )
+                SELECT upserted.id, upserted.inserted,
+                       ST_X(upserted.center::geometry), ST_Y(upserted.center::geometry),
+                       ST_X(previous.center::geometry), ST_Y(previous.center::geometry)
+                FROM upserted LEFT JOIN previous ON previous.id = upserted.id
+            """, [feed, feed, owner.pk, now, now])
+            changed_ids = []
+            points = []
+            for accommodation_id, inserted, x, y, old_x, old_y in cursor.fetchall():
+                if inserted:
+                    report.inserted += 1
+                else:
+                    report.updated += 1
+                    changed_ids.append(accommodation_id)
+                points += [_point(x, y), _point(old_x, old_y)]
+
+            if unpublish_missing and report.loaded:
+                # Clearing the hash makes the row be rewritten, and so
+                # published again, if it comes back in a later file
+                cursor.execute(f"""
+                    UPDATE {table} t SET published = false, content_hash = '', updated_at = %s
+                    WHERE t.feed = %s AND t.published
+                      AND NOT EXISTS (SELECT 1 FROM {staging} s WHERE s.id = t.id)
+                      AND NOT (t.id = ANY(%s))
+                    RETURNING t.id, ST_X(t.center::geometry), ST_Y(t.center::geometry)
+                """, [now, feed, list(rejected_ids)])
+                for accommodation_id, x, y in cursor.fetchall():
+                    report.unpublished += 1
+                    changed_ids.append(accommodation_id)
+                    points.append(_point(x, y))
+
+            invalidate_accommodation_details(changed_ids)
+            transaction.on_commit(lambda: _invalidate_tiles(points))
+
+        cursor.execute(f"DROP TABLE {staging}")
+
+    report.finished = time.monotonic()
+    return report
+
+
+FeedFile = namedtuple('FeedFile', 'path feed format partition size')
+
+
+def discover_feed_files(directory):
+    """
+    Find the feed files of a directory and the partition each one writes to.
+    :raises ValueError: If two files hold the same feed.
+    """
+    partitions = Accommodation.partitions.list()
+    feed_files = {}
+    for name in sorted(os.listdir(directory)):
+        match = FEED_FILE_RE.search(name)
+        path = os.path.join(directory, name)
+        if not match or not os.path.isfile(path):
+            continue
+        feed = int(match.group(1))
+        if feed in feed_files:
+            raise ValueError(f'{name} and {os.path.basename(feed_files[feed].path)} both hold feed {feed}')
+        file_format = 'csv' if match.group(2).lower() == 'csv' else 'ndjson'
+        partition = partition_for(partitions, feed, Accommodation._meta.db_table)
+        feed_files[feed] = FeedFile(path, feed, file_format, partition.name, os.path.getsize(path))
+    return list(feed_files.values())
+
+
+class FeedRunReport:
+    """
+    Aggregated outcome of ingesting many feed files.
+    """
+
+    def __init__(self):
+        # (FeedFile, FeedIngestReport or None, error message or None)
+        self.results = []
+        self.started = time.monotonic()
+        self.finished = None
+
+    def add(self, feed_file, report, error=None):
+        self.results.append((feed_file, report, error))
+
+    @property
+    def reports(self):
+        return [report for _, report, _ in self.results if report is not None]
+
+    @property
+    def failures(self):
+        return [(feed_file, error) for feed_file, _, error in self.results if error is not None]
+
+    def total(self, name):
+        return sum(getattr(report, name) for report in self.reports)
+
+    @property
+    def rejected(self):
+        return sum(len(report.errors) for report in self.reports)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.total('rows') / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def serial_seconds(self):
+        # Time the same ingests take one after the other, without the time
+        # they spent waiting for each other's id locks
+        return sum(report.elapsed - report.lock_wait for report in self.reports)
+
+
+class SerialExecutor(Executor):
+    """
+    Executor running each call right away in this process, used for a single worker.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def init_feed_worker():
+    # Workers started with spawn or forkserver import Django from scratch
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def read_feed_ids(path, file_format):
+    """
+    Return the set of record ids of one feed file, read in a worker.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        ids = {str(row.get('id') or '').strip() for _, row in FEED_READERS[file_format](f) if isinstance(row, dict)}
+    ids.discard('')
+    return ids
+
+
+def shared_feed_ids(feed_ids):
+    """
+    Find the ids listed in the files of more than one feed.
+    :param feed_ids: {feed: set of ids in its file}.
+    :return: {feed: {id: reason}} for the feeds holding such ids.
+    """
+    first_feed = {}
+    shared = defaultdict(set)
+    for feed, ids in feed_ids.items():
+        for accommodation_id in ids:
+            other = first_feed.setdefault(accommodation_id, feed)
+            if other != feed:
+                shared[accommodation_id].update((other, feed))
+    excluded = defaultdict(dict)
+    for accommodation_id, feeds in shared.items():
+        for feed in feeds:
+            others = ', '.join(str(other) for other in sorted(feeds - {feed}))
+            excluded[feed][accommodation_id] = f'Also listed in the file of feed {others}'
+    return dict(excluded)
+
+
+def ingest_feed_file(path, feed, owner_id, file_format, batch_size, unpublish_missing, excluded_ids=None):
+    """
+    Ingest one feed file in a worker, through the worker's own connection.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return ingest_accommodation_feed(
+            f, feed, User(pk=owner_id), format=file_format, batch_size=batch_size,
+            unpublish_missing=unpublish_missing, excluded_ids=excluded_ids)
+
+
+def ingest_feed_files(feed_files, owner, workers=4, per_partition=1, batch_size=5000, unpublish_missing=True,
+                      progress=None):
+    """
+    Ingest many feed files concurrently on a pool of worker processes.
+
+    Feeds in different partitions share no row locks, so the scheduler runs
+    up to `workers` ingests at once but at most `per_partition` of them in
+    the same partition; only merges inserting the same new id wait for each
+    other. The largest files are started first so a long ingest does not
+    begin at the end of the run. Each worker process opens its own
+    database connection and keeps it for all its files. One failing file
+    does not stop the others.
+
+    Before any file is ingested, the workers read the ids of every file.
+    Records whose id is listed in more than one file are rejected in all of
+    them, as there is no telling which feed the accommodation belongs to.
+    :param feed_files: FeedFile list, see discover_feed_files.
+    :param workers: Number of worker processes; 1 ingests in this process.
+    :param progress: Optional callable receiving (FeedFile, report, error) as each file finishes.
+    :raises TransactionManagementError: If called with workers > 1 inside a transaction.
+    :return: FeedRunReport.
+    """
+    run = FeedRunReport()
+    waiting = sorted(feed_files, key=lambda feed_file: feed_file.size, reverse=True)
+    running = {}
+    busy = Counter()
+    if workers > 1:
+        if connection.in_atomic_block:
+            raise transaction.TransactionManagementError(
+                'Feeds cannot be ingested by worker processes inside a transaction.')
+        # Forked workers must not share this process's connections
+        connections.close_all()
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('fork'), initializer=init_feed_worker)
+    else:
+        executor = SerialExecutor()
+
+    def finish(feed_file, report, error):
+        run.add(feed_file, report, error)
+        if progress:
+            progress(feed_file, report, error)
+
+    with executor:
+        scans = {executor.submit(read_feed_ids, feed_file.path, feed_file.format): feed_file for feed_file in waiting}
+        feed_ids = {}
+        for future, feed_file in scans.items():
+            try:
+                feed_ids[feed_file.feed] = future.result()
+            except Exception as e:
+                waiting.remove(feed_file)
+                finish(feed_file, None, f'{type(e).__name__}: {e}')
+        excluded = shared_feed_ids(feed_ids)
+        del scans, feed_ids
+
+        while waiting or running:
+            for feed_file in list(waiting):
+                if len(running) >= max(workers, 1):
+                    break
+                if busy[feed_file.partition] >= per_partition:
+                    continue
+                waiting.remove(feed_file)
+                busy[feed_file.partition] += 1
+                future = executor.submit(
+                    ingest_feed_file, feed_file.path, feed_file.feed, owner.pk, feed_file.format,
+                    batch_size, unpublish_missing, excluded.get(feed_file.feed))
+                running[future] = feed_file
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                feed_file = running.pop(future)
+                busy[feed_file.partition] -= 1
+                try:
+                    report, error = future.result(), None
+                except Exception as e:
+                    report, error = None, f'{type(e).__name__}: {e}'
+                finish(feed_file, report, error)
+
+    run.finished = time.monotonic()
+    return run
@@ -24,3 +24,35 @@ class PropertyOwnerSignUpForm(UserCreationForm):
         # Remove labels
         # for field_name in self.fields:
         #     self.fields[field_name].label = ''
+
+
+class LocationBulkImportForm(forms.Form):
+    csv_file = forms.FileField(label='CSV or XLSX file')
+
+    def clean_csv_file(self):
+        upload = self.cleaned_data['csv_file']
+        if not upload.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Only .csv and .xlsx files can be imported.')
+        return upload
+
+
+class LocationExportForm(forms.Form):
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('xlsx', 'XLSX')])
+
+
+class StreamExportForm(forms.Form):
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')])
+    country = forms.CharField(max_length=2, required=False, help_text='Two-letter country code')
+
+    def clean_country(self):
+        return self.cleaned_data['country'].upper() or None
+
+    def filters(self):
+        return {name: value for name, value in self.cleaned_data.items() if name != 'format'}
+
+
+class AccommodationStreamExportForm(StreamExportForm):
+    feed = forms.IntegerField(min_value=0, required=False)
+    published = forms.NullBooleanField(required=False, widget=forms.Select(choices=[
+        ('unknown', 'All'), ('true', 'Published'), ('false', 'Unpublished'),
+    ]))
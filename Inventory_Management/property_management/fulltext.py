@@ -0,0 +1,81 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+
+from .models import LocalizeAccommodation
+
+# PostgreSQL text search configuration used for each LocalizeAccommodation.language.
+# Languages without a stemmer fall back to "simple" (lower-casing only).
+TEXT_SEARCH_CONFIGS = {
+    'da': 'danish',
+    'de': 'german',
+    'en': 'english',
+    'es': 'spanish',
+    'fi': 'finnish',
+    'fr': 'french',
+    'hu': 'hungarian',
+    'it': 'italian',
+    'nl': 'dutch',
+    'no': 'norwegian',
+    'pt': 'portuguese',
+    'ro': 'romanian',
+    'ru': 'russian',
+    'sv': 'swedish',
+    'tr': 'turkish',
+}
+
+
+def text_search_config(language):
+    return TEXT_SEARCH_CONFIGS.get((language or '').lower(), 'simple')
+
+
+def search_vector_sql():
+    """
+    SQL expression computing a row's search vector with its language's configuration.
+    """
+    whens = ' '.join(f"WHEN '{code}' THEN '{config}'" for code, config in TEXT_SEARCH_CONFIGS.items())
+    return (
+        f"to_tsvector((CASE LOWER(language) {whens} ELSE 'simple' END)::regconfig, "
+        f"COALESCE(description, ''))"
+    )
+
+
+def rebuild_search_vectors(batch_size=10000, progress=None):
+    """
+    Recompute every stored search vector in id-range batches, each committed
+    on its own so a rebuild never holds long locks on the whole table.
+    :param progress: Optional callable receiving the number of rows updated so far.
+    :return: Number of rows updated.
+    """
+    table = LocalizeAccommodation._meta.db_table
+    updated = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+        low, high = cursor.fetchone()
+        if low is None:
+            return 0
+        for start in range(low, high + 1, batch_size):
+            cursor.execute(
+                f"UPDATE {table} SET search_vector = {search_vector_sql()} WHERE id >= %s AND id < %s",
+                [start, start + batch_size],
+            )
+            updated += cursor.rowcount
+            if progress:
+                progress(updated)
+    return updated
+
+
+def search_localizations(text, language='en', limit=20):
+    """
+    Rank the localized descriptions in one language against a web-style query
+    ("quoted phrases", -exclusions, or), keeping published accommodations only.
+    """
+    config = text_search_config(language)
+    query = SearchQuery(text, config=config, search_type='websearch')
+    return (
+        LocalizeAccommodation.objects
+        .filter(language=language, search_vector=query, property__published=True)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .select_related('property')
+        .order_by('-rank', 'id')[:limit]
+    )
@@ -0,0 +1,184 @@
+import base64
+import json
+import math
+
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Accommodation
+
+# Deepest zoom level served by the tile endpoint
+MAX_TILE_ZOOM = 20
+# Below this zoom level points are aggregated into clusters
+CLUSTER_MAX_ZOOM = 14
+# Clusters are computed on a GRID_SIZE x GRID_SIZE grid inside each tile
+GRID_SIZE = 8
+# Web Mercator cannot represent the poles
+MAX_LATITUDE = 85.05112878
+TILE_CACHE_TIMEOUT = 600
+
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, types):
+    """
+    :param types: Type of each value the cursor must hold, e.g. (float, str).
+    :raises ValueError: If the cursor was not produced by encode_cursor.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, UnicodeError, json.JSONDecodeError, base64.binascii.Error) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError('Invalid cursor')
+    for i, (value, expected) in enumerate(zip(values, types)):
+        if expected is float:
+            # JSON has a single number type, so integral distances may come back as int
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ValueError('Invalid cursor')
+            values[i] = float(value)
+        elif not isinstance(value, expected):
+            raise ValueError('Invalid cursor')
+    return values
+
+
+def nearby_accommodations(lat, lon, radius_km, limit=20, after=None):
+    """
+    Return published accommodations within radius_km of a point, nearest first.
+
+    ST_DWithin narrows the search through the GiST index on center, and rows
+    are ordered with the KNN operator (<->) so the index also drives the
+    ordering. Pagination is keyset based: after is the (distance, id) of the
+    last row of the previous page, so deep pages cost the same as the first.
+    :return: Tuple of (accommodations with a `distance` attribute in meters,
+             (distance, id) of the last row or None when there are no more pages).
+    """
+    table = Accommodation._meta.db_table
+    point = 'ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326)::geography'
+    params = {'lat': lat, 'lon': lon, 'radius': radius_km * 1000, 'limit': limit + 1}
+
+    keyset = ''
+    if after is not None:
+        keyset = f'AND (center <-> {point}, id) > (%(after_distance)s, %(after_id)s)'
+        params['after_distance'], params['after_id'] = after
+
+    rows = list(Accommodation.objects.raw(f"""
+        SELECT *, center <-> {point} AS distance
+        FROM {table}
+        WHERE published
+          AND ST_DWithin(center, {point}, %(radius)s)
+          {keyset}
+        ORDER BY center <-> {point}, id
+        LIMIT %(limit)s
+    """, params))
+
+    # One extra row is fetched to know whether another page exists
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].distance, rows[-1].id)
+
+
+def tile_bounds(z, x, y):
+    """
+    Return (west, south, east, north) in degrees for a Web Mercator (XYZ) tile.
+    """
+    n = 2 ** z
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y)
+
+
+def tile_for_point(z, lon, lat):
+    """
+    Return the (x, y) of the tile containing a point at zoom level z.
+    """
+    n = 2 ** z
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(x, n - 1), min(y, n - 1)
+
+
+def tile_cache_key(z, x, y):
+    return f'accommodation-tile:{z}:{x}:{y}'
+
+
+def invalidate_tiles(*points):
+    """
+    Drop the cached tiles containing any of the given points at every zoom level.
+    """
+    keys = [
+        tile_cache_key(z, *tile_for_point(z, point.x, point.y))
+        for point in points if point is not None
+        for z in range(MAX_TILE_ZOOM + 1)
+    ]
+    cache.delete_many(keys)
+
+
+def accommodation_tile(z, x, y):
+    """
+    Return the published accommodations inside a tile, aggregated into clusters.
+
+    Below CLUSTER_MAX_ZOOM rows are grouped with ST_SnapToGrid on a grid
+    laid over the tile, yielding one count and centroid per cell; at deeper
+    zoom levels every accommodation is returned individually. Tiles are
+    cached until an accommodation inside them changes (see signals.py).
+    :return: Dictionary ready to be serialized as JSON.
+    """
+    key = tile_cache_key(z, x, y)
+    tile = cache.get(key)
+    if tile is not None:
+        return tile
+
+    west, south, east, north = tile_bounds(z, x, y)
+    table = Accommodation._meta.db_table
+    params = {'west': west, 'south': south, 'east': east, 'north': north}
+    # The bounding box test uses the GiST index on center::geometry; a
+    # geography envelope would have great circle edges and miss rows at low
+    # zoom. The coordinate test assigns points on a shared edge to exactly one tile.
+    where = f"""
+        WHERE published
+          AND center::geometry && ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326)
+          AND ST_X(center::geometry) >= %(west)s AND ST_X(center::geometry) < %(east)s
+          AND ST_Y(center::geometry) >= %(south)s AND ST_Y(center::geometry) < %(north)s
+    """
+
+    if z < CLUSTER_MAX_ZOOM:
+        params['cell_width'] = (east - west) / GRID_SIZE
+        params['cell_height'] = (north - south) / GRID_SIZE
+        sql = f"""
+            SELECT COUNT(*), ST_X(ST_Centroid(ST_Collect(center::geometry))),
+                   ST_Y(ST_Centroid(ST_Collect(center::geometry))), MIN(id)
+            FROM {table}
+            {where}
+            GROUP BY ST_SnapToGrid(center::geometry, %(west)s, %(south)s,
+                                   %(cell_width)s, %(cell_height)s)
+        """
+    else:
+        sql = f"""
+            SELECT 1, ST_X(center::geometry), ST_Y(center::geometry), id
+            FROM {table}
+            {where}
+        """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        clusters = [
+            {
+                'count': count,
+                'longitude': lon,
+                'latitude': lat,
+                # Single-point clusters link straight to the accommodation
+                'id': accommodation_id if count == 1 else None,
+            }
+            for count, lon, lat, accommodation_id in cursor.fetchall()
+        ]
+
+    tile = {'z': z, 'x': x, 'y': y, 'clusters': clusters}
+    cache.set(key, tile, TILE_CACHE_TIMEOUT)
+    return tile
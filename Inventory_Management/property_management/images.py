@@ -0,0 +1,98 @@
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import AccommodationImage
+
+# Longest edge, in pixels, of every generated variant
+IMAGE_VARIANT_SIZES = {
+    'thumb': 320,
+    'medium': 800,
+    'large': 1600,
+}
+# Pillow format name and encoder options of each variant encoding
+IMAGE_VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_prefix(name):
+    """
+    Return the storage path every variant of the image stored as name starts with.
+    """
+    directory, filename = os.path.split(name)
+    return f'{directory}/variants/{os.path.splitext(filename)[0]}-'
+
+
+def delete_image_variants(name):
+    """
+    Delete every variant generated from the image stored as name.
+    """
+    prefix = variant_prefix(name)
+    directory, stem = os.path.split(prefix)
+    try:
+        filenames = default_storage.listdir(directory)[1]
+    except FileNotFoundError:
+        return
+    for filename in filenames:
+        if filename.startswith(stem):
+            default_storage.delete(f'{directory}/{filename}')
+
+
+def generate_image_variants(accommodation_image):
+    """
+    Render the resized variants of an uploaded image and store them next to it.
+
+    The original is rotated according to its EXIF orientation and every
+    variant is re-encoded without metadata, which strips EXIF (GPS position,
+    camera serials) from what guests download. Variant names derive from
+    the image name only, so images sharing a blob and requeued jobs reuse
+    the variants already stored instead of writing copies.
+    :return: Tuple of (variants as {name: {format: {url, width, height}}},
+             original width, original height).
+    """
+    with accommodation_image.image.open('rb') as f:
+        original = ImageOps.exif_transpose(Image.open(f))
+        original.load()
+    width, height = original.size
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    prefix = variant_prefix(accommodation_image.image.name)
+    variants = {}
+    for name, size in IMAGE_VARIANT_SIZES.items():
+        resized = original.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        variants[name] = {}
+        for extension, (fmt, options) in IMAGE_VARIANT_FORMATS.items():
+            path = f'{prefix}{name}.{extension}'
+            if not default_storage.exists(path):
+                # JPEG has no alpha channel
+                frame = resized.convert('RGB') if fmt == 'JPEG' else resized
+                buffer = io.BytesIO()
+                frame.save(buffer, fmt, **options)
+                saved = default_storage.save(path, ContentFile(buffer.getvalue()))
+                if saved != path:
+                    # Another worker stored the same variant meanwhile
+                    default_storage.delete(saved)
+            variants[name][extension] = {
+                'url': default_storage.url(path),
+                'width': resized.width,
+                'height': resized.height,
+            }
+    return variants, width, height
+
+
+def process_accommodation_image(image_id):
+    """
+    Generate the variants of one AccommodationImage and record them with a single UPDATE.
+    :return: Number of variant files recorded.
+    """
+    accommodation_image = AccommodationImage.objects.get(pk=image_id)
+    variants, width, height = generate_image_variants(accommodation_image)
+    AccommodationImage.objects.filter(pk=image_id).update(variants=variants, width=width, height=height)
+    return sum(len(encodings) for encodings in variants.values())
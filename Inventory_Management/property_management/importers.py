@@ -0,0 +1,284 @@
+import csv
+import io
+import json
+import re
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Location
+
+
+# Columns loaded into the staging table, in COPY order
+LOCATION_COLUMNS = (
+    'id', 'title', 'center', 'parent_id', 'location_type',
+    'country_code', 'state_abbr', 'city',
+)
+
+POINT_RE = re.compile(
+    r'^\s*(?:SRID=(\d+);)?\s*POINT\s*\(\s*([-+\d.eE]+)\s+([-+\d.eE]+)\s*\)\s*$',
+    re.IGNORECASE,
+)
+
+
+class ImportReport:
+    """
+    Outcome of a bulk import: counters plus the rows that were rejected.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.loaded = 0
+        self.upserted = 0
+        # (line number, location id, message) for every rejected row
+        self.errors = []
+
+    def reject(self, line, location_id, message):
+        self.errors.append((line, location_id, message))
+
+
+def _max_length(field_name):
+    return Location._meta.get_field(field_name).max_length
+
+
+def parse_point(row):
+    """
+    Return (longitude, latitude) for a row, read from a WKT/EWKT `center`
+    column or from latitude/longitude columns.
+    :raises ValueError: If no valid point can be read.
+    """
+    center = (row.get('center') or '').strip()
+    if center:
+        match = POINT_RE.match(center)
+        if not match:
+            raise ValueError(f'Invalid center "{center}"')
+        srid, lon, lat = match.groups()
+        if srid and srid != '4326':
+            raise ValueError(f'Unsupported SRID {srid}')
+        lon, lat = float(lon), float(lat)
+    else:
+        lat = row.get('latitude') or row.get('lat')
+        lon = row.get('longitude') or row.get('lon')
+        if lat in (None, '') or lon in (None, ''):
+            raise ValueError('Missing center or latitude/longitude')
+        lon, lat = float(lon), float(lat)
+
+    if not -180 <= lon <= 180 or not -90 <= lat <= 90:
+        raise ValueError(f'Coordinates out of range ({lon} {lat})')
+    return lon, lat
+
+
+def parse_center(row):
+    """
+    Return the EWKT for a row's point.
+    :raises ValueError: If no valid point can be read.
+    """
+    lon, lat = parse_point(row)
+    return f'SRID=4326;POINT({lon!r} {lat!r})'
+
+
+def clean_location_row(row):
+    """
+    Validate one CSV row and return it as a tuple in LOCATION_COLUMNS order.
+    :raises ValueError: Describing the first problem found.
+    """
+    values = {
+        name: str(row.get(name) or '').strip()
+        for name in ('id', 'title', 'location_type', 'country_code', 'state_abbr', 'city')
+    }
+    values['parent_id'] = str(row.get('parent') or row.get('parent_id') or '').strip()
+
+    for name in ('id', 'title', 'location_type', 'country_code'):
+        if not values[name]:
+            raise ValueError(f'Missing {name}')
+    for name in ('id', 'title', 'location_type', 'country_code', 'state_abbr', 'city', 'parent_id'):
+        limit = _max_length('id' if name == 'parent_id' else name)
+        if len(values[name]) > limit:
+            raise ValueError(f'{name} is longer than {limit} characters')
+    if values['parent_id'] == values['id']:
+        raise ValueError('Location cannot be its own parent')
+
+    values['center'] = parse_center(row)
+    return tuple(values[name] or None for name in LOCATION_COLUMNS)
+
+
+def copy_rows(cursor, table, rows, columns=LOCATION_COLUMNS):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    if hasattr(cursor, 'copy_expert'):
+        # psycopg2
+        cursor.copy_expert(sql, buffer)
+    else:
+        # psycopg 3
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def bulk_import_locations(fp, batch_size=5000, progress=None):
+    """
+    Import locations from a CSV file object using COPY and a single upsert.
+
+    Rows are validated and parsed in Python, copied in batches into a
+    temporary staging table and then merged into the Location table with
+    a single INSERT ... ON CONFLICT. Existing rows are only updated (and their
+    updated_at bumped) when a value actually changed.
+
+    Parent references are resolved against one in-memory set of ids holding
+    the existing locations plus every id accepted from the file, so parents may
+    appear after their children. Invalid rows are rejected and reported
+    instead of aborting the whole import.
+    :param fp: Text file object with a header row in the LocationResource format.
+    :param batch_size: Number of rows sent per COPY.
+    :param progress: Optional callable receiving the report after each batch.
+    :return: ImportReport.
+    """
+    report = ImportReport()
+    table = Location._meta.db_table
+    staging = 'location_import_staging'
+    columns = ', '.join(LOCATION_COLUMNS)
+    known_ids = set(Location.objects.values_list('id', flat=True))
+    # Every id seen in the file, and the subset that made it into staging
+    file_ids = set()
+    accepted_ids = set()
+    # Rows whose parent has not been accepted yet, resolved once the file is read
+    pending = []
+    batch = []
+
+    def accept(values):
+        batch.append(values)
+        accepted_ids.add(values[0])
+
+    with connection.cursor() as cursor:
+        # Same column types as the Location table, without its constraints.
+        # The staging table lives for the session rather than one transaction
+        # so progress written by callers between batches is visible to others.
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE {staging} AS
+            SELECT {columns} FROM {table} WITH NO DATA
+        """)
+
+        def flush():
+            if batch:
+                copy_rows(cursor, staging, batch)
+                report.loaded += len(batch)
+                batch.clear()
+            if progress:
+                progress(report)
+
+        # Line 1 is the header
+        for line, row in enumerate(csv.DictReader(fp), start=2):
+            report.rows += 1
+            try:
+                values = clean_location_row(row)
+            except ValueError as e:
+                report.reject(line, row.get('id'), str(e))
+                continue
+
+            location_id, parent_id = values[0], values[3]
+            if location_id in file_ids:
+                report.reject(line, location_id, 'Duplicate id in file')
+                continue
+            file_ids.add(location_id)
+
+            if parent_id and parent_id not in known_ids and parent_id not in accepted_ids:
+                pending.append((line, values))
+                continue
+
+            accept(values)
+            if len(batch) >= batch_size:
+                flush()
+
+        # Keep sweeping while rows get resolved, so chains of forward
+        # references are accepted and rows hanging off rejected ones are not
+        resolved = True
+        while pending and resolved:
+            resolved = False
+            unresolved = []
+            for line, values in pending:
+                if values[3] in known_ids or values[3] in accepted_ids:
+                    accept(values)
+                    resolved = True
+                else:
+                    unresolved.append((line, values))
+            pending = unresolved
+        for line, values in pending:
+            report.reject(line, values[0], f'Unknown parent "{values[3]}"')
+        flush()
+
+        updates = ', '.join(
+            f'{name} = EXCLUDED.{name}' for name in LOCATION_COLUMNS[1:]
+        )
+        changed = ' OR '.join(
+            f'{table}.{name} IS DISTINCT FROM EXCLUDED.{name}'
+            for name in LOCATION_COLUMNS[1:] if name != 'center'
+        )
+        now = timezone.now()
+        # Re-parented rows leave their old subtree: bump the old parents so
+        # the incremental sitemap re-renders the shard they are leaving
+        cursor.execute(f"""
+            UPDATE {table} old_parent SET updated_at = %s
+            FROM {table} existing
+            JOIN {staging} staged ON staged.id = existing.id
+            WHERE old_parent.id = existing.parent_id
+              AND existing.parent_id IS DISTINCT FROM staged.parent_id
+        """, [now])
+        cursor.execute(f"""
+            INSERT INTO {table} ({columns}, created_at, updated_at)
+            SELECT {columns}, %s, %s FROM {staging}
+            ON CONFLICT (id) DO UPDATE SET {updates}, updated_at = EXCLUDED.updated_at
+            WHERE {changed}
+               OR ST_AsBinary({table}.center) IS DISTINCT FROM ST_AsBinary(EXCLUDED.center)
+        """, [now, now])
+        report.upserted = cursor.rowcount
+
+        # Refresh materialized paths below the top-most imported rows
+        cursor.execute(f"""
+            SELECT id FROM {staging} staged
+            WHERE NOT EXISTS (SELECT 1 FROM {staging} parent WHERE parent.id = staged.parent_id)
+        """)
+        Location.rebuild_paths(root_ids=[row[0] for row in cursor.fetchall()])
+        cursor.execute(f"DROP TABLE {staging}")
+
+    return report
+
+
+def read_csv_rows(fp):
+    yield from csv.DictReader(fp)
+
+
+def read_json_rows(fp):
+    """
+    Read a JSON list of location objects. `center` may be WKT, a
+    [longitude, latitude] pair or an object with longitude/latitude keys.
+    """
+    for record in json.load(fp):
+        center = record.get('center')
+        if isinstance(center, (list, tuple)):
+            record = {**record, 'center': None, 'longitude': center[0], 'latitude': center[1]}
+        elif isinstance(center, dict):
+            record = {**record, 'center': None, **center}
+        yield record
+
+
+def read_geojson_rows(fp):
+    """
+    Read a GeoJSON FeatureCollection of Point features whose properties
+    hold the location fields.
+    """
+    for feature in json.load(fp).get('features', []):
+        row = dict(feature.get('properties') or {})
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'Point':
+            row['longitude'], row['latitude'] = geometry['coordinates'][:2]
+        yield row
+
+
+# Maps a source format to the reader turning a text file object into row dicts
+LOCATION_SOURCE_READERS = {
+    'csv': read_csv_rows,
+    'json': read_json_rows,
+    'geojson': read_geojson_rows,
+}
@@ -0,0 +1,209 @@
+import csv
+import io
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .importers import bulk_import_locations
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_job(kind, user=None, upload=None, **options):
+    """
+    Queue a job for the run_workers command and return it.
+    :param upload: Optional uploaded file stored as the job's input.
+    """
+    job = Job(kind=kind, created_by=user, options=options)
+    if upload is not None:
+        job.input_file.save(upload.name, upload, save=False)
+    job.save()
+    return job
+
+
+def claim_next_job():
+    """
+    Atomically take the oldest queued job and mark it running.
+
+    SKIP LOCKED lets any number of workers poll the queue at once without
+    blocking each other or claiming the same job twice.
+    :return: The claimed job, or None if the queue is empty.
+    """
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.STATUS_QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.STATUS_RUNNING
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'attempts'])
+    return job
+
+
+def reap_stale_jobs():
+    """
+    Take back running jobs whose worker stopped sending heartbeats, e.g.
+    because it was killed. They are queued again until they have been
+    attempted JOB_MAX_ATTEMPTS times, then marked failed.
+    :return: Tuple of (requeued, failed) job counts.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.STATUS_RUNNING,
+        heartbeat_at__lt=now - timedelta(seconds=settings.JOB_STALE_AFTER),
+    )
+    requeued = stale.filter(attempts__lt=settings.JOB_MAX_ATTEMPTS).update(
+        status=Job.STATUS_QUEUED, started_at=None, heartbeat_at=None, processed=0,
+        message='Requeued after its worker stopped responding.')
+    failed = stale.update(
+        status=Job.STATUS_FAILED, finished_at=now,
+        message='Failed: its worker stopped responding on the last attempt.')
+    if requeued or failed:
+        logger.warning('Reaped stale jobs: %s requeued, %s failed', requeued, failed)
+    return requeued, failed
+
+
+class JobHeartbeat(threading.Thread):
+    """
+    Touch a running job's heartbeat_at every JOB_HEARTBEAT_INTERVAL seconds
+    until stopped, so long handlers that report no progress are not reaped.
+    The thread uses (and closes) its own database connection.
+    """
+
+    def __init__(self, job):
+        super().__init__(name=f'job-{job.pk}-heartbeat', daemon=True)
+        self.job_id = job.pk
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOB_HEARTBEAT_INTERVAL):
+                try:
+                    Job.objects.filter(pk=self.job_id, status=Job.STATUS_RUNNING).update(
+                        heartbeat_at=timezone.now())
+                except DatabaseError:
+                    logger.exception('Heartbeat of job %s failed', self.job_id)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def set_progress(job, processed):
+    job.processed = processed
+    Job.objects.filter(pk=job.pk).update(processed=processed)
+
+
+def run_location_import(job):
+    fmt = job.options.get('format', 'csv')
+    if fmt == 'csv':
+        with job.input_file.open('rb') as f:
+            upload = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+            report = bulk_import_locations(
+                upload, progress=lambda report: set_progress(job, report.rows))
+
+        if report.errors:
+            errors = io.StringIO()
+            writer = csv.writer(errors)
+            writer.writerow(['line', 'id', 'error'])
+            writer.writerows(report.errors)
+            job.result_file.save(
+                f'location-import-{job.pk}-errors.csv', ContentFile(errors.getvalue()), save=False)
+        set_progress(job, report.rows)
+        return (
+            f'Imported {report.loaded} of {report.rows} rows '
+            f'({report.upserted} inserted or changed, {len(report.errors)} rejected).'
+        )
+
+    # Spreadsheets go through the regular django-import-export resource
+    from tablib import Dataset
+    from .resources import LocationResource
+
+    with job.input_file.open('rb') as f:
+        dataset = Dataset().load(f.read(), format=fmt)
+    result = LocationResource().import_data(dataset, dry_run=False, raise_errors=False)
+    set_progress(job, len(dataset))
+    return f'Imported {len(dataset)} rows: {dict(result.totals)}'
+
+
+def run_location_export(job):
+    from .resources import LocationResource
+
+    fmt = job.options.get('format', 'csv')
+    dataset = LocationResource().export()
+    content = dataset.export(fmt)
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    job.result_file.save(f'locations-{job.pk}.{fmt}', ContentFile(content), save=False)
+    set_progress(job, len(dataset))
+    return f'Exported {len(dataset)} rows.'
+
+
+def run_image_variants(job):
+    from .images import process_accommodation_image
+
+    written = 0
+    for image_id in job.options['image_ids']:
+        written += process_accommodation_image(image_id)
+        set_progress(job, written)
+    return f'Generated {written} image variants.'
+
+
+# Maps Job.kind to the callable executing it. A handler returns the
+# summary message stored on the job and raises on failure.
+JOB_HANDLERS = {
+    Job.KIND_LOCATION_IMPORT: run_location_import,
+    Job.KIND_LOCATION_EXPORT: run_location_export,
+    Job.KIND_IMAGE_VARIANTS: run_image_variants,
+}
+
+
+def run_job(job):
+    heartbeat = JobHeartbeat(job)
+    heartbeat.start()
+    try:
+        job.message = JOB_HANDLERS[job.kind](job)
+        job.status = Job.STATUS_DONE
+    except Exception as e:
+        logger.exception('Job %s failed', job.pk)
+        job.message = str(e)
+        job.status = Job.STATUS_FAILED
+    finally:
+        heartbeat.stop()
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'message', 'result_file', 'processed', 'finished_at'])
+
+
+def work(poll_interval=2.0, once=False):
+    """
+    Worker loop: claim and run jobs until stopped.
+    :param poll_interval: Seconds to sleep when the queue is empty.
+    :param once: If True, return as soon as the queue is empty.
+    """
+    last_reaped = None
+    while True:
+        if last_reaped is None or time.monotonic() - last_reaped >= settings.JOB_HEARTBEAT_INTERVAL:
+            reap_stale_jobs()
+            last_reaped = time.monotonic()
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        logger.info('Running job %s', job.pk)
+        run_job(job)
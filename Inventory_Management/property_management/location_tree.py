@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from django.conf import settings
+
+from .models import CacheVersion, Location
+
+LOCATION_TREE_VERSION = 'location'
+
+LocationNode = namedtuple(
+    'LocationNode', 'id title location_type country_code state_abbr city parent_id path')
+
+
+class LocationTree:
+    """
+    Immutable in-memory index of every Location.
+
+    Built from one query and replaced as a whole when the locations change,
+    so lookups never touch the database and need no locking.
+    """
+
+    def __init__(self, version, nodes):
+        self.version = version
+        self.nodes = MappingProxyType({node.id: node for node in nodes})
+        children = {}
+        places = {}
+        for node in sorted(nodes, key=lambda node: node.title):
+            children.setdefault(node.parent_id, []).append(node.id)
+            places.setdefault(self.place_key(node.country_code, node.state_abbr, node.city), node.id)
+        self.children = MappingProxyType({key: tuple(ids) for key, ids in children.items()})
+        self.places = MappingProxyType(places)
+
+    @staticmethod
+    def place_key(country_code, state_abbr=None, city=None):
+        return ((country_code or '').upper(), (state_abbr or '').upper(), (city or '').lower())
+
+    def get(self, location_id):
+        return self.nodes.get(location_id)
+
+    def roots(self):
+        return [self.nodes[node_id] for node_id in self.children.get(None, ())]
+
+    def children_of(self, location_id):
+        return [self.nodes[node_id] for node_id in self.children.get(location_id, ())]
+
+    def ancestors(self, location_id, include_self=False):
+        """
+        The nodes above a location, root first.
+        """
+        node = self.nodes.get(location_id)
+        if node is None:
+            return []
+        ids = node.path.split('/')[:-1] if node.path else [node.id]
+        if not include_self:
+            ids = ids[:-1]
+        return [self.nodes[node_id] for node_id in ids if node_id in self.nodes]
+
+    def descendant_ids(self, location_id, include_self=True):
+        ids = [location_id] if include_self else []
+        stack = list(self.children.get(location_id, ()))
+        while stack:
+            node_id = stack.pop()
+            ids.append(node_id)
+            stack.extend(self.children.get(node_id, ()))
+        return ids
+
+    def breadcrumbs(self, location_id):
+        return [
+            {'id': node.id, 'title': node.title, 'location_type': node.location_type}
+            for node in self.ancestors(location_id, include_self=True)
+        ]
+
+    def lookup(self, country_code, state_abbr=None, city=None):
+        """
+        Find a country, state or city by its codes, e.g. ("US", "CA", "San Francisco").
+        """
+        node_id = self.places.get(self.place_key(country_code, state_abbr, city))
+        return self.nodes.get(node_id)
+
+
+_lock = threading.Lock()
+_tree = None
+_checked_at = float('-inf')
+
+
+def current_version():
+    return (
+        CacheVersion.objects.filter(name=LOCATION_TREE_VERSION).values_list('version', flat=True).first()
+        or 0
+    )
+
+
+def load_location_tree():
+    version = current_version()
+    rows = Location.objects.values_list(*LocationNode._fields)
+    return LocationTree(version, [LocationNode(*row) for row in rows])
+
+
+def get_location_tree():
+    """
+    Return this process's location tree, rebuilding it when stale.
+
+    A database trigger bumps the "location" CacheVersion on every write to the
+    Location table. The version (a primary key lookup) is compared at most once
+    per LOCATION_TREE_CHECK_INTERVAL seconds and the tree reloaded only when
+    it moved, so hierarchy lookups never query the Location table itself.
+    """
+    global _tree, _checked_at
+    now = time.monotonic()
+    tree = _tree
+    if tree is not None and now - _checked_at < settings.LOCATION_TREE_CHECK_INTERVAL:
+        return tree
+    with _lock:
+        if _tree is None or current_version() != _tree.version:
+            _tree = load_location_tree()
+        _checked_at = now
+        return _tree
+
+
+def expire_location_tree():
+    """
+    Drop this process's tree so the next get_location_tree() call reloads it.
+    Used after writes in this process, which should be visible right away.
+    """
+    global _tree
+    with _lock:
+        _tree = None
@@ -0,0 +1,47 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.views.static import serve
+from property_management.media import serve_media
+
+
+class Command(BaseCommand):
+    help = 'Compare media serving throughput of serve_media against the django.views.static route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to request, relative to MEDIA_ROOT')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(os.path.join(settings.MEDIA_ROOT, path)):
+            raise CommandError(f'{path} does not exist below MEDIA_ROOT')
+
+        url = settings.MEDIA_URL + path
+        factory = RequestFactory()
+        etag = serve_media(factory.get(url), path)['ETag']
+
+        # Requests are answered in-process, so this measures the Python side of
+        # serving only; sendfile() and X-Accel-Redirect save more behind a real server.
+        scenarios = [
+            ('static()', lambda: serve(factory.get(url), path, document_root=settings.MEDIA_ROOT)),
+            ('serve_media', lambda: serve_media(factory.get(url), path)),
+            ('serve_media 64 KB range', lambda: serve_media(factory.get(url, HTTP_RANGE='bytes=0-65535'), path)),
+            ('serve_media 304', lambda: serve_media(factory.get(url, HTTP_IF_NONE_MATCH=etag), path)),
+        ]
+        for label, request in scenarios:
+            self.run_scenario(label, request, options['requests'])
+
+    def run_scenario(self, label, request, count):
+        sent = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            response = request()
+            sent += sum(len(chunk) for chunk in response)
+            response.close()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:<24} {count / elapsed:8.0f} req/s {sent / elapsed / 1024 / 1024:8.1f} MB/s"
+        )
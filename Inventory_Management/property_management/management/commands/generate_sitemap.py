@@ -1,46 +1,40 @@
-import json
+import resource
+import time
 from django.core.management.base import BaseCommand
-from property_management.models import Location
+from property_management.sitemap import update_sitemap_shards, write_sitemap
 
 class Command(BaseCommand):
     help = "Generate a sitemap.json file for all country locations, including states and cities."
 
-    def handle(self, *args, **kwargs):
-        sitemap = []
-
-        # Fetch all country-level locations
-        countries = Location.objects.filter(location_type="country").order_by("title")
-
-        for country in countries:
-            country_entry = {
-                country.title: country.country_code.lower(),
-                "states": []
-            }
-
-            # Fetch state-level locations under the country
-            states = Location.objects.filter(parent=country).order_by("title")
-
-            for state in states:
-                state_entry = {
-                    state.title: f"{country.country_code.lower()}/{state.title.lower().replace(' ', '-')}",
-                    "cities": []
-                }
-
-                # Fetch city-level locations under the state
-                cities = Location.objects.filter(parent=state).order_by("title")
-
-                for city in cities:
-                    city_entry = {
-                        city.title: f"{country.country_code.lower()}/{state.title.lower().replace(' ', '-')}/{city.title.lower().replace(' ', '-')}"
-                    }
-                    state_entry["cities"].append(city_entry)
-
-                country_entry["states"].append(state_entry)
-
-            sitemap.append(country_entry)
-
-        # Write to sitemap.json
-        with open("sitemap.json", "w") as f:
-            json.dump(sitemap, f, indent=2)
-
-        self.stdout.write(self.style.SUCCESS("sitemap.json generated successfully!"))
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='sitemap.json', help='Path of the sitemap file to write')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only re-render countries whose locations changed since the last incremental run')
+        parser.add_argument(
+            '--shard-dir', default='sitemap_shards',
+            help='Directory holding the per-country shards and index used by --incremental')
+        parser.add_argument(
+            '--full', action='store_true', help='With --incremental, re-render every country shard')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        started = time.perf_counter()
+
+        if options['incremental']:
+            countries, rows = update_sitemap_shards(options['shard_dir'], output, full=options['full'])
+            self.stdout.write(f"Re-rendered {countries} country shard(s).")
+        else:
+            # Entries are streamed straight from the database cursor into the file
+            with open(output, "w") as f:
+                rows = write_sitemap(f)
+
+        elapsed = time.perf_counter() - started
+        # ru_maxrss is reported in kilobytes on Linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        self.stdout.write(self.style.SUCCESS(f"{output} generated successfully!"))
+        self.stdout.write(
+            f"{rows} entries in {elapsed:.2f}s "
+            f"({rows / elapsed if elapsed else 0:.0f} rows/s), peak memory {peak_mb:.1f} MB"
+        )
@@ -0,0 +1,34 @@
+import csv
+from django.core.management.base import BaseCommand
+from property_management.importers import bulk_import_locations
+
+
+class Command(BaseCommand):
+    help = 'Bulk import locations from a CSV file using PostgreSQL COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path of the CSV file to import')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows sent per COPY')
+        parser.add_argument('--errors', help='Write every rejected row to this CSV file')
+
+    def handle(self, *args, **options):
+        def progress(report):
+            self.stdout.write(f'Read {report.rows} rows, staged {report.loaded}, rejected {len(report.errors)}')
+
+        with open(options['csv_file'], newline='', encoding='utf-8-sig') as f:
+            report = bulk_import_locations(f, batch_size=options['batch_size'], progress=progress)
+
+        for line, location_id, message in report.errors[:20]:
+            self.stdout.write(self.style.ERROR(f'Line {line} ({location_id}): {message}'))
+        if len(report.errors) > 20:
+            self.stdout.write(self.style.ERROR(f'... and {len(report.errors) - 20} more rejected rows'))
+
+        if options['errors'] and report.errors:
+            with open(options['errors'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['line', 'id', 'error'])
+                writer.writerows(report.errors)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report.loaded} of {report.rows} rows '
+            f'({report.upserted} inserted or changed, {len(report.errors)} rejected).'))
@@ -0,0 +1,63 @@
+import csv
+import os
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from property_management.feeds import FEED_READERS, ingest_accommodation_feed
+
+
+class Command(BaseCommand):
+    help = 'Load a partner feed file (NDJSON or CSV) into its Accommodation partition'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the feed file')
+        parser.add_argument('--feed', type=int, required=True, help='Feed the file belongs to')
+        parser.add_argument('--owner', required=True, help='Username owning new accommodations')
+        parser.add_argument(
+            '--format', choices=sorted(FEED_READERS),
+            help='File format (defaults to the file extension, NDJSON unless .csv)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of records sent per COPY')
+        parser.add_argument(
+            '--keep-missing', action='store_true', help='Do not unpublish accommodations missing from the file')
+        parser.add_argument('--errors', help='Write every rejected record to this CSV file')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user \"{options['owner']}\"")
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+
+        def progress(report):
+            if self.verbosity > 1:
+                self.stdout.write(
+                    f'Read {report.rows} records, staged {report.loaded}, rejected {len(report.errors)} '
+                    f'({report.rows_per_second:.0f} rows/s)')
+
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                report = ingest_accommodation_feed(
+                    f, options['feed'], owner, format=file_format, batch_size=options['batch_size'],
+                    unpublish_missing=not options['keep_missing'], progress=progress)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for line, accommodation_id, message in report.errors[:20]:
+            self.stdout.write(self.style.ERROR(f'Line {line} ({accommodation_id}): {message}'))
+        if len(report.errors) > 20:
+            self.stdout.write(self.style.ERROR(f'... and {len(report.errors) - 20} more rejected records'))
+
+        if options['errors'] and report.errors:
+            with open(options['errors'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['line', 'id', 'error'])
+                writer.writerows(report.errors)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Feed {report.feed} ({report.partition}): {report.loaded} of {report.rows} records loaded, '
+            f'{report.inserted} inserted, {report.updated} updated, {report.unchanged} unchanged, '
+            f'{report.unpublished} unpublished, {len(report.errors)} rejected '
+            f'in {report.elapsed:.1f}s ({report.rows_per_second:.0f} rows/s).'))
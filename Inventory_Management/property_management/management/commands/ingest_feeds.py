@@ -0,0 +1,68 @@
+import csv
+import os
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from property_management.feeds import discover_feed_files, ingest_feed_files
+
+
+class Command(BaseCommand):
+    help = 'Ingest every feed file of a directory in parallel, one worker process per feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory holding feed files named after their feed (feed_42.ndjson)')
+        parser.add_argument('--owner', required=True, help='Username owning new accommodations')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+        parser.add_argument(
+            '--per-partition', type=int, default=1, help='Maximum concurrent ingests writing to one partition')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of records sent per COPY')
+        parser.add_argument(
+            '--keep-missing', action='store_true', help='Do not unpublish accommodations missing from the files')
+        parser.add_argument('--errors', help='Write every rejected record to this CSV file')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user \"{options['owner']}\"")
+        if options['workers'] < 1 or options['per_partition'] < 1:
+            raise CommandError('--workers and --per-partition must be at least 1')
+        try:
+            feed_files = discover_feed_files(options['directory'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        if not feed_files:
+            self.stdout.write('No feed files found.')
+            return
+
+        def progress(feed_file, report, error):
+            if error:
+                self.stdout.write(self.style.ERROR(f'Feed {feed_file.feed} failed: {error}'))
+            else:
+                self.stdout.write(
+                    f'Feed {report.feed} ({report.partition}): {report.rows} records, {report.inserted} inserted, '
+                    f'{report.updated} updated, {report.unpublished} unpublished, {len(report.errors)} rejected '
+                    f'in {report.elapsed:.1f}s')
+
+        run = ingest_feed_files(
+            feed_files, owner, workers=options['workers'], per_partition=options['per_partition'],
+            batch_size=options['batch_size'], unpublish_missing=not options['keep_missing'], progress=progress)
+
+        if options['errors'] and run.rejected:
+            with open(options['errors'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['feed', 'line', 'id', 'error'])
+                for report in run.reports:
+                    writer.writerows((report.feed, *error) for error in report.errors)
+
+        speedup = run.serial_seconds / run.elapsed if run.elapsed else 0.0
+        summary = (
+            f'{len(run.reports)} of {len(feed_files)} feeds ingested: {run.total("rows")} records, '
+            f'{run.total("inserted")} inserted, {run.total("updated")} updated, '
+            f'{run.total("unpublished")} unpublished, {run.rejected} rejected '
+            f'in {run.elapsed:.1f}s ({run.rows_per_second:.0f} rows/s, {speedup:.1f}x faster than one at a time).'
+        )
+        if run.failures:
+            self.stdout.write(self.style.WARNING(summary))
+            raise CommandError(f'{len(run.failures)} feed file(s) failed')
+        self.stdout.write(self.style.SUCCESS(summary))
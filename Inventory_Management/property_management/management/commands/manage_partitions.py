@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from property_management.models import Accommodation
+
+
+class Command(BaseCommand):
+    help = 'List, split and rebalance the feed partitions of the Accommodation table'
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+
+        listing = subcommands.add_parser('list', help='Show partitions with their row counts and sizes')
+        listing.add_argument('--exact', action='store_true', help='Count rows instead of using estimates')
+
+        split = subcommands.add_parser('split', help='Split one partition at the given feed values')
+        split.add_argument('partition', help='Name of the partition to split')
+        split.add_argument(
+            '--at', type=int, action='append', required=True, dest='points',
+            help='Feed starting a new partition (repeatable)')
+        split.add_argument('--batch-size', type=int, default=10000, help='Rows copied per transaction')
+
+        rebalance = subcommands.add_parser(
+            'rebalance', help='Split partitions holding more rows than --max-rows')
+        rebalance.add_argument('--max-rows', type=int, required=True, help='Target maximum rows per partition')
+        rebalance.add_argument('--batch-size', type=int, default=10000, help='Rows copied per transaction')
+        rebalance.add_argument('--dry-run', action='store_true', help='Only print the planned splits')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        try:
+            getattr(self, f"handle_{options['action']}")(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def handle_list(self, options):
+        for partition in Accommodation.partitions.list(exact=options['exact']):
+            lower = 'MINVALUE' if partition.lower is None else partition.lower
+            upper = 'MAXVALUE' if partition.upper is None else partition.upper
+            self.stdout.write(
+                f"{partition.name:<40} feed [{lower}, {upper})  "
+                f"{partition.rows:>12} rows  {partition.size_bytes / 1024 / 1024:>10.1f} MB"
+            )
+
+    def handle_split(self, options):
+        created = Accommodation.partitions.split(
+            options['partition'], options['points'], batch_size=options['batch_size'], progress=self.progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Split {options['partition']} into {', '.join(p.name for p in created)}."))
+
+    def handle_rebalance(self, options):
+        partitions = Accommodation.partitions
+        plan = partitions.plan_rebalance(options['max_rows'])
+        if not plan:
+            self.stdout.write('Every partition is within the limit.')
+            return
+        for name, points in plan.items():
+            self.stdout.write(f"{name}: split at {', '.join(map(str, points))}")
+        if options['dry_run']:
+            return
+        for name, points in plan.items():
+            partitions.split(name, points, batch_size=options['batch_size'], progress=self.progress)
+        self.stdout.write(self.style.SUCCESS(f'Split {len(plan)} partition(s).'))
+
+    def progress(self, copied):
+        if self.verbosity > 1:
+            self.stdout.write(f'{copied} rows copied')
@@ -1,5 +1,9 @@
-from django.core.management.base import BaseCommand
-from django.contrib.gis.geos import Point
+import os
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.gis.geos import GEOSGeometry, Point
+from django.db import transaction
+from property_management.importers import LOCATION_COLUMNS, LOCATION_SOURCE_READERS, clean_location_row
 from property_management.models import Location
 
 
@@ -8,39 +12,77 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--dry-run', action='store_true', help='Run the command without making changes')
+        parser.add_argument(
+            '--source', help='JSON, CSV or GeoJSON file to load instead of the built-in locations')
+        parser.add_argument(
+            '--format', choices=sorted(LOCATION_SOURCE_READERS),
+            help='Format of --source (defaults to the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows per INSERT')
 
-    def create_location(self, data, parent=None, dry_run=False):
+    def read_source(self, path, fmt=None):
         """
-        Helper function to create a location object.
-        :param data: Dictionary containing location data.
-        :param parent: Parent location object.
-        :param dry_run: If True, no database operations are performed.
-        :return: Boolean indicating if the location was created.
+        Read and validate the locations in a source file.
+        :param path: Path of the source file.
+        :param fmt: One of LOCATION_SOURCE_READERS; guessed from the extension if omitted.
+        :return: List of location dictionaries.
         """
-        if Location.objects.filter(id=data["id"]).exists():
-            self.stdout.write(self.style.WARNING(f'{data["title"]} already exists.'))
-            return False
-
-        if dry_run:
-            self.stdout.write(self.style.NOTICE(f'[Dry Run] Would create: {data}'))
-            return False
-
-        Location.objects.create(
-            id=data["id"],
-            title=data["title"],
-            center=data["center"],
-            country_code=data["country_code"],
-            location_type=data["location_type"],
-            state_abbr=data["state_abbr"],
-            city=data["city"],
-            parent=parent
-        )
-        return True
+        fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in LOCATION_SOURCE_READERS:
+            raise CommandError(f'Unsupported source format "{fmt}"')
+
+        locations = []
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for number, row in enumerate(LOCATION_SOURCE_READERS[fmt](f), start=1):
+                try:
+                    values = dict(zip(LOCATION_COLUMNS, clean_location_row(row)))
+                except ValueError as e:
+                    self.stdout.write(self.style.ERROR(f'Skipping record {number} ({row.get("id")}): {e}'))
+                    continue
+                values['center'] = GEOSGeometry(values['center'])
+                locations.append(values)
+        return locations
+
+    def order_by_depth(self, locations, existing_ids):
+        """
+        Drop unknown-parent rows and return the rest grouped by depth, so
+        parents are always inserted before their children.
+        :param locations: Dictionary of location id to location data.
+        :param existing_ids: Ids already stored in the database.
+        :return: List of lists of location data, shallowest first.
+        """
+        depths = {}
+
+        def depth_of(location_id, seen=()):
+            if location_id in depths:
+                return depths[location_id]
+            parent_id = locations[location_id]['parent_id']
+            if not parent_id or parent_id in existing_ids:
+                depth = 0
+            elif parent_id not in locations or parent_id in seen:
+                depth = None
+            else:
+                parent_depth = depth_of(parent_id, seen + (location_id,))
+                depth = None if parent_depth is None else parent_depth + 1
+            depths[location_id] = depth
+            return depth
+
+        levels = []
+        for location_id, data in locations.items():
+            depth = depth_of(location_id)
+            if depth is None:
+                self.stdout.write(self.style.ERROR(
+                    f'Parent location with ID {data["parent_id"]} not found for: {data["title"]}'))
+                continue
+            while len(levels) <= depth:
+                levels.append([])
+            levels[depth].append(data)
+        return levels
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
+        verbose = options['verbosity'] > 1
 
-        # Define some countries, states, and cities with their coordinates
+        # Built-in countries, states, and cities used when no --source is given
         countries = [
             {"id": "US", "title": "United States", "center": Point(-98.5795, 39.8283),
              "country_code": "US", "location_type": "country", "state_abbr": "", "city": ""},
@@ -70,25 +112,60 @@ class Command(BaseCommand):
              "country_code": "BD", "location_type": "city", "state_abbr": "DHA", "city": "Mirpur", "parent": "BD-DHA"},
         ]
 
-        # Insert countries
-        for country in countries:
-            if self.create_location(country, dry_run=dry_run):
-                self.stdout.write(self.style.SUCCESS(f'Successfully added country: {country["title"]}'))
-
-        # Insert states
-        for state in states:
-            try:
-                parent_location = Location.objects.get(id=state["parent"])
-                if self.create_location(state, parent=parent_location, dry_run=dry_run):
-                    self.stdout.write(self.style.SUCCESS(f'Successfully added state: {state["title"]}'))
-            except Location.DoesNotExist:
-                self.stdout.write(self.style.ERROR(f'Parent location with ID {state["parent"]} not found for state: {state["title"]}'))
-
-        # Insert cities
-        for city in cities:
-            try:
-                parent_location = Location.objects.get(id=city["parent"])
-                if self.create_location(city, parent=parent_location, dry_run=dry_run):
-                    self.stdout.write(self.style.SUCCESS(f'Successfully added city: {city["title"]}'))
-            except Location.DoesNotExist:
-                self.stdout.write(self.style.ERROR(f'Parent location with ID {city["parent"]} not found for city: {city["title"]}'))
+        if options['source']:
+            records = self.read_source(options['source'], options['format'])
+        else:
+            records = [
+                {**data, 'parent_id': data.get('parent')}
+                for data in countries + states + cities
+            ]
+
+        # One query for every id already stored; those rows are left untouched
+        existing_ids = set(Location.objects.values_list('id', flat=True))
+        locations = {}
+        for data in records:
+            if data['id'] in existing_ids:
+                if verbose:
+                    self.stdout.write(self.style.WARNING(f'{data["title"]} already exists.'))
+                continue
+            locations[data['id']] = data
+
+        created = Counter()
+        levels = self.order_by_depth(locations, existing_ids)
+        with transaction.atomic():
+            for level in levels:
+                if dry_run:
+                    if verbose:
+                        for data in level:
+                            self.stdout.write(self.style.NOTICE(f'[Dry Run] Would create: {data}'))
+                    created.update(data['location_type'] for data in level)
+                    continue
+
+                Location.objects.bulk_create(
+                    [
+                        Location(
+                            id=data['id'],
+                            title=data['title'],
+                            center=data['center'],
+                            country_code=data['country_code'],
+                            location_type=data['location_type'],
+                            state_abbr=data['state_abbr'],
+                            city=data['city'],
+                            parent_id=data['parent_id'],
+                        )
+                        for data in level
+                    ],
+                    batch_size=options['batch_size'],
+                    ignore_conflicts=True,
+                )
+                created.update(data['location_type'] for data in level)
+
+            if levels and not dry_run:
+                # bulk_create skips save(), so fill in the materialized paths
+                Location.rebuild_paths(root_ids=[data['id'] for data in levels[0]])
+
+        prefix = '[Dry Run] Would add' if dry_run else 'Successfully added'
+        for location_type, count in sorted(created.items()):
+            self.stdout.write(self.style.SUCCESS(f'{prefix} {count} location(s) of type: {location_type}'))
+        if not created:
+            self.stdout.write('No new locations to add.')
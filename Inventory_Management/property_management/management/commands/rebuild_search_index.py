@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from property_management.fulltext import rebuild_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search vectors of all localized accommodation descriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Number of ids updated per statement')
+
+    def handle(self, *args, **options):
+        updated = rebuild_search_vectors(
+            batch_size=options['batch_size'],
+            progress=lambda count: self.stdout.write(f'Indexed {count} localizations'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search vectors for {updated} localizations.'))
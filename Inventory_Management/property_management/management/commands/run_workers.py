@@ -0,0 +1,39 @@
+import multiprocessing
+from django.core.management.base import BaseCommand
+from django.db import connections
+from property_management.jobs import work
+
+
+class Command(BaseCommand):
+    help = 'Run background workers that process queued import and export jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Number of worker processes')
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        kwargs = {'poll_interval': options['poll_interval'], 'once': options['once']}
+        self.stdout.write(f'Starting {processes} worker process(es)')
+
+        if processes == 1:
+            work(**kwargs)
+            return
+
+        # Forked children inherit the configured Django setup; each one opens
+        # its own database connection, so none may be left open to share.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=work, kwargs=kwargs) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+
+        self.stdout.write(self.style.SUCCESS('Workers stopped.'))
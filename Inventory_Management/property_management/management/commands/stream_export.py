@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from property_management.exports import EXPORT_CONTENT_TYPES, EXPORTS, StreamingExport
+
+
+class Command(BaseCommand):
+    help = 'Export accommodations or locations as CSV or NDJSON in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(EXPORTS), help='What to export')
+        parser.add_argument('--format', choices=sorted(EXPORT_CONTENT_TYPES), default='csv', help='Output format')
+        parser.add_argument('-o', '--output', help='File to write (defaults to standard output)')
+        parser.add_argument('--feed', type=int, help='Only this feed (accommodations)')
+        parser.add_argument('--country', help='Only this country code')
+        published = parser.add_mutually_exclusive_group()
+        published.add_argument(
+            '--published', action='store_const', const=True, help='Only published accommodations')
+        published.add_argument(
+            '--unpublished', action='store_const', const=False, dest='published',
+            help='Only unpublished accommodations')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per round trip')
+
+    def handle(self, *args, **options):
+        filters = {
+            'feed': options['feed'],
+            'country': options['country'].upper() if options['country'] else None,
+            'published': options['published'],
+        }
+        try:
+            export = StreamingExport(
+                options['export'], options['format'], chunk_size=options['chunk_size'],
+                **{name: value for name, value in filters.items() if value is not None})
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                f.writelines(export)
+            self.stdout.write(self.style.SUCCESS(
+                f'Exported {export.rows} {options["export"]} to {options["output"]} '
+                f'in {time.monotonic() - started:.1f}s.'))
+        else:
+            for chunk in export:
+                self.stdout.write(chunk, ending='')
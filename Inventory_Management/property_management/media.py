@@ -0,0 +1,152 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_http_methods
+
+from .storage import BLOB_PREFIX, is_blob_name
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Blob names change with their content, so clients may cache them forever
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+STREAM_CHUNK_SIZE = 64 * 1024
+# Only images (blobs with their variants, and uploads stored before blobs
+# existed) are public; everything else below MEDIA_ROOT, such as job input
+# and result files, is only handed out through permission-checked views
+PUBLIC_MEDIA_PREFIXES = (BLOB_PREFIX, 'accommodations/')
+
+
+def media_etag(st):
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range Range header.
+    :return: (start, end) with end inclusive, None to serve the whole file
+        (missing, malformed or multi-range headers), or False when the range
+        cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end or start >= size:
+            return False
+    else:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            return False
+        start, end = max(size - length, 0), size - 1
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    since = parse_http_date_safe(value)
+    return since is not None and int(mtime) <= since
+
+
+def _read_range(f, start, length):
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_media(request, path):
+    """
+    Serve a public media file (see PUBLIC_MEDIA_PREFIXES) with validators,
+    caching and byte ranges.
+
+    Whole files go out through FileResponse, which WSGI servers hand to
+    sendfile(). With MEDIA_SENDFILE_BACKEND set, the front-end server sends
+    the body instead (X-Accel-Redirect for nginx, X-Sendfile for Apache)
+    and Django only answers the conditional part of the request.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        # Checked on the normalized path so "blobs/../jobs/..." is refused too
+        name = os.path.relpath(full_path, os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+        if not name.startswith(PUBLIC_MEDIA_PREFIXES):
+            raise Http404('File not found')
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('File not found')
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404('File not found')
+
+    etag = media_etag(st)
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is None:
+        response = _media_response(request, name, full_path, st, etag)
+
+    if is_blob_name(name):
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(st.st_mtime)
+    return response
+
+
+def _media_response(request, path, full_path, st, etag):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend:
+        # The front-end server handles ranges itself
+        response = HttpResponse(content_type=content_type)
+        if backend == 'nginx':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + path
+        else:
+            response['X-Sendfile'] = full_path
+        return response
+
+    size = st.st_size
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is not None and not _if_range_matches(request, etag, st.st_mtime):
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        body = [] if request.method == 'HEAD' else _read_range(open(full_path, 'rb'), start, length)
+        response = StreamingHttpResponse(body, status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = length
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,201 @@
+import bisect
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+# Upper bounds of the histogram buckets, per metric
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# name -> (help text, bucket bounds)
+REQUEST_METRICS = {
+    'request_duration_seconds': ('Total time spent handling the request', DURATION_BUCKETS),
+    'request_db_seconds': ('Time spent in SQL queries', DURATION_BUCKETS),
+    'request_python_seconds': ('Time spent outside SQL queries', DURATION_BUCKETS),
+    'request_slowest_query_seconds': ('Duration of the slowest SQL query', DURATION_BUCKETS),
+    'request_queries': ('Number of SQL queries', QUERY_COUNT_BUCKETS),
+    'response_size_bytes': ('Size of non-streaming response bodies', SIZE_BUCKETS),
+}
+# name -> help text of the plain counters
+COUNTERS = {
+    'accommodation_cache_hits_total': 'Accommodation detail reads served from the cache',
+    'accommodation_cache_misses_total': 'Accommodation detail reads that went to the database',
+}
+METRIC_PREFIX = 'inventory_'
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram as exposed by Prometheus, with quantiles
+    estimated by linear interpolation inside the matching bucket.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One count per bound plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        lower, seen = 0.0, 0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        # Beyond the last bound: the best estimate is the last bound itself
+        return self.bounds[-1]
+
+
+class MetricsRegistry:
+    """
+    In-memory, per-process histograms of request costs labelled by view,
+    plus a few plain counters. Each server process exposes its own figures on /metrics.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (metric name, view) -> Histogram
+        self.histograms = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe(self, view, values):
+        with self.lock:
+            for name, value in values.items():
+                histogram = self.histograms.get((name, view))
+                if histogram is None:
+                    histogram = self.histograms[(name, view)] = Histogram(REQUEST_METRICS[name][1])
+                histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for name, help_text in COUNTERS.items():
+                lines.append(f'# HELP {METRIC_PREFIX}{name} {help_text}')
+                lines.append(f'# TYPE {METRIC_PREFIX}{name} counter')
+                lines.append(f'{METRIC_PREFIX}{name} {self.counters[name]}')
+            for name, (help_text, _) in REQUEST_METRICS.items():
+                full_name = METRIC_PREFIX + name
+                views = sorted(view for metric, view in self.histograms if metric == name)
+                lines.append(f'# HELP {full_name} {help_text}')
+                lines.append(f'# TYPE {full_name} histogram')
+                for view in views:
+                    histogram = self.histograms[(name, view)]
+                    for bound, total in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{full_name}_bucket{{view="{view}",le="{le}"}} {total}')
+                    lines.append(f'{full_name}_sum{{view="{view}"}} {histogram.sum!r}')
+                    lines.append(f'{full_name}_count{{view="{view}"}} {histogram.count}')
+
+                lines.append(f'# HELP {full_name}_quantile Estimated quantiles of {full_name}')
+                lines.append(f'# TYPE {full_name}_quantile gauge')
+                for view in views:
+                    histogram = self.histograms[(name, view)]
+                    for q in QUANTILES:
+                        lines.append(
+                            f'{full_name}_quantile{{view="{view}",quantile="{q}"}} {histogram.quantile(q)!r}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting queries and their total and slowest time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.total += elapsed
+            self.slowest = max(self.slowest, elapsed)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record the SQL queries, DB and Python time and response size of a
+    sample of requests, per view.
+
+    Sampled responses carry a Server-Timing header and feed the histograms
+    served on /metrics. METRICS_SAMPLE_RATE sets the sampled share of
+    requests (0 turns recording off); unsampled requests only pay for one
+    random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.METRICS_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        python_time = max(duration - recorder.total, 0.0)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={recorder.total * 1000:.1f};desc="{recorder.count} queries"',
+            f'db-slowest;dur={recorder.slowest * 1000:.1f}',
+            f'app;dur={python_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ])
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unresolved'
+        values = {
+            'request_duration_seconds': duration,
+            'request_db_seconds': recorder.total,
+            'request_python_seconds': python_time,
+            'request_slowest_query_seconds': recorder.slowest,
+            'request_queries': recorder.count,
+        }
+        if not response.streaming:
+            values['response_size_bytes'] = len(response.content)
+        registry.observe(view, values)
+        return response
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property_management', '0004_auto_partition_accommodation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='location',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
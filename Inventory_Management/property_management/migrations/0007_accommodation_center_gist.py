@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Recreate the spatial index lost when 0004 rebuilt the Accommodation table
+    as a partitioned table. An index declared on the partitioned parent is
+    created on every existing feed partition and on any partition attached later.
+    """
+
+    dependencies = [
+        ('property_management', '0006_job'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+            CREATE INDEX IF NOT EXISTS accommodation_center_gist
+            ON property_management_accommodation USING GIST (center);
+            """,
+            reverse_sql="DROP INDEX IF EXISTS accommodation_center_gist;",
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+def build_location_paths(apps, schema_editor):
+    table = apps.get_model('property_management', 'Location')._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH RECURSIVE tree AS (
+                SELECT id, id::text || '/' AS path, 0 AS depth FROM {table} WHERE parent_id IS NULL
+                UNION ALL
+                SELECT child.id, tree.path || child.id || '/', tree.depth + 1
+                FROM {table} child
+                JOIN tree ON child.parent_id = tree.id
+                WHERE tree.depth < 10
+            )
+            UPDATE {table} SET path = tree.path FROM tree WHERE {table}.id = tree.id
+        """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property_management', '0007_accommodation_center_gist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_location_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['path'], name='location_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
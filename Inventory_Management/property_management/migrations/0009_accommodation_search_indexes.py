@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Indexes backing the faceted accommodation search. Both are declared on the
+    partitioned parent, so every feed partition gets its own copy.
+    """
+
+    dependencies = [
+        ('property_management', '0008_location_path'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+            -- jsonb_path_ops supports @> containment and is smaller than the default opclass
+            CREATE INDEX IF NOT EXISTS accommodation_amenities_gin
+            ON property_management_accommodation USING GIN (amenities jsonb_path_ops);
+
+            CREATE INDEX IF NOT EXISTS accommodation_published_country_rate
+            ON property_management_accommodation (country_code, usd_rate)
+            WHERE published;
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS accommodation_amenities_gin;
+            DROP INDEX IF EXISTS accommodation_published_country_rate;
+            """,
+        ),
+    ]
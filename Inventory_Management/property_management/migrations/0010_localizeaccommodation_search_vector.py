@@ -0,0 +1,37 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Frozen copy of fulltext.search_vector_sql() as of this migration, so
+# replaying it does not depend on the current app code
+BUILD_SEARCH_VECTORS = """
+    UPDATE property_management_localizeaccommodation
+    SET search_vector = to_tsvector((CASE LOWER(language)
+        WHEN 'da' THEN 'danish' WHEN 'de' THEN 'german' WHEN 'en' THEN 'english'
+        WHEN 'es' THEN 'spanish' WHEN 'fi' THEN 'finnish' WHEN 'fr' THEN 'french'
+        WHEN 'hu' THEN 'hungarian' WHEN 'it' THEN 'italian' WHEN 'nl' THEN 'dutch'
+        WHEN 'no' THEN 'norwegian' WHEN 'pt' THEN 'portuguese' WHEN 'ro' THEN 'romanian'
+        WHEN 'ru' THEN 'russian' WHEN 'sv' THEN 'swedish' WHEN 'tr' THEN 'turkish'
+        ELSE 'simple' END)::regconfig, COALESCE(description, ''))
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property_management', '0009_accommodation_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='localizeaccommodation',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(BUILD_SEARCH_VECTORS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='localizeaccommodation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='localize_search_vector_gin'),
+        ),
+    ]
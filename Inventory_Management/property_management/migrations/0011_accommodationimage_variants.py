@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property_management', '0010_localizeaccommodation_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accommodationimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='accommodationimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='accommodationimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('location_import', 'Location import'), ('location_export', 'Location export'), ('image_variants', 'Image variants')], max_length=30),
+        ),
+    ]
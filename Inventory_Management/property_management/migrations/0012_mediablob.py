@@ -0,0 +1,29 @@
+import property_management.models
+import property_management.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property_management', '0011_accommodationimage_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='accommodationimage',
+            name='image',
+            field=models.ImageField(
+                storage=property_management.storage.get_image_storage,
+                upload_to=property_management.models.upload_accommodation_image),
+        ),
+    ]
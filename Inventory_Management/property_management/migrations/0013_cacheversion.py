@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+# Bump the "location" version once per statement writing the Location table,
+# whichever code path (save(), bulk COPY/upserts, raw UPDATEs) it comes from
+CREATE_LOCATION_VERSION_TRIGGER = """
+CREATE FUNCTION property_management_bump_location_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO property_management_cacheversion (name, version) VALUES ('location', 1)
+    ON CONFLICT (name) DO UPDATE SET version = property_management_cacheversion.version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER property_management_location_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON property_management_location
+FOR EACH STATEMENT EXECUTE FUNCTION property_management_bump_location_version();
+"""
+
+DROP_LOCATION_VERSION_TRIGGER = """
+DROP TRIGGER IF EXISTS property_management_location_version ON property_management_location;
+DROP FUNCTION IF EXISTS property_management_bump_location_version();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property_management', '0012_mediablob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(CREATE_LOCATION_VERSION_TRIGGER, DROP_LOCATION_VERSION_TRIGGER),
+    ]
@@ -0,0 +1,41 @@
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('property_management', '0013_cacheversion'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper('title'), name='gin_trgm_ops'),
+                name='location_title_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper('city'), name='gin_trgm_ops'),
+                name='location_city_trgm'),
+        ),
+        # The owner autocomplete searches auth_user, which has no model here to declare them on
+        migrations.RunSQL(
+            """
+            CREATE INDEX auth_user_username_trgm ON auth_user USING gin (UPPER(username) gin_trgm_ops);
+            CREATE INDEX auth_user_email_trgm ON auth_user USING gin (UPPER(email) gin_trgm_ops);
+            """,
+            """
+            DROP INDEX IF EXISTS auth_user_username_trgm;
+            DROP INDEX IF EXISTS auth_user_email_trgm;
+            """,
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    The (feed, id) primary key cannot be searched by id alone, so lookups
+    whose feed is not known yet read every partition sequentially. An index
+    on id turns them into one index probe per partition.
+    """
+
+    dependencies = [
+        ('property_management', '0014_location_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='accommodation',
+            options={'base_manager_name': 'objects'},
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS accommodation_id ON property_management_accommodation (id);",
+            reverse_sql="DROP INDEX IF EXISTS accommodation_id;",
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property_management', '0015_accommodation_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accommodation',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index center cast to geometry for the map tiles. Tile bounds are planar
+    lon/lat rectangles, which a geography envelope (great circle edges) does
+    not describe, so the tile query compares center::geometry instead.
+    """
+
+    dependencies = [
+        ('property_management', '0017_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+            CREATE INDEX IF NOT EXISTS accommodation_center_geometry_gist
+            ON property_management_accommodation USING GIST ((center::geometry));
+            """,
+            reverse_sql="DROP INDEX IF EXISTS accommodation_center_geometry_gist;",
+        ),
+    ]
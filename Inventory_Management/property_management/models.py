@@ -1,13 +1,30 @@
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models
+from django.db import connection, transaction
+from django.db.models import Case, F, Func, Q, When
+from django.db.models.functions import Concat, Length, Substr, Upper
 from django.utils.timezone import now
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.conf import settings
+from collections import Counter
+from .partitions import PartitionManager
+from .routing import feed_filter, forget_feeds, remember_feeds, routed_ids
+from .storage import get_image_storage, image_storage, is_blob_name
 
 # Define the upload function outside of any model
 def upload_accommodation_image(instance, filename):
     return f'accommodations/{instance.accommodation.id}/{filename}'
 
+class LocationQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # auto_now only applies to save(); bulk updates must move updated_at
+        # too, or the incremental sitemap misses them
+        kwargs.setdefault('updated_at', now())
+        return super().update(**kwargs)
+
+
 class Location(models.Model):
     id = models.CharField(primary_key=True, max_length=20)
     title = models.CharField(max_length=100, null=False, blank=False)
@@ -20,11 +37,161 @@ class Location(models.Model):
     state_abbr = models.CharField(max_length=3, blank=True, null=True)
     city = models.CharField(max_length=30, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Materialized ancestry: the ids from the root down to this location,
+    # each followed by "/" (e.g. "US/US-CA/US-CA-SF/"). Kept in sync by save(),
+    # the post_delete signal and rebuild_paths() after bulk loads.
+    path = models.CharField(max_length=255, blank=True, default='', editable=False)
+
+    objects = LocationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # varchar_pattern_ops lets "path LIKE 'US/%'" use the index
+            models.Index(fields=['path'], name='location_path_idx', opclasses=['varchar_pattern_ops']),
+            # Trigram indexes answering the admin autocomplete's istartswith
+            # (UPPER(column) LIKE 'TERM%')
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='location_title_trgm'),
+            GinIndex(OpClass(Upper('city'), name='gin_trgm_ops'), name='location_city_trgm'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        self.path = self.build_path()
+        super().save(*args, **kwargs)
+
+        # Moving a location moves its whole subtree
+        if old_path and old_path != self.path:
+            Location.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(models.Value(self.path), Substr('path', len(old_path) + 1))
+            )
+
+    def build_path(self):
+        if not self.parent_id:
+            return f'{self.id}/'
+        if self._meta.get_field('parent').is_cached(self):
+            parent_path = self.parent.path
+        else:
+            parent_path = Location.objects.filter(pk=self.parent_id).values_list('path', flat=True).first()
+        parent_path = parent_path or f'{self.parent_id}/'
+        if f'/{self.id}/' in f'/{parent_path}':
+            raise ValueError(f'{self.id} cannot be placed under its own descendant {self.parent_id}')
+        return f'{parent_path}{self.id}/'
+
+    def descendants(self, include_self=False):
+        """
+        All locations below this one, at any depth, in a single indexed query.
+        """
+        qs = Location.objects.filter(path__startswith=self.path)
+        return qs if include_self else qs.exclude(pk=self.pk)
+
+    def ancestors(self, include_self=False):
+        """
+        The locations above this one, root first.
+        """
+        ids = self.path.split('/')[:-1]
+        if not include_self:
+            ids = ids[:-1]
+        return Location.objects.filter(pk__in=ids).order_by(Length('path'))
+
+    @classmethod
+    def rebuild_paths(cls, root_ids=None):
+        """
+        Recompute materialized paths with one recursive UPDATE.
+
+        Used after bulk loads that bypass save().
+        :param root_ids: Only rebuild the subtrees below these locations
+                         (their parents' paths must be current). Rebuilds
+                         the whole table when omitted.
+        :return: Number of rows whose path changed.
+        """
+        table = cls._meta.db_table
+        if root_ids is None:
+            roots = f"SELECT id, id::text || '/' AS path, 0 AS depth FROM {table} WHERE parent_id IS NULL"
+            params = []
+        else:
+            roots = f"""
+                SELECT location.id, COALESCE(parent.path, '') || location.id || '/', 0
+                FROM {table} location
+                LEFT JOIN {table} parent ON parent.id = location.parent_id
+                WHERE location.id = ANY(%s)
+            """
+            params = [list(root_ids)]
+
+        with connection.cursor() as cursor:
+            # The depth limit guards against parent cycles in imported data
+            cursor.execute(f"""
+                WITH RECURSIVE tree AS (
+                    {roots}
+                    UNION ALL
+                    SELECT child.id, tree.path || child.id || '/', tree.depth + 1
+                    FROM {table} child
+                    JOIN tree ON child.parent_id = tree.id
+                    WHERE tree.depth < 10
+                )
+                UPDATE {table} SET path = tree.path
+                FROM tree
+                WHERE {table}.id = tree.id AND {table}.path IS DISTINCT FROM tree.path
+            """, params)
+            return cursor.rowcount
+
+
+class CacheVersion(models.Model):
+    """
+    A counter bumped by a database trigger whenever the table it is named
+    after changes, so process-local caches can cheaply tell they are stale.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class AccommodationQuerySet(models.QuerySet):
+    """
+    get() by id also filters on the feed, the partition key, whenever the
+    feeds of the ids are cached, so PostgreSQL reads a single partition.
+    The cache may be stale (another process moved the row), so a routed
+    get() that finds nothing is retried without the feed. filter() and
+    update() are never routed by the cache: they cannot tell a stale feed
+    from a missing row. save() routes by the feed the row was loaded with,
+    see Accommodation._do_update().
+    """
+
+    def get(self, *args, **kwargs):
+        routed = feed_filter(args, kwargs)
+        try:
+            obj = super().get(*args, **kwargs, **routed)
+        except self.model.DoesNotExist:
+            if not routed:
+                raise
+            # A stale cached feed hides the row: retry once without it
+            forget_feeds(routed_ids(args, kwargs))
+            obj = super().get(*args, **kwargs)
+        if isinstance(obj, self.model) and 'feed' not in obj.get_deferred_fields():
+            remember_feeds({obj.pk: obj.feed})
+        return obj
+
+    def update(self, **kwargs):
+        if 'feed' in kwargs:
+            forget_feeds(list(self.values_list('pk', flat=True)))
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if 'feed' in fields:
+            forget_feeds([obj.pk for obj in objs])
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
+    def in_location(self, location):
+        """
+        Accommodations anywhere below (or at) a location, through one indexed join.
+        """
+        return self.filter(location__path__startswith=location.path)
+
 
 class Accommodation(models.Model):
     id = models.CharField(primary_key=True, max_length=20)
@@ -47,12 +214,40 @@ class Accommodation(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.SET_NULL, null=True, blank=True)
     published = models.BooleanField(default=False)
+    # Hash of the partner feed record last written, see feeds.py
+    content_hash = models.CharField(max_length=32, blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AccommodationQuerySet.as_manager()
+    # The table is RANGE partitioned on feed (migration 0004)
+    partitions = PartitionManager('feed', prefix='accommodation_feed')
+
+    class Meta:
+        # Related object access goes through AccommodationQuerySet.get() too
+        base_manager_name = 'objects'
+
     def __str__(self):
         return self.title
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Kept so save() can send its UPDATE to the row's partition
+        if 'feed' in instance.__dict__:
+            instance._loaded_feed = instance.feed
+        return instance
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Try the partition the row was loaded from first; if it has moved
+        # since, that UPDATE matches nothing and Django's own, reading every
+        # partition, runs before falling back to an INSERT
+        loaded_feed = getattr(self, '_loaded_feed', None)
+        if loaded_feed is not None and values and not self._meta.select_on_save:
+            if base_qs.filter(pk=pk_val, feed=loaded_feed)._update(values) > 0:
+                return True
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
     def save(self, *args, **kwargs):
         # If the user field is not already set and the user is logged in
         if not self.user and hasattr(self, 'user'):
@@ -64,6 +259,167 @@ class Accommodation(models.Model):
                     self.user = current_user
 
         super().save(*args, **kwargs)
+        if 'feed' in self.__dict__:
+            self._loaded_feed = self.feed
+
+
+def append_accommodation_images(accommodation_id, urls):
+    """
+    Append image URLs to Accommodation.images with a single array_cat UPDATE.
+
+    Unlike loading the row and calling save(), concurrent uploads cannot
+    overwrite each other and no other column (nor updated_at) is rewritten.
+    As no signal fires for the UPDATE, the cached detail is dropped here.
+    """
+    from .detail_cache import invalidate_accommodation_detail
+
+    array_type = ArrayField(models.CharField(max_length=300))
+    Accommodation.objects.filter(pk=accommodation_id).update(
+        images=Func(
+            F('images'), models.Value(list(urls), output_field=array_type),
+            function='array_cat', output_field=array_type,
+        )
+    )
+    invalidate_accommodation_detail(accommodation_id)
+
+
+def add_accommodation_image(accommodation_id, url, replaced_url=None):
+    """
+    Append one image URL to Accommodation.images unless it is listed already,
+    removing the URL of the file it replaces in the same UPDATE.
+    :return: Whether the row was updated.
+    """
+    from .detail_cache import invalidate_accommodation_detail
+
+    array_type = ArrayField(models.CharField(max_length=300))
+    images = F('images')
+    accommodations = Accommodation.objects.filter(pk=accommodation_id)
+    if replaced_url:
+        images = Func(images, models.Value(replaced_url), function='array_remove', output_field=array_type)
+        accommodations = accommodations.filter(~Q(images__contains=[url]) | Q(images__contains=[replaced_url]))
+    else:
+        accommodations = accommodations.exclude(images__contains=[url])
+    updated = accommodations.update(images=Case(
+        When(images__contains=[url], then=images),
+        default=Func(images, models.Value(url), function='array_append', output_field=array_type),
+        output_field=array_type,
+    ))
+    invalidate_accommodation_detail(accommodation_id)
+    return bool(updated)
+
+
+class MediaBlob(models.Model):
+    """
+    Reference count of a file in the content-addressed image storage.
+
+    Each AccommodationImage row pointing at the blob holds one reference.
+    When the last one is released the row stays behind with a refcount of 0
+    until the file has been deleted, so the deletion can lock it against a
+    concurrent upload of the same content.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+def blob_size(field_file):
+    try:
+        return image_storage.size(field_file.name)
+    except FileNotFoundError:
+        # Deleted since the upload was stored; add_blob_references writes it again
+        return field_file.file.size
+
+
+def add_blob_references(files):
+    """
+    Take one reference per stored file with a single upsert.
+
+    The upsert keeps the blob rows locked until the transaction ends, so
+    delete_orphaned_blobs either sees the new references and keeps the
+    files, or has deleted a file already; such a file is written again from
+    the upload. Files not produced by the content-addressed storage are ignored.
+    :param files: FieldFiles whose upload has just been stored.
+    """
+    files = [f for f in files if is_blob_name(f.name)]
+    if not files:
+        return
+    counts = Counter(f.name for f in files)
+    files = {f.name: f for f in files}
+    rows = [(name, blob_size(f), counts[name]) for name, f in files.items()]
+    table = MediaBlob._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {table} (name, size, refcount, created_at)
+            SELECT name, size, refcount, now()
+            FROM unnest(%s::varchar[], %s::bigint[], %s::integer[]) AS t(name, size, refcount)
+            ON CONFLICT (name) DO UPDATE SET refcount = {table}.refcount + EXCLUDED.refcount
+        """, [list(column) for column in zip(*rows)])
+    for name, f in files.items():
+        if not image_storage.exists(name):
+            image_storage.save(name, f.file)
+
+
+def release_blob_references(names):
+    """
+    Drop one reference per name.
+    Blobs nobody references any more are deleted once the surrounding
+    transaction commits.
+    """
+    counts = Counter(name for name in names if is_blob_name(name))
+    if not counts:
+        return
+    orphaned = []
+    with transaction.atomic():
+        for blob in MediaBlob.objects.select_for_update().filter(name__in=counts):
+            blob.refcount = max(blob.refcount - counts[blob.name], 0)
+            blob.save(update_fields=['refcount'])
+            if not blob.refcount:
+                orphaned.append(blob.name)
+    if orphaned:
+        transaction.on_commit(lambda: delete_orphaned_blobs(orphaned))
+
+
+def delete_orphaned_blobs(names):
+    """
+    Delete the files, generated variants included, of the named blobs that
+    still have no references, and then their rows.
+    The refcount is checked again under the row lock: an upload that took
+    a reference in the meantime keeps the file.
+    """
+    from .images import delete_image_variants
+
+    with transaction.atomic():
+        for blob in MediaBlob.objects.select_for_update().filter(name__in=names, refcount=0):
+            delete_image_variants(blob.name)
+            image_storage.delete(blob.name)
+            blob.delete()
+
+
+class AccommodationImageQuerySet(models.QuerySet):
+    def bulk_upload(self, accommodation, files):
+        """
+        Store several uploaded files for one accommodation.
+
+        All rows are inserted with one INSERT, their blob references taken
+        and their URLs appended with one statement each and a single job
+        queued to resize them, in one transaction.
+        :return: The created AccommodationImage objects.
+        """
+        from .jobs import enqueue_job
+
+        with transaction.atomic():
+            images = self.bulk_create(
+                [AccommodationImage(accommodation=accommodation, image=f) for f in files])
+            add_blob_references(image.image for image in images)
+            urls = [image.image.url for image in images]
+            append_accommodation_images(accommodation.pk, urls)
+            enqueue_job(Job.KIND_IMAGE_VARIANTS, image_ids=[image.pk for image in images])
+        accommodation.images = (accommodation.images or []) + urls
+        return images
 
 
 class AccommodationImage(models.Model):
@@ -72,17 +428,52 @@ class AccommodationImage(models.Model):
         related_name="accommodation_images",
         on_delete=models.CASCADE
     )
-    image = models.ImageField(upload_to=upload_accommodation_image)
+    # Identical uploads share one file, see ContentAddressedStorage
+    image = models.ImageField(upload_to=upload_accommodation_image, storage=get_image_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Filled in by the background workers once the resized variants exist
+    variants = models.JSONField(blank=True, default=dict, editable=False)
+    width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    height = models.PositiveIntegerField(blank=True, null=True, editable=False)
+
+    objects = AccommodationImageQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Kept so replacing the file releases the old blob
+        if 'image' in instance.__dict__:
+            instance._loaded_image_name = instance.__dict__['image']
+        return instance
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+        is_new = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            loaded_name = getattr(self, '_loaded_image_name', None)
+            tracked = is_new or hasattr(self, '_loaded_image_name')
+            # Without the loaded name the file may have changed, the append
+            # below skips URLs already listed anyway
+            image_changed = not tracked or self.image.name != loaded_name
+            replaced_url = self.image.storage.url(loaded_name) if loaded_name and image_changed else None
+            if tracked and image_changed:
+                add_blob_references([self.image])
+                release_blob_references([loaded_name])
+                self._loaded_image_name = self.image.name
         # Append the image URL to the accommodation's images field
-        if self.image and self.accommodation:
-            if self.accommodation.images is None:
-                self.accommodation.images = []  # Initialize the images array if it's None
-            self.accommodation.images.append(self.image.url)
-            self.accommodation.save()
+        if image_changed and self.image and self.accommodation_id:
+            updated = add_accommodation_image(self.accommodation_id, self.image.url, replaced_url)
+            # Keep an already loaded accommodation in step with the database
+            if updated and self._meta.get_field('accommodation').is_cached(self):
+                images = [url for url in self.accommodation.images or [] if url != replaced_url]
+                if self.image.url not in images:
+                    images.append(self.image.url)
+                self.accommodation.images = images
+
+        # Resizing happens in the run_workers processes, not in the request
+        if is_new and self.image:
+            from .jobs import enqueue_job
+            enqueue_job(Job.KIND_IMAGE_VARIANTS, image_ids=[self.pk])
 
     def __str__(self):
         return f"Image for {self.accommodation.title}"
@@ -96,6 +487,71 @@ class LocalizeAccommodation(models.Model):
     language = models.CharField(max_length=2)
     description = models.TextField(blank=True, null=True)
     policy = models.JSONField(blank=True, null=True)
+    # Stemmed description for full-text search, refreshed on save and by
+    # the rebuild_search_index command
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'], name='localize_search_vector_gin')]
 
     def __str__(self):
         return f"Localization for {self.property.title} ({self.language})"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Index the description with the configuration matching its language
+        from .fulltext import text_search_config
+        LocalizeAccommodation.objects.filter(pk=self.pk).update(
+            search_vector=SearchVector('description', config=text_search_config(self.language))
+        )
+
+
+class Job(models.Model):
+    """
+    A long-running task (large imports and exports, image processing) queued
+    for the run_workers command instead of being executed inside a web request.
+    """
+    KIND_LOCATION_IMPORT = 'location_import'
+    KIND_LOCATION_EXPORT = 'location_export'
+    KIND_IMAGE_VARIANTS = 'image_variants'
+    KIND_CHOICES = [
+        (KIND_LOCATION_IMPORT, 'Location import'),
+        (KIND_LOCATION_EXPORT, 'Location export'),
+        (KIND_IMAGE_VARIANTS, 'Image variants'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    options = models.JSONField(blank=True, default=dict)
+    input_file = models.FileField(upload_to='jobs/input/', blank=True)
+    result_file = models.FileField(upload_to='jobs/results/', blank=True)
+    # Rows handled so far, updated while the job runs
+    processed = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Touched periodically by the worker running the job; a running job whose
+    # heartbeat stops is taken back by the reaper
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'], name='job_status_created_idx')]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
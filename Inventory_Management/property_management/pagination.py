@@ -0,0 +1,45 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Below this many rows an exact COUNT(*) is cheap enough
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Return the planner's row estimate for a model's table from pg_class.
+
+    For a partitioned table the parent holds no rows, so the estimates of
+    its partitions are summed. Tables that were never analyzed report 0.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute("""
+            SELECT COALESCE(
+                (SELECT sum(GREATEST(child.reltuples, 0))
+                 FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                 WHERE pg_inherits.inhparent = %s::regclass),
+                (SELECT GREATEST(reltuples, 0) FROM pg_class WHERE oid = %s::regclass)
+            )
+        """, [model._meta.db_table] * 2)
+        return int(cursor.fetchone()[0] or 0)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that skips COUNT(*) over large unfiltered tables.
+
+    When the queryset has no WHERE clause and the table is estimated to
+    hold at least ESTIMATED_COUNT_THRESHOLD rows, the pg_class estimate is
+    used as the count. Filtered changelists (searches, list filters,
+    owners limited to their own rows) are still counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_row_count(self.object_list.model, self.object_list.db)
+            if estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
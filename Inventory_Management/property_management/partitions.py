@@ -0,0 +1,359 @@
+import re
+from collections import namedtuple
+
+from django.db import connection, transaction
+
+BOUND_RE = re.compile(r"FOR VALUES FROM \((.+?)\) TO \((.+?)\)")
+
+Partition = namedtuple('Partition', 'name lower upper rows size_bytes')
+Partition.__doc__ = """
+A RANGE partition: rows with lower <= key < upper. None stands for
+MINVALUE/MAXVALUE (or both, for the DEFAULT partition).
+"""
+
+
+def _bound(value):
+    value = value.strip().strip("'")
+    return None if value in ('MINVALUE', 'MAXVALUE') else int(value)
+
+
+def partition_name(prefix, lower, upper):
+    # Same naming as migration 0004: inclusive bounds, "_plus" when open ended
+    if upper is None:
+        return f'{prefix}_{lower}_plus'
+    return f'{prefix}_{lower}_{upper - 1}'
+
+
+def partition_for(partitions, value, table):
+    """
+    The partition of the list that holds rows whose key is value.
+    :raises ValueError: If none does.
+    """
+    default = None
+    for partition in partitions:
+        if partition.lower is None and partition.upper is None:
+            default = partition
+        elif (partition.lower is None or partition.lower <= value) and (
+                partition.upper is None or value < partition.upper):
+            return partition
+    if default is None:
+        raise ValueError(f'No partition of {table} holds {value}')
+    return default
+
+
+class PartitionManager:
+    """
+    Inspect and reshape the RANGE partitions of a partitioned model's table.
+
+    Attach it to a model like a manager (``partitions = PartitionManager('feed')``)
+    and use ``Model.partitions.list()``, ``.split()`` and ``.rebalance()``.
+    Indexes declared on the partitioned table are created on new partitions
+    by PostgreSQL itself; indexes that only exist on a split partition are
+    recreated on its replacements.
+    """
+
+    def __init__(self, key, prefix=None):
+        self.key = key
+        self.prefix = prefix
+        self.model = None
+
+    def contribute_to_class(self, cls, name):
+        self.model = cls
+        if self.prefix is None:
+            self.prefix = f'{cls._meta.model_name}_{self.key}'
+        setattr(cls, name, self)
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    def list(self, exact=False):
+        """
+        Return the partitions ordered by range, with their on-disk size and
+        row count (the planner's estimate unless exact is True).
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT child.relname, pg_get_expr(child.relpartbound, child.oid),
+                       GREATEST(child.reltuples, 0)::bigint, pg_total_relation_size(child.oid)
+                FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = %s::regclass
+            """, [self.table])
+            partitions = []
+            for name, bound, rows, size in cursor.fetchall():
+                match = BOUND_RE.search(bound)
+                lower, upper = (_bound(match.group(1)), _bound(match.group(2))) if match else (None, None)
+                if exact:
+                    cursor.execute(f'SELECT count(*) FROM "{name}"')
+                    rows = cursor.fetchone()[0]
+                partitions.append(Partition(name, lower, upper, rows, size))
+        return sorted(partitions, key=lambda p: (p.lower is not None, p.lower or 0))
+
+    def get(self, name):
+        for partition in self.list():
+            if partition.name == name:
+                return partition
+        raise ValueError(f'{name} is not a partition of {self.table}')
+
+    def for_key(self, value):
+        """
+        The partition holding rows whose key is value.
+        """
+        return partition_for(self.list(), value, self.table)
+
+    def key_distribution(self, partition=None):
+        """
+        Return [(key, rows)] ordered by key, for one partition or the whole table.
+        """
+        table = partition.name if partition else self.table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT "{self.key}", count(*) FROM "{table}" GROUP BY 1 ORDER BY 1')
+            return cursor.fetchall()
+
+    def split(self, name, split_points, batch_size=10000, progress=None):
+        """
+        Split a partition at the given key values while the table stays in use.
+
+        1. In one transaction a trigger starts logging the primary keys of
+           the rows written to the partition, and one standalone table per
+           sub-range is created with the table's and the partition's indexes
+           and a CHECK constraint matching its range.
+        2. Rows are copied into those tables in batches of batch_size, each
+           batch committed on its own, then the rows logged meanwhile are
+           copied again until fewer than batch_size are left. Reads and
+           writes go to the old partition all along.
+        3. One short transaction locks the table, copies the last logged
+           rows, drops the old partition and attaches the new tables; their
+           CHECK constraints spare PostgreSQL from scanning them.
+
+        A split that stopped (e.g. on the lock_timeout of step 3) resumes
+        where it was when called again with the same split points.
+        :param split_points: Key values starting a new sub-range.
+        :param progress: Optional callable receiving the number of rows copied so far.
+        :raises TransactionManagementError: If called inside a transaction,
+            as every step must commit on its own.
+        :return: The new Partition list for the split range.
+        """
+        partition = self.get(name)
+        points = sorted(set(int(point) for point in split_points))
+        if not points:
+            raise ValueError('At least one split point is required')
+        if partition.lower is None:
+            raise ValueError('Partitions starting at MINVALUE or DEFAULT partitions cannot be split')
+        for point in points:
+            if point <= partition.lower or (partition.upper is not None and point >= partition.upper):
+                raise ValueError(f'{point} is not inside the range of {name}')
+        if connection.in_atomic_block:
+            raise transaction.TransactionManagementError('Partitions cannot be split inside a transaction.')
+
+        bounds = [partition.lower] + points + [partition.upper]
+        targets = [(partition_name(self.prefix, lower, upper), lower, upper) for lower, upper in zip(bounds, bounds[1:])]
+        log = f'{name}_split_log'
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [log])
+            if cursor.fetchone()[0] is None:
+                self._prepare_split(cursor, name, targets, log)
+            else:
+                for target, _, _ in targets:
+                    cursor.execute('SELECT to_regclass(%s)', [target])
+                    if cursor.fetchone()[0] is None:
+                        raise ValueError(f'{name} is already being split at other points; resume that split first')
+
+            copied = 0
+            for target, lower, upper in targets:
+                copied = self._copy_rows(cursor, name, target, lower, upper, batch_size, progress, copied)
+            while True:
+                with transaction.atomic():
+                    if self._copy_logged_rows(cursor, name, targets, log, batch_size) < batch_size:
+                        break
+            self._swap(cursor, name, targets, log)
+
+        names = {target for target, _, _ in targets}
+        return [p for p in self.list() if p.name in names]
+
+    def plan_rebalance(self, max_rows):
+        """
+        Work out split points so no partition holds more than max_rows rows,
+        from the observed row count per key. A single key holding more than
+        max_rows cannot be split further and keeps its own sub-range.
+        :return: {partition name: [split points]} for the partitions to split.
+        """
+        plan = {}
+        for partition in self.list():
+            if partition.lower is None:
+                continue
+            points = []
+            running = 0
+            for key, rows in self.key_distribution(partition):
+                if running and running + rows > max_rows:
+                    points.append(key)
+                    running = 0
+                running += rows
+            if points:
+                plan[partition.name] = points
+        return plan
+
+    def rebalance(self, max_rows, batch_size=10000, progress=None):
+        """
+        Split every partition holding more than max_rows rows.
+        :return: The plan that was carried out (see plan_rebalance).
+        """
+        plan = self.plan_rebalance(max_rows)
+        for name, points in plan.items():
+            self.split(name, points, batch_size=batch_size, progress=progress)
+        return plan
+
+    def _columns(self, cursor):
+        cursor.execute("""
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+            ORDER BY attnum
+        """, [self.table])
+        return [f'"{row[0]}"' for row in cursor.fetchall()]
+
+    def _primary_key(self, cursor):
+        cursor.execute("""
+            SELECT attname FROM pg_index
+            JOIN pg_attribute ON attrelid = indrelid AND attnum = ANY(indkey)
+            WHERE indrelid = %s::regclass AND indisprimary
+            ORDER BY array_position(indkey::int2[], attnum)
+        """, [self.table])
+        return [f'"{row[0]}"' for row in cursor.fetchall()]
+
+    def _range_sql(self, lower, upper, alias=''):
+        key = f'{alias}"{self.key}"'
+        condition = f'{key} >= {int(lower)}'
+        return condition if upper is None else f'{condition} AND {key} < {int(upper)}'
+
+    def _prepare_split(self, cursor, name, targets, log):
+        with transaction.atomic():
+            # Fail fast instead of queueing every query behind the DDL locks
+            cursor.execute("SET LOCAL lock_timeout = '5s'")
+            local_indexes = self._local_index_definitions(cursor, name)
+            keys = self._primary_key(cursor)
+            # LIKE does not copy foreign keys; without them ATTACH would add
+            # and validate its own while holding the lock
+            cursor.execute("""
+                SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+                WHERE conrelid = %s::regclass AND contype = 'f'
+            """, [self.table])
+            foreign_keys = cursor.fetchall()
+            cursor.execute(f'CREATE UNLOGGED TABLE "{log}" AS SELECT {", ".join(keys)} FROM "{self.table}" WITH NO DATA')
+            cursor.execute(f"""
+                CREATE FUNCTION "{log}"() RETURNS trigger LANGUAGE plpgsql AS $$
+                BEGIN
+                    IF TG_OP <> 'INSERT' THEN
+                        INSERT INTO "{log}" VALUES ({", ".join(f'OLD.{key}' for key in keys)});
+                    END IF;
+                    IF TG_OP <> 'DELETE' THEN
+                        INSERT INTO "{log}" VALUES ({", ".join(f'NEW.{key}' for key in keys)});
+                    END IF;
+                    RETURN NULL;
+                END
+                $$
+            """)
+            cursor.execute(
+                f'CREATE TRIGGER "{log}" AFTER INSERT OR UPDATE OR DELETE ON "{name}" '
+                f'FOR EACH ROW EXECUTE FUNCTION "{log}"()')
+            for target, lower, upper in targets:
+                cursor.execute(f'CREATE TABLE "{target}" (LIKE "{self.table}" INCLUDING ALL)')
+                cursor.execute(
+                    f'ALTER TABLE "{target}" ADD CONSTRAINT "{target}_range" CHECK ({self._range_sql(lower, upper)})')
+                for constraint, definition in foreign_keys:
+                    constraint = f'{target}_{constraint}'[:63]
+                    cursor.execute(f'ALTER TABLE "{target}" ADD CONSTRAINT "{constraint}" {definition}')
+                for index_name, definition in local_indexes:
+                    cursor.execute(self._retarget_index(definition, index_name, name, target))
+
+    def _copy_rows(self, cursor, source, target, lower, upper, batch_size, progress, copied):
+        # Keyset pagination on the primary key, one statement (so one commit)
+        # per batch; rows copied by an interrupted run are skipped
+        columns = ', '.join(self._columns(cursor))
+        keys = ', '.join(self._primary_key(cursor))
+        last = ()
+        while True:
+            after = f'AND ({keys}) > ({", ".join(["%s"] * len(last))})' if last else ''
+            cursor.execute(f"""
+                WITH batch AS (
+                    SELECT {columns} FROM "{source}"
+                    WHERE {self._range_sql(lower, upper)} {after}
+                    ORDER BY {keys} LIMIT %s
+                ), copied AS (
+                    INSERT INTO "{target}" ({columns}) SELECT {columns} FROM batch
+                    ON CONFLICT DO NOTHING
+                )
+                SELECT count(*) OVER (), {keys} FROM batch ORDER BY {keys} DESC LIMIT 1
+            """, [*last, batch_size])
+            row = cursor.fetchone()
+            if row is None:
+                return copied
+            copied += row[0]
+            last = row[1:]
+            if progress:
+                progress(copied)
+
+    def _copy_logged_rows(self, cursor, source, targets, log, limit=None):
+        """
+        Copy again the rows whose keys were logged, taking the keys off the log.
+        Must run inside a transaction.
+        :return: Number of log entries taken.
+        """
+        columns = ', '.join(f'source.{column}' for column in self._columns(cursor))
+        keys = self._primary_key(cursor)
+        match = ' AND '.join(f'{{table}}.{key} = logged.{key}' for key in keys)
+        taken = f'WHERE ctid = ANY(ARRAY(SELECT ctid FROM "{log}" LIMIT {int(limit)}))' if limit else ''
+        cursor.execute(f'CREATE TEMPORARY TABLE split_keys AS SELECT * FROM "{log}" WITH NO DATA')
+        cursor.execute(f"""
+            WITH taken AS (DELETE FROM "{log}" {taken} RETURNING *)
+            INSERT INTO split_keys SELECT * FROM taken
+        """)
+        count = cursor.rowcount
+        for target, lower, upper in targets:
+            cursor.execute(
+                f'DELETE FROM "{target}" target USING split_keys logged WHERE {match.format(table="target")}')
+            cursor.execute(f"""
+                INSERT INTO "{target}" SELECT {columns}
+                FROM "{source}" source JOIN (SELECT DISTINCT * FROM split_keys) logged ON {match.format(table="source")}
+                WHERE {self._range_sql(lower, upper, 'source.')}
+            """)
+        cursor.execute('DROP TABLE split_keys')
+        return count
+
+    def _swap(self, cursor, name, targets, log):
+        with transaction.atomic():
+            cursor.execute("SET LOCAL lock_timeout = '5s'")
+            # Queries lock the parent before its partitions; doing the same
+            # cannot deadlock with them
+            cursor.execute(f'LOCK TABLE "{self.table}" IN ACCESS EXCLUSIVE MODE')
+            self._copy_logged_rows(cursor, name, targets, log)
+            cursor.execute(f'ALTER TABLE "{self.table}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}", "{log}"')
+            cursor.execute(f'DROP FUNCTION "{log}"()')
+            for target, lower, upper in targets:
+                upper_sql = 'MAXVALUE' if upper is None else int(upper)
+                cursor.execute(
+                    f'ALTER TABLE "{self.table}" ATTACH PARTITION "{target}" '
+                    f'FOR VALUES FROM ({int(lower)}) TO ({upper_sql})')
+                cursor.execute(f'ALTER TABLE "{target}" DROP CONSTRAINT "{target}_range"')
+
+    @staticmethod
+    def _local_index_definitions(cursor, partition):
+        # Indexes of the partition that are not copies of a partitioned index
+        cursor.execute("""
+            SELECT index_class.relname, pg_get_indexdef(pg_index.indexrelid)
+            FROM pg_index
+            JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+            WHERE pg_index.indrelid = %s::regclass
+              AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = pg_index.indexrelid)
+        """, [partition])
+        return cursor.fetchall()
+
+    @staticmethod
+    def _retarget_index(definition, index_name, old_table, new_table):
+        definition = definition.replace(f' ON {old_table} ', f' ON {new_table} ', 1)
+        definition = definition.replace(f' ON public.{old_table} ', f' ON public.{new_table} ', 1)
+        new_index = f'{new_table}_{index_name}'[:63]
+        return definition.replace(f'INDEX {index_name} ', f'INDEX "{new_index}" ', 1)
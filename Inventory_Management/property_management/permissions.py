@@ -0,0 +1,49 @@
+from django.utils.functional import cached_property
+
+PROPERTY_OWNERS_GROUP = 'Property Owners'
+
+
+class RequestPermissions:
+    """
+    Group memberships and owned accommodation ids of one user, each loaded
+    with a single query the first time it is needed.
+
+    Use get_permissions(request) so the admin's many permission checks
+    during one request share the same instance.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def group_names(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(self.user.groups.values_list('name', flat=True))
+
+    @cached_property
+    def accommodation_ids(self):
+        from .models import Accommodation
+
+        if not self.user.is_authenticated:
+            return set()
+        return set(Accommodation.objects.filter(user=self.user).values_list('id', flat=True))
+
+    @property
+    def is_property_owner(self):
+        return PROPERTY_OWNERS_GROUP in self.group_names
+
+    def owns_accommodation(self, accommodation_id):
+        return self.user.is_superuser or accommodation_id in self.accommodation_ids
+
+    def add_accommodation(self, accommodation_id):
+        # Keeps the cache right for accommodations created during the request
+        if 'accommodation_ids' in self.__dict__:
+            self.accommodation_ids.add(accommodation_id)
+
+
+def get_permissions(request):
+    permissions = getattr(request, '_property_permissions', None)
+    if permissions is None or permissions.user is not request.user:
+        permissions = request._property_permissions = RequestPermissions(request.user)
+    return permissions
@@ -12,3 +12,10 @@ class LocationResource(resources.ModelResource):
             'id', 'title', 'center', 'parent', 'location_type', 
             'country_code', 'state_abbr', 'city', 'created_at', 'updated_at',
         )
+
+    def after_import(self, dataset, result, **kwargs):
+        # Rows may reference parents imported later in the same file, so
+        # recompute the materialized paths once everything is saved
+        super().after_import(dataset, result, **kwargs)
+        if not kwargs.get('dry_run'):
+            Location.rebuild_paths()
@@ -0,0 +1,112 @@
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+
+# lookup -> whether its value is a list of ids
+ID_LOOKUPS = {'pk': False, 'pk__exact': False, 'id': False, 'id__exact': False, 'pk__in': True, 'id__in': True}
+
+
+def feed_cache():
+    return caches[settings.ACCOMMODATION_CACHE_ALIAS]
+
+
+def feed_cache_key(accommodation_id):
+    return f'accommodation-feed:{accommodation_id}'
+
+
+def cached_feeds(accommodation_ids):
+    """
+    :return: {accommodation id: feed} for the ids whose feed is cached.
+    """
+    keys = {feed_cache_key(accommodation_id): accommodation_id for accommodation_id in accommodation_ids}
+    return {keys[key]: feed for key, feed in feed_cache().get_many(keys).items()}
+
+
+def remember_feeds(feeds):
+    feed_cache().set_many({feed_cache_key(accommodation_id): feed for accommodation_id, feed in feeds.items()})
+
+
+def forget_feeds(accommodation_ids):
+    feed_cache().delete_many([feed_cache_key(accommodation_id) for accommodation_id in accommodation_ids])
+
+
+def _lookups(args, kwargs):
+    yield from kwargs.items()
+    # Q objects ANDed into the filter, as used by related object descriptors
+    for arg in args:
+        if isinstance(arg, Q) and arg.connector == Q.AND and not arg.negated:
+            yield from (child for child in arg.children if isinstance(child, tuple))
+
+
+def routed_ids(args, kwargs):
+    """
+    The accommodation ids a filter(*args, **kwargs) call is restricted to, or
+    None when it does not name plain ids or already filters on the feed.
+    """
+    ids = None
+    for lookup, value in _lookups(args, kwargs):
+        if lookup.split('__')[0] == 'feed':
+            return None
+        if lookup not in ID_LOOKUPS:
+            continue
+        values = value if ID_LOOKUPS[lookup] else [value]
+        if not isinstance(values, (list, tuple, set, frozenset)) or not all(isinstance(v, str) for v in values):
+            return None
+        ids = set(values) if ids is None else ids & set(values)
+    return ids or None
+
+
+def feed_filter(args, kwargs):
+    """
+    The feed lookup to add to filter(*args, **kwargs) so PostgreSQL only reads
+    the partitions holding the requested ids: {'feed': ...}, {'feed__in': [...]},
+    or {} when the feed of any of them is not cached.
+    """
+    ids = routed_ids(args, kwargs)
+    if not ids:
+        return {}
+    feeds = cached_feeds(ids)
+    if len(feeds) < len(ids):
+        return {}
+    values = sorted(set(feeds.values()))
+    return {'feed': values[0]} if len(values) == 1 else {'feed__in': values}
+
+
+def _index_names(node):
+    # A bitmap heap scan names its indexes in the bitmap index scans below it
+    names, stack = set(), [node]
+    while stack:
+        node = stack.pop()
+        if 'Index Name' in node:
+            names.add(node['Index Name'])
+        stack.extend(node.get('Plans', ()))
+    return names
+
+
+def relation_scans(queryset):
+    """
+    The tables (and partitions) in the query plan of a queryset.
+    :return: {relation name: names of the indexes it is read through, with
+             None for a sequential scan}.
+    """
+    scans = {}
+    stack = [json.loads(queryset.explain(format='json'))]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if 'Relation Name' in node:
+                indexes = {None} if node['Node Type'] == 'Seq Scan' else _index_names(node)
+                scans.setdefault(node['Relation Name'], set()).update(indexes)
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return scans
+
+
+def scanned_relations(queryset):
+    """
+    Names of the tables (and partitions) in the query plan of a queryset.
+    """
+    return set(relation_scans(queryset))
@@ -0,0 +1,122 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+from django.db.models import Q
+
+from .location_tree import get_location_tree
+from .models import Accommodation
+
+# Upper bounds (exclusive) of the usd_rate facet buckets; the last bucket is open ended
+PRICE_BUCKETS = (50, 100, 200, 500, 1000)
+
+
+def price_bucket_label(index):
+    lower = PRICE_BUCKETS[index - 1] if index else 0
+    if index == len(PRICE_BUCKETS):
+        return f'{lower}+'
+    return f'{lower}-{PRICE_BUCKETS[index]}'
+
+
+def filter_accommodations(amenities=(), country=None, min_bedrooms=None, max_bedrooms=None,
+                          min_price=None, max_price=None, min_review=None, location=None):
+    """
+    Return the published accommodations matching the search filters.
+
+    Amenities are matched with JSONB containment (@>), which is answered by
+    the GIN index on amenities; every listed amenity must be present.
+    :param location: Location id; matches accommodations anywhere below it.
+    :raises ValueError: If the location does not exist.
+    """
+    qs = Accommodation.objects.filter(published=True)
+    if location:
+        node = get_location_tree().get(location)
+        if node is None:
+            raise ValueError(f'Unknown location "{location}"')
+        qs = qs.filter(location__path__startswith=node.path)
+    if amenities:
+        qs = qs.filter(amenities__contains=list(amenities))
+    if country:
+        qs = qs.filter(country_code=country.upper())
+    if min_bedrooms is not None:
+        qs = qs.filter(bedroom_count__gte=min_bedrooms)
+    if max_bedrooms is not None:
+        qs = qs.filter(bedroom_count__lte=max_bedrooms)
+    if min_price is not None:
+        qs = qs.filter(usd_rate__gte=min_price)
+    if max_price is not None:
+        qs = qs.filter(usd_rate__lte=max_price)
+    if min_review is not None:
+        qs = qs.filter(review_score__gte=min_review)
+    return qs
+
+
+def search_page(qs, limit=20, after=None):
+    """
+    Return one page of results, best reviewed first, using keyset pagination.
+    :param after: (review_score, id) of the last row of the previous page.
+    :return: Tuple of (accommodations, (review_score, id) of the last row or
+             None when there are no more pages).
+    :raises ValueError: If the review_score of after is not a finite number.
+    """
+    qs = qs.order_by('-review_score', 'id')
+    if after is not None:
+        review_score, accommodation_id = after
+        try:
+            review_score = Decimal(review_score)
+        except (TypeError, ValueError, InvalidOperation) as e:
+            raise ValueError('Invalid cursor') from e
+        if not review_score.is_finite():
+            raise ValueError('Invalid cursor')
+        qs = qs.filter(
+            Q(review_score__lt=review_score) | Q(review_score=review_score, id__gt=accommodation_id)
+        )
+    rows = list(qs[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (str(rows[-1].review_score), rows[-1].id)
+
+
+def facet_counts(qs):
+    """
+    Count the matches per amenity and per price bucket in a single query.
+
+    The filtered rows are materialized once in a CTE and every facet is
+    aggregated from it, instead of running one COUNT per facet value.
+    :return: Dictionary with the total, amenity counts and price bucket counts.
+    """
+    matched_sql, params = qs.order_by().values('amenities', 'usd_rate').query.sql_with_params()
+    thresholds = ', '.join(str(bound) for bound in PRICE_BUCKETS)
+    sql = f"""
+        WITH matched AS MATERIALIZED ({matched_sql})
+        SELECT 'amenity', amenity, COUNT(*)
+        FROM matched
+        CROSS JOIN LATERAL jsonb_array_elements_text(
+            CASE WHEN jsonb_typeof(amenities) = 'array' THEN amenities ELSE '[]'::jsonb END
+        ) AS amenity
+        GROUP BY amenity
+        UNION ALL
+        SELECT 'price', width_bucket(usd_rate, ARRAY[{thresholds}]::numeric[])::text, COUNT(*)
+        FROM matched
+        WHERE usd_rate IS NOT NULL
+        GROUP BY 2
+        UNION ALL
+        SELECT 'total', NULL, COUNT(*) FROM matched
+    """
+    facets = {'total': 0, 'amenities': {}, 'price': {}}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for facet, value, count in cursor.fetchall():
+            if facet == 'total':
+                facets['total'] = count
+            elif facet == 'amenity':
+                facets['amenities'][value] = count
+            else:
+                facets['price'][price_bucket_label(int(value))] = count
+
+    facets['amenities'] = dict(sorted(facets['amenities'].items(), key=lambda item: (-item[1], item[0])))
+    facets['price'] = {
+        price_bucket_label(index): facets['price'].get(price_bucket_label(index), 0)
+        for index in range(len(PRICE_BUCKETS) + 1)
+    }
+    return facets
@@ -0,0 +1,33 @@
+def accommodation_summary(accommodation):
+    """
+    Return the public JSON representation of an accommodation used by list endpoints.
+    """
+    return {
+        'id': accommodation.id,
+        'feed': accommodation.feed,
+        'title': accommodation.title,
+        'country_code': accommodation.country_code,
+        'bedroom_count': accommodation.bedroom_count,
+        'review_score': float(accommodation.review_score),
+        'usd_rate': float(accommodation.usd_rate) if accommodation.usd_rate is not None else None,
+        'latitude': accommodation.center.y,
+        'longitude': accommodation.center.x,
+        'image': accommodation.images[0] if accommodation.images else None,
+    }
+
+
+def accommodation_detail(accommodation, localization=None):
+    """
+    Return the public JSON representation of one accommodation, with the
+    description and policy of the given localization.
+    """
+    return {
+        **accommodation_summary(accommodation),
+        'location_id': accommodation.location_id,
+        'images': list(accommodation.images or []),
+        'amenities': accommodation.amenities,
+        'language': localization.language if localization else None,
+        'description': localization.description if localization else None,
+        'policy': localization.policy if localization else None,
+        'updated_at': accommodation.updated_at.isoformat(),
+    }
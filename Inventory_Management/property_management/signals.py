@@ -0,0 +1,117 @@
+from django.db.models import F, Func, Value
+from django.db.models.functions import Substr
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+from .detail_cache import invalidate_accommodation_detail
+from .geo import invalidate_tiles
+from .location_tree import expire_location_tree
+from .models import Accommodation, AccommodationImage, LocalizeAccommodation, Location, release_blob_references
+from .routing import forget_feeds, remember_feeds
+
+
+@receiver(post_delete, sender=Location)
+def touch_location_parent(sender, instance, **kwargs):
+    # A deleted row leaves no updated_at behind, so bump its parent instead.
+    # This lets the incremental sitemap notice the subtree it was removed from.
+    if instance.parent_id:
+        Location.objects.filter(pk=instance.parent_id).update(updated_at=now())
+
+
+@receiver(post_init, sender=Location)
+def remember_location_parent(sender, instance, **kwargs):
+    instance._original_parent_id = instance.__dict__.get('parent_id')
+
+
+@receiver(pre_save, sender=Location)
+def touch_previous_location_parent(sender, instance, **kwargs):
+    # A location moved elsewhere must also drop out of its old subtree's
+    # sitemap shard, so bump the parent it is leaving
+    old_parent_id = instance._original_parent_id
+    if old_parent_id and old_parent_id != instance.parent_id and not instance._state.adding:
+        Location.objects.filter(pk=old_parent_id).update(updated_at=now())
+
+
+@receiver(post_save, sender=Location)
+def reset_location_parent(sender, instance, **kwargs):
+    instance._original_parent_id = instance.parent_id
+
+
+@receiver(post_delete, sender=Location)
+def detach_location_subtree(sender, instance, **kwargs):
+    # The children were set to a NULL parent, so strip the deleted location's
+    # part off every path below it. When several levels are deleted at once
+    # the subtree may already have lost its leading ids, so each suffix of
+    # the old path ending in this location is tried.
+    parts = instance.path.split('/')[:-1]
+    for start in range(len(parts)):
+        prefix = '/'.join(parts[start:]) + '/'
+        Location.objects.filter(path__startswith=prefix).update(path=Substr('path', len(prefix) + 1))
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def expire_cached_location_tree(sender, **kwargs):
+    # Other processes notice the trigger-bumped version within
+    # LOCATION_TREE_CHECK_INTERVAL; this one reloads right away
+    expire_location_tree()
+
+
+@receiver(post_init, sender=Accommodation)
+def remember_accommodation_center(sender, instance, **kwargs):
+    # Kept so a save that moves the accommodation also clears its old tiles
+    instance._original_center = instance.__dict__.get('center')
+
+
+@receiver(post_save, sender=Accommodation)
+def invalidate_accommodation_tiles(sender, instance, **kwargs):
+    invalidate_tiles(instance._original_center, instance.center)
+    instance._original_center = instance.center
+
+
+@receiver(post_delete, sender=Accommodation)
+def invalidate_deleted_accommodation_tiles(sender, instance, **kwargs):
+    invalidate_tiles(instance.center)
+
+
+@receiver(post_delete, sender=AccommodationImage)
+def release_accommodation_image_blob(sender, instance, **kwargs):
+    name = instance.image.name
+    if not name:
+        return
+    # Drop the URL unless another image of the accommodation shares the blob
+    siblings = AccommodationImage.objects.filter(accommodation_id=instance.accommodation_id, image=name)
+    if not siblings.exists():
+        images_field = Accommodation._meta.get_field('images')
+        Accommodation.objects.filter(pk=instance.accommodation_id).update(
+            images=Func(F('images'), Value(instance.image.url), function='array_remove', output_field=images_field))
+    release_blob_references([name])
+
+
+@receiver(post_save, sender=Accommodation)
+@receiver(post_delete, sender=Accommodation)
+def invalidate_cached_accommodation(sender, instance, **kwargs):
+    invalidate_accommodation_detail(instance.pk)
+
+
+@receiver(post_save, sender=Accommodation)
+def remember_accommodation_feed(sender, instance, **kwargs):
+    # Later lookups by id go straight to this feed's partition
+    remember_feeds({instance.pk: instance.feed})
+
+
+@receiver(post_delete, sender=Accommodation)
+def forget_accommodation_feed(sender, instance, **kwargs):
+    forget_feeds([instance.pk])
+
+
+@receiver(post_save, sender=AccommodationImage)
+@receiver(post_delete, sender=AccommodationImage)
+def invalidate_cached_accommodation_images(sender, instance, **kwargs):
+    invalidate_accommodation_detail(instance.accommodation_id)
+
+
+@receiver(post_save, sender=LocalizeAccommodation)
+@receiver(post_delete, sender=LocalizeAccommodation)
+def invalidate_cached_accommodation_localization(sender, instance, **kwargs):
+    invalidate_accommodation_detail(instance.property_id)
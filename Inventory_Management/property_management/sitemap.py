@@ -0,0 +1,281 @@
+import json
+import os
+import shutil
+from urllib.parse import quote
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Location
+
+
+# Per-country shards and their index live in this file inside the shard directory
+SHARD_INDEX = 'index.json'
+
+# Name of the nested list written under each level of the hierarchy
+# (countries hold "states", states hold "cities"; cities are leaves).
+CHILD_KEYS = ('states', 'cities')
+
+
+def slugify_title(title):
+    return title.lower().replace(' ', '-')
+
+
+def iter_sitemap_rows(country_ids=None):
+    """
+    Yield (depth, title, path, country_id) for every sitemap entry in
+    depth-first order.
+
+    The whole country -> state -> city hierarchy is loaded with a single
+    recursive query, sorted the same way the sitemap is written, and read
+    through a server-side cursor so only one chunk of rows is held in
+    memory at a time.
+    :param country_ids: Optional iterable restricting output to these countries.
+    """
+    table = Location._meta.db_table
+    params = []
+    country_filter = ''
+    if country_ids is not None:
+        country_filter = 'AND id = ANY(%s)'
+        params.append(list(country_ids))
+
+    sql = f"""
+        WITH RECURSIVE tree AS (
+            SELECT id, title, 0 AS depth, country_code, id AS country_id,
+                   ARRAY[title::text, id::text] AS sort_key
+            FROM {table}
+            WHERE location_type = 'country' {country_filter}
+            UNION ALL
+            SELECT child.id, child.title, tree.depth + 1,
+                   tree.country_code, tree.country_id,
+                   tree.sort_key || ARRAY[child.title::text, child.id::text]
+            FROM {table} child
+            JOIN tree ON child.parent_id = tree.id
+            WHERE tree.depth < %s
+        )
+        SELECT depth, title, country_code, country_id FROM tree ORDER BY sort_key
+    """
+    params.append(len(CHILD_KEYS))
+
+    # Path segments of the branch currently being walked
+    parts = []
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        for depth, title, country_code, country_id in cursor:
+            del parts[depth:]
+            parts.append(country_code.lower() if depth == 0 else slugify_title(title))
+            yield depth, title, '/'.join(parts), country_id
+
+
+class SitemapWriter:
+    """
+    Write sitemap entries to a file object as they arrive.
+
+    Entries must be fed in depth-first order. The output is byte-for-byte
+    what json.dump(sitemap, fp, indent=2) produces for the nested structure,
+    but nothing beyond the currently open branch is kept in memory.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.rows = 0
+        # Number of items written to each open list, the top-level array first
+        self._items = [0]
+
+    def begin(self):
+        self.fp.write('[')
+
+    def write(self, depth, title, path):
+        while len(self._items) > depth + 1:
+            self._close_entry()
+
+        indent = ' ' * (2 + 4 * depth)
+        self.fp.write(',\n' if self._items[-1] else '\n')
+        self._items[-1] += 1
+        self.fp.write(f'{indent}{{\n{indent}  {json.dumps(title)}: {json.dumps(path)}')
+
+        if depth < len(CHILD_KEYS):
+            self.fp.write(f',\n{indent}  "{CHILD_KEYS[depth]}": [')
+            self._items.append(0)
+        else:
+            self.fp.write(f'\n{indent}}}')
+        self.rows += 1
+
+    def end(self):
+        self.close_entries()
+        self.fp.write('\n]' if self._items[0] else ']')
+
+    def close_entries(self):
+        """
+        Close every open entry without terminating the top-level array.
+        """
+        while len(self._items) > 1:
+            self._close_entry()
+
+    def _close_entry(self):
+        indent = ' ' * (2 + 4 * (len(self._items) - 2))
+        if self._items.pop():
+            self.fp.write(f'\n{indent}  ]')
+        else:
+            self.fp.write(']')
+        self.fp.write(f'\n{indent}}}')
+
+
+def write_sitemap(fp, rows=None):
+    """
+    Stream the full sitemap into fp and return the number of entries written.
+    """
+    writer = SitemapWriter(fp)
+    writer.begin()
+    for depth, title, path, _ in rows if rows is not None else iter_sitemap_rows():
+        writer.write(depth, title, path)
+    writer.end()
+    return writer.rows
+
+
+def _shard_filename(country_id):
+    return f"{quote(country_id, safe='')}.json"
+
+
+def _write_atomic(path, write):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def write_country_shards(shard_dir, country_ids=None):
+    """
+    Render each country's section of the sitemap into its own shard file.
+
+    A shard holds the country entry exactly as it appears inside the full
+    sitemap, so the document can be assembled by concatenating shards.
+    :param country_ids: Optional iterable restricting rendering to these countries.
+    :return: Number of entries written.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    rows = 0
+    current_id = writer = fp = tmp_path = None
+
+    def finish():
+        writer.close_entries()
+        fp.close()
+        os.replace(tmp_path, os.path.join(shard_dir, _shard_filename(current_id)))
+
+    try:
+        for depth, title, path, country_id in iter_sitemap_rows(country_ids):
+            if country_id != current_id:
+                if fp is not None:
+                    finish()
+                current_id = country_id
+                tmp_path = os.path.join(shard_dir, f'{_shard_filename(country_id)}.tmp')
+                fp = open(tmp_path, 'w')
+                writer = SitemapWriter(fp)
+            writer.write(depth, title, path)
+            rows += 1
+        if fp is not None:
+            finish()
+    finally:
+        if fp is not None and not fp.closed:
+            fp.close()
+    return rows
+
+
+def load_shard_index(shard_dir):
+    try:
+        with open(os.path.join(shard_dir, SHARD_INDEX)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def assemble_sitemap(shard_dir, index, output):
+    """
+    Concatenate the shards listed in the index into the full sitemap file.
+    """
+    def write(out):
+        out.write('[')
+        for n, country in enumerate(index['countries']):
+            if n:
+                out.write(',')
+            with open(os.path.join(shard_dir, country['file'])) as shard:
+                shutil.copyfileobj(shard, out)
+        out.write('\n]' if index['countries'] else ']')
+
+    _write_atomic(output, write)
+
+
+def changed_country_ids(since):
+    """
+    Return the ids of countries with any location in their subtree updated after since.
+    """
+    table = Location._meta.db_table
+    sql = f"""
+        WITH RECURSIVE changed AS (
+            SELECT id, parent_id, location_type FROM {table} WHERE updated_at > %s
+            UNION
+            SELECT parent.id, parent.parent_id, parent.location_type
+            FROM {table} parent
+            JOIN changed ON parent.id = changed.parent_id
+        )
+        SELECT id FROM changed WHERE location_type = 'country'
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [since])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def update_sitemap_shards(shard_dir, output, full=False):
+    """
+    Bring the shard directory and the assembled sitemap up to date.
+
+    Only the countries whose subtree changed since the high-water mark stored
+    in the shard index are re-rendered; every other shard is reused as is.
+    Without an index (or with full=True) every country is rendered.
+    :return: Tuple of (countries re-rendered, entries written).
+    """
+    previous = load_shard_index(shard_dir)
+    # Taken before reading so rows saved during this run are picked up next time
+    started_at = timezone.now()
+
+    countries = list(
+        Location.objects.filter(location_type='country')
+        .order_by('title', 'id')
+        .values_list('id', 'title')
+    )
+    live_ids = {country_id for country_id, _ in countries}
+
+    if full or previous is None:
+        stale_ids = live_ids
+        rows = write_country_shards(shard_dir)
+    else:
+        known_ids = {
+            country['id'] for country in previous['countries']
+            if os.path.exists(os.path.join(shard_dir, country['file']))
+        }
+        since = parse_datetime(previous['high_water_mark'])
+        stale_ids = (changed_country_ids(since) | (live_ids - known_ids)) & live_ids
+        rows = write_country_shards(shard_dir, stale_ids) if stale_ids else 0
+
+    # Drop shards of countries that have been deleted
+    for country in previous['countries'] if previous else []:
+        if country['id'] not in live_ids:
+            try:
+                os.remove(os.path.join(shard_dir, country['file']))
+            except FileNotFoundError:
+                pass
+
+    index = {
+        'high_water_mark': started_at.isoformat(),
+        'countries': [
+            {'id': country_id, 'title': title, 'file': _shard_filename(country_id)}
+            for country_id, title in countries
+        ],
+    }
+    assemble_sitemap(shard_dir, index, output)
+    _write_atomic(
+        os.path.join(shard_dir, SHARD_INDEX),
+        lambda f: json.dump(index, f, indent=2),
+    )
+    return len(stale_ids), rows
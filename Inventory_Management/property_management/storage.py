@@ -0,0 +1,71 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+# Every content-addressed file lives below this directory of the storage
+BLOB_PREFIX = 'blobs/'
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps each distinct file exactly once.
+
+    Uploads are hashed with SHA-256 while they are streamed to disk in
+    chunks, and stored as blobs/<aa>/<bb>/<digest><ext>. Saving bytes that
+    are already stored returns the existing name instead of writing a copy.
+    The requested name only contributes its extension.
+
+    Which blobs are still referenced is tracked by the MediaBlob model;
+    the storage itself never decides to delete anything.
+    """
+    chunk_size = 64 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from the content in _save, so never rename here
+        return name
+
+    def _save(self, name, content):
+        blob_dir = self.path(BLOB_PREFIX)
+        os.makedirs(blob_dir, exist_ok=True)
+        digest = hashlib.sha256()
+
+        # The temporary file sits on the same file system as the blobs so the
+        # final move is an atomic rename
+        fd, tmp_path = tempfile.mkstemp(dir=blob_dir, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(self.chunk_size):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            hexdigest = digest.hexdigest()
+            extension = os.path.splitext(name)[1].lower()
+            blob_name = f'{BLOB_PREFIX}{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{extension}'
+            blob_path = self.path(blob_name)
+            if os.path.exists(blob_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+                os.replace(tmp_path, blob_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return blob_name
+
+
+image_storage = ContentAddressedStorage()
+
+
+def get_image_storage():
+    # Referenced by the AccommodationImage.image field (and its migrations)
+    return image_storage
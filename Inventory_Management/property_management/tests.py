@@ -1,5 +1,17 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
 from unittest.mock import patch
+from PIL import Image as PILImage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache, caches
+from django.core.checks.registry import registry as checks_registry
+from django.core.management import call_command
 from property_management.admin import (
     LocationAdmin,
     AccommodationAdmin,
@@ -10,10 +22,31 @@ from django.contrib.auth import get_user_model
 from django.contrib.admin.sites import AdminSite
 from django.contrib.auth.models import User, Group
 from django.contrib.messages import get_messages
-from django.urls import reverse
-from django.test import TestCase
+from django.urls import NoReverseMatch, reverse
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.gis.geos import Point
-from .models import Location, Accommodation, AccommodationImage, LocalizeAccommodation
+from django.utils import timezone
+from .models import Location, Accommodation, AccommodationImage, LocalizeAccommodation, Job, MediaBlob
+from .exports import StreamingExport
+from .feeds import (
+    FEED_ID_LOCK_CLASS, FeedIngestReport, FeedRunReport, discover_feed_files, ingest_accommodation_feed,
+    ingest_feed_files,
+)
+from .fulltext import rebuild_search_vectors, search_localizations
+from .geo import encode_cursor
+from .images import IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_SIZES, process_accommodation_image
+from .importers import bulk_import_locations
+from .jobs import claim_next_job, enqueue_job, reap_stale_jobs, run_job, work
+from .location_tree import get_location_tree
+from .metrics import Histogram, registry as metrics_registry
+from .pagination import EstimatedCountPaginator, estimated_row_count
+from .partitions import PartitionManager
+from .checks import check_accommodation_partition_pruning
+from .routing import cached_feeds, remember_feeds, scanned_relations
+from .search import facet_counts, filter_accommodations
+from .sitemap import update_sitemap_shards, write_sitemap
 
 
 class LocationModelTest(TestCase):
@@ -104,6 +137,14 @@ class AccommodationImageModelTest(TestCase):
         # Include /media/ prefix here
         self.assertIn("/media/path/to/image.jpg", self.accommodation.images)
 
+    def test_resaving_image_does_not_repeat_its_url(self):
+        image = AccommodationImage.objects.create(accommodation=self.accommodation, image="path/to/image.jpg")
+        image.save()
+        AccommodationImage.objects.get(pk=image.pk).save()
+        AccommodationImage.objects.only("id", "accommodation").get(pk=image.pk).save()
+        self.accommodation.refresh_from_db()
+        self.assertEqual(self.accommodation.images, ["/media/path/to/image.jpg"])
+
 
 class LocalizeAccommodationModelTest(TestCase):
     def setUp(self):
@@ -228,4 +269,1566 @@ class ViewsTestCase(TestCase):
         response = self.client.get(reverse('property_owner_sign_up_success'))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(
-            response, 'property_owner_sign_up_success.html')
\ No newline at end of file
+            response, 'property_owner_sign_up_success.html')
+
+# Sitemap Test
+
+
+class SitemapGenerationTest(TestCase):
+    def setUp(self):
+        country = Location.objects.create(
+            id="US", title="United States", center=Point(-98.5795, 39.8283),
+            location_type="country", country_code="US",
+        )
+        state = Location.objects.create(
+            id="US-CA", title="California", center=Point(-119.4179, 36.7783),
+            location_type="state", country_code="US", state_abbr="CA", parent=country,
+        )
+        Location.objects.create(
+            id="US-CA-SF", title="San Francisco", center=Point(-122.4194, 37.7749),
+            location_type="city", country_code="US", state_abbr="CA",
+            city="San Francisco", parent=state,
+        )
+        Location.objects.create(
+            id="BD", title="Bangladesh", center=Point(90.3563, 23.685),
+            location_type="country", country_code="BD",
+        )
+
+    def test_sitemap_matches_nested_layout(self):
+        """
+        Test that the streamed sitemap is the same document json.dump would produce.
+        """
+        expected = [
+            {"Bangladesh": "bd", "states": []},
+            {"United States": "us", "states": [
+                {"California": "us/california", "cities": [
+                    {"San Francisco": "us/california/san-francisco"},
+                ]},
+            ]},
+        ]
+        buffer = io.StringIO()
+        with self.assertNumQueries(1):
+            rows = write_sitemap(buffer)
+
+        self.assertEqual(rows, 4)
+        self.assertEqual(buffer.getvalue(), json.dumps(expected, indent=2))
+
+    def test_incremental_sitemap_rerenders_changed_country_only(self):
+        """
+        Test that an incremental run only re-renders the country whose subtree changed.
+        """
+        with tempfile.TemporaryDirectory() as shard_dir:
+            output = os.path.join(shard_dir, "sitemap.json")
+            self.assertEqual(update_sitemap_shards(shard_dir, output)[0], 2)
+
+            city = Location.objects.get(id="US-CA-SF")
+            city.title = "Los Angeles"
+            city.save()
+            self.assertEqual(update_sitemap_shards(shard_dir, output)[0], 1)
+
+            buffer = io.StringIO()
+            write_sitemap(buffer)
+            with open(output) as f:
+                self.assertEqual(f.read(), buffer.getvalue())
+            self.assertIn("us/california/los-angeles", buffer.getvalue())
+
+    def test_moving_a_location_rerenders_the_country_it_left(self):
+        """
+        Test that re-parenting a location under another country refreshes both countries' shards.
+        """
+        with tempfile.TemporaryDirectory() as shard_dir:
+            output = os.path.join(shard_dir, "sitemap.json")
+            update_sitemap_shards(shard_dir, output)
+
+            city = Location.objects.get(id="US-CA-SF")
+            city.parent_id = "BD"
+            city.save()
+            self.assertEqual(update_sitemap_shards(shard_dir, output)[0], 2)
+
+            buffer = io.StringIO()
+            write_sitemap(buffer)
+            with open(output) as f:
+                self.assertEqual(f.read(), buffer.getvalue())
+
+            # Bulk updates move updated_at as well
+            Location.objects.filter(id="US-CA").update(title="Golden State")
+            self.assertEqual(update_sitemap_shards(shard_dir, output)[0], 1)
+
+
+# Bulk Import Test
+
+
+class BulkLocationImportTest(TestCase):
+    def test_bulk_import_resolves_parents_and_rejects_bad_rows(self):
+        """
+        Test that rows are upserted, forward parent references resolve and bad rows are reported.
+        """
+        Location.objects.create(
+            id="BD", title="Old Title", center=Point(90.3563, 23.685),
+            location_type="country", country_code="BD",
+        )
+        csv_file = io.StringIO(
+            "id,title,center,parent,location_type,country_code,state_abbr,city\n"
+            "BD-DHA-MI,Mirpur,POINT(90.4125 23.8103),BD-DHA,city,BD,DHA,Mirpur\n"
+            "BD-DHA,Dhaka,POINT(90.4125 23.8103),BD,state,BD,DHA,\n"
+            "BD,Bangladesh,POINT(90.3563 23.685),,country,BD,,\n"
+            "XX-1,Nowhere,POINT(0 0),XX,state,XX,,\n"
+            "BD-BAD,Bad Point,POINT(500 0),BD,state,BD,,\n"
+        )
+        report = bulk_import_locations(csv_file, batch_size=2)
+
+        self.assertEqual(report.rows, 5)
+        self.assertEqual(report.loaded, 3)
+        self.assertEqual([error[1] for error in report.errors], ["BD-BAD", "XX-1"])
+        self.assertEqual(Location.objects.get(id="BD").title, "Bangladesh")
+        self.assertEqual(Location.objects.get(id="BD-DHA-MI").parent_id, "BD-DHA")
+
+
+# Background Job Test
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BackgroundJobTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="admin", password="test1234")
+
+    def test_import_job_runs_in_worker(self):
+        """
+        Test that a queued import is claimed and executed by a worker.
+        """
+        upload = SimpleUploadedFile(
+            "locations.csv",
+            b"id,title,center,parent,location_type,country_code,state_abbr,city\n"
+            b"BD,Bangladesh,POINT(90.3563 23.685),,country,BD,,\n",
+        )
+        job = enqueue_job(Job.KIND_LOCATION_IMPORT, user=self.user, upload=upload, format="csv")
+
+        work(once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertEqual(job.processed, 1)
+        self.assertTrue(Location.objects.filter(id="BD").exists())
+        self.assertIsNone(claim_next_job())
+
+    def test_export_job_produces_download(self):
+        """
+        Test that an export job stores a result file that can be downloaded from the admin.
+        """
+        Location.objects.create(
+            id="BD", title="Bangladesh", center=Point(90.3563, 23.685),
+            location_type="country", country_code="BD",
+        )
+        job = enqueue_job(Job.KIND_LOCATION_EXPORT, user=self.user, format="csv")
+        run_job(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("admin:property_management_job_download", args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Bangladesh", b"".join(response.streaming_content))
+
+    @override_settings(JOB_STALE_AFTER=60, JOB_MAX_ATTEMPTS=2)
+    def test_jobs_abandoned_by_a_worker_are_reaped(self):
+        """
+        Test that running jobs without a recent heartbeat are requeued, and failed once out of attempts.
+        """
+        retried = enqueue_job(Job.KIND_LOCATION_EXPORT, user=self.user, format="csv")
+        exhausted = enqueue_job(Job.KIND_LOCATION_EXPORT, user=self.user, format="csv")
+        alive = enqueue_job(Job.KIND_LOCATION_EXPORT, user=self.user, format="csv")
+        for _ in range(3):
+            claim_next_job()
+        long_ago = timezone.now() - timedelta(minutes=5)
+        Job.objects.filter(pk__in=[retried.pk, exhausted.pk]).update(heartbeat_at=long_ago)
+        Job.objects.filter(pk=exhausted.pk).update(attempts=2)
+
+        self.assertEqual(reap_stale_jobs(), (1, 1))
+
+        statuses = dict(Job.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[retried.pk], Job.STATUS_QUEUED)
+        self.assertEqual(statuses[exhausted.pk], Job.STATUS_FAILED)
+        self.assertEqual(statuses[alive.pk], Job.STATUS_RUNNING)
+        self.assertEqual(claim_next_job().pk, retried.pk)
+
+    def test_location_admin_has_no_in_request_import(self):
+        """
+        Test that location imports and exports are only offered through the job queue.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("admin:property_management_location_changelist"))
+        self.assertContains(response, reverse("admin:property_management_location_bulk_import"))
+        with self.assertRaises(NoReverseMatch):
+            reverse("admin:property_management_location_import")
+
+
+# Populate Location Data Test
+
+
+class PopulateLocationDataTest(TestCase):
+    def test_populate_from_geojson_is_idempotent(self):
+        """
+        Test that a GeoJSON source is loaded parents-first and re-running it adds nothing.
+        """
+        features = [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [90.4125, 23.8103]},
+             "properties": {"id": "BD-DHA", "title": "Dhaka", "parent": "BD", "location_type": "state",
+                            "country_code": "BD", "state_abbr": "DHA"}},
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [90.3563, 23.685]},
+             "properties": {"id": "BD", "title": "Bangladesh", "location_type": "country",
+                            "country_code": "BD"}},
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".geojson", delete=False) as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+        self.addCleanup(os.remove, f.name)
+
+        call_command("populate_location_data", source=f.name, dry_run=True, stdout=io.StringIO())
+        self.assertFalse(Location.objects.exists())
+
+        call_command("populate_location_data", source=f.name, stdout=io.StringIO())
+        self.assertEqual(Location.objects.get(id="BD-DHA").parent_id, "BD")
+
+        out = io.StringIO()
+        call_command("populate_location_data", source=f.name, stdout=out)
+        self.assertIn("No new locations to add.", out.getvalue())
+        self.assertEqual(Location.objects.count(), 2)
+
+
+# Nearby Search Test
+
+
+class NearbyAccommodationsApiTest(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        self.user = User.objects.create_user(username="owner", password="test1234")
+        # Roughly 0, 1.1 and 2.2 km north of the search point, plus an unpublished one
+        for index, published in enumerate([True, True, True, False]):
+            Accommodation.objects.create(
+                id=f"A{index}", title=f"Apartment {index}", country_code="US", bedroom_count=1,
+                usd_rate=100, center=Point(-74.006, 40.7128 + index * 0.01),
+                location=self.location, user=self.user, published=published,
+            )
+
+    def test_nearby_orders_by_distance_and_paginates(self):
+        """
+        Test that only published rows are returned, nearest first, across keyset pages.
+        """
+        url = reverse("nearby_accommodations")
+        params = {"lat": 40.7128, "lon": -74.006, "radius_km": 5, "limit": 2}
+        first = self.client.get(url, params).json()
+        self.assertEqual([row["id"] for row in first["results"]], ["A0", "A1"])
+        self.assertIsNotNone(first["next_cursor"])
+
+        second = self.client.get(url, {**params, "cursor": first["next_cursor"]}).json()
+        self.assertEqual([row["id"] for row in second["results"]], ["A2"])
+        self.assertIsNone(second["next_cursor"])
+
+    def test_nearby_rejects_invalid_parameters(self):
+        """
+        Test that malformed coordinates and cursors return a 400.
+        """
+        url = reverse("nearby_accommodations")
+        self.assertEqual(self.client.get(url, {"lat": 100, "lon": 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"lat": 0, "lon": 0, "cursor": "x"}).status_code, 400)
+        for values in (("far", "A0"), (1.5, 7), (None, "A0"), (1.5,)):
+            cursor = encode_cursor(*values)
+            response = self.client.get(url, {"lat": 0, "lon": 0, "cursor": cursor})
+            self.assertEqual(response.status_code, 400)
+
+
+# Map Tile Test
+
+
+class AccommodationTileApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        user = User.objects.create_user(username="owner", password="test1234")
+        for index in range(3):
+            Accommodation.objects.create(
+                id=f"A{index}", title=f"Apartment {index}", country_code="US", bedroom_count=1,
+                usd_rate=100, center=Point(-74.006, 40.7128 + index * 0.001),
+                location=location, user=user, published=True,
+            )
+
+    def test_low_zoom_tile_clusters_points(self):
+        """
+        Test that nearby points are aggregated into one cluster at low zoom.
+        """
+        tile = self.client.get(reverse("accommodation_tile", args=[0, 0, 0])).json()
+        self.assertEqual([cluster["count"] for cluster in tile["clusters"]], [3])
+
+    def test_saving_accommodation_invalidates_cached_tile(self):
+        """
+        Test that moving an accommodation clears the cached tiles it left and entered.
+        """
+        url = reverse("accommodation_tile", args=[0, 0, 0])
+        self.client.get(url)
+
+        accommodation = Accommodation.objects.get(id="A0")
+        accommodation.center = Point(90.4125, 23.8103)
+        accommodation.save()
+
+        tile = self.client.get(url).json()
+        self.assertEqual(sorted(cluster["count"] for cluster in tile["clusters"]), [1, 2])
+
+    def test_tile_edges_follow_longitude_and_latitude(self):
+        """
+        Test that a tile holds exactly the points inside its lon/lat rectangle, even far from the equator.
+        """
+        Accommodation.objects.filter(id="A1").update(center=Point(-170, 80))
+        Accommodation.objects.filter(id="A2").update(center=Point(10, 80))
+        tile = self.client.get(reverse("accommodation_tile", args=[1, 0, 0])).json()
+        self.assertEqual(sorted(cluster["count"] for cluster in tile["clusters"]), [1, 1])
+        tile = self.client.get(reverse("accommodation_tile", args=[1, 1, 0])).json()
+        self.assertEqual([cluster["id"] for cluster in tile["clusters"]], ["A2"])
+
+    def test_out_of_range_tile_is_not_found(self):
+        response = self.client.get(reverse("accommodation_tile", args=[1, 2, 0]))
+        self.assertEqual(response.status_code, 404)
+
+
+# Location Hierarchy Test
+
+
+class LocationHierarchyTest(TestCase):
+    def setUp(self):
+        self.country = Location.objects.create(
+            id="US", title="United States", center=Point(-98.5795, 39.8283),
+            location_type="country", country_code="US",
+        )
+        self.state = Location.objects.create(
+            id="US-CA", title="California", center=Point(-119.4179, 36.7783),
+            location_type="state", country_code="US", state_abbr="CA", parent=self.country,
+        )
+        self.city = Location.objects.create(
+            id="US-CA-SF", title="San Francisco", center=Point(-122.4194, 37.7749),
+            location_type="city", country_code="US", state_abbr="CA", parent=self.state,
+        )
+
+    def test_paths_and_queryset_helpers(self):
+        """
+        Test that descendants, ancestors and in_location resolve through the materialized path.
+        """
+        self.assertEqual(self.city.path, "US/US-CA/US-CA-SF/")
+        self.assertEqual(set(self.country.descendants().values_list("id", flat=True)), {"US-CA", "US-CA-SF"})
+        self.assertEqual([location.id for location in self.city.ancestors()], ["US", "US-CA"])
+
+        user = User.objects.create_user(username="owner", password="test1234")
+        Accommodation.objects.create(
+            id="1", title="Loft", country_code="US", bedroom_count=1, usd_rate=100,
+            center=Point(-122.4194, 37.7749), location=self.city, user=user,
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(Accommodation.objects.in_location(self.country).count(), 1)
+
+    def test_moving_and_deleting_update_subtree_paths(self):
+        """
+        Test that re-parenting a location moves its subtree and deleting one detaches it.
+        """
+        other = Location.objects.create(
+            id="MX", title="Mexico", center=Point(-102.5528, 23.6345),
+            location_type="country", country_code="MX",
+        )
+        self.state.parent = other
+        self.state.save()
+        self.assertEqual(Location.objects.get(id="US-CA-SF").path, "MX/US-CA/US-CA-SF/")
+
+        other.delete()
+        self.assertEqual(Location.objects.get(id="US-CA-SF").path, "US-CA/US-CA-SF/")
+
+
+# Faceted Search Test
+
+
+class AccommodationSearchApiTest(TestCase):
+    def setUp(self):
+        location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        user = User.objects.create_user(username="owner", password="test1234")
+        listings = [
+            ("A1", ["Free Wi-Fi", "Gym Access"], 80, 4.5, True),
+            ("A2", ["Free Wi-Fi"], 150, 4.0, True),
+            ("A3", ["Swimming Pool"], 600, 5.0, True),
+            ("A4", ["Free Wi-Fi"], 90, 3.0, False),
+        ]
+        for accommodation_id, amenities, rate, score, published in listings:
+            Accommodation.objects.create(
+                id=accommodation_id, title=accommodation_id, country_code="US", bedroom_count=2,
+                usd_rate=rate, review_score=score, amenities=amenities, center=Point(-74.006, 40.7128),
+                location=location, user=user, published=published,
+            )
+
+    def test_search_filters_and_facets(self):
+        """
+        Test amenity containment filtering and the facet counts returned with it.
+        """
+        response = self.client.get(reverse("accommodation_search"), {"amenity": "Free Wi-Fi"}).json()
+        self.assertEqual([row["id"] for row in response["results"]], ["A1", "A2"])
+        self.assertEqual(response["facets"]["total"], 2)
+        self.assertEqual(response["facets"]["amenities"], {"Free Wi-Fi": 2, "Gym Access": 1})
+        self.assertEqual(response["facets"]["price"]["50-100"], 1)
+        self.assertEqual(response["facets"]["price"]["100-200"], 1)
+
+    def test_facets_use_a_single_query(self):
+        with self.assertNumQueries(1):
+            facets = facet_counts(filter_accommodations(max_price=1000))
+        self.assertEqual(facets["total"], 3)
+        self.assertEqual(facets["price"]["500-1000"], 1)
+
+    def test_search_rejects_malformed_cursors(self):
+        """
+        Test that a cursor whose review score is not a number returns a 400.
+        """
+        url = reverse("accommodation_search")
+        response = self.client.get(url, {"limit": 1}).json()
+        self.assertEqual(self.client.get(url, {"limit": 1, "cursor": response["next_cursor"]}).status_code, 200)
+        for values in (("high", "A1"), ("NaN", "A1"), (4.5, "A1")):
+            response = self.client.get(url, {"cursor": encode_cursor(*values)})
+            self.assertEqual(response.status_code, 400)
+
+
+# Full-Text Search Test
+
+
+class AccommodationTextSearchApiTest(TestCase):
+    def setUp(self):
+        location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        user = User.objects.create_user(username="owner", password="test1234")
+        for accommodation_id, published, description in [
+            ("A1", True, "A cozy apartment a short walk from the beaches"),
+            ("A2", False, "Beach house with a private garden"),
+        ]:
+            accommodation = Accommodation.objects.create(
+                id=accommodation_id, title=accommodation_id, country_code="US", bedroom_count=2,
+                usd_rate=100, center=Point(-74.006, 40.7128), location=location, user=user,
+                published=published,
+            )
+            LocalizeAccommodation.objects.create(property=accommodation, language="en", description=description)
+        LocalizeAccommodation.objects.create(
+            property=Accommodation.objects.get(id="A1"), language="es", description="Apartamento junto a la playa",
+        )
+
+    def test_search_uses_language_stemming_and_published_only(self):
+        """
+        Test that stemmed matches are found in the requested language for published rows only.
+        """
+        response = self.client.get(reverse("accommodation_text_search"), {"q": "beach"}).json()
+        self.assertEqual([row["id"] for row in response["results"]], ["A1"])
+
+        response = self.client.get(reverse("accommodation_text_search"), {"q": "playas", "lang": "es"}).json()
+        self.assertEqual([row["id"] for row in response["results"]], ["A1"])
+
+    def test_rebuild_search_vectors(self):
+        LocalizeAccommodation.objects.update(search_vector=None)
+        self.assertEqual(rebuild_search_vectors(batch_size=1), 3)
+        self.assertEqual(len(search_localizations("beach")), 1)
+
+
+# Image Processing Test
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AccommodationImageProcessingTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="owner", password="test1234")
+        location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        self.accommodation = Accommodation.objects.create(
+            id="1", title="Luxury Apartment", country_code="US", bedroom_count=3, usd_rate=150.00,
+            center=Point(-74.006, 40.7128), location=location, user=user, published=True,
+        )
+
+    def test_upload_is_resized_by_worker(self):
+        """
+        Test that saving an image only queues work and the worker records the variants.
+        """
+        buffer = io.BytesIO()
+        PILImage.new("RGB", (2000, 1000), "red").save(buffer, "JPEG")
+        image = AccommodationImage.objects.create(
+            accommodation=self.accommodation,
+            image=SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg"),
+        )
+        self.assertEqual(image.variants, {})
+        self.assertTrue(Job.objects.filter(kind=Job.KIND_IMAGE_VARIANTS, status=Job.STATUS_QUEUED).exists())
+
+        work(once=True)
+
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (2000, 1000))
+        self.assertEqual(image.variants["thumb"]["webp"]["width"], 320)
+        self.assertEqual(image.variants["large"]["jpg"]["height"], 800)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_shared_blob_variants_are_written_once(self):
+        """
+        Test that images sharing a blob, and a job run again, reuse the stored variants instead of copying them.
+        """
+        buffer = io.BytesIO()
+        PILImage.new("RGB", (400, 200), "red").save(buffer, "JPEG")
+        images = [
+            AccommodationImage.objects.create(
+                accommodation=self.accommodation, image=SimpleUploadedFile(filename, buffer.getvalue()))
+            for filename in ("photo.jpg", "copy.jpg")
+        ]
+        for image in images + images[:1]:
+            process_accommodation_image(image.pk)
+
+        variants_dir = os.path.join(os.path.dirname(images[0].image.path), "variants")
+        self.assertEqual(len(os.listdir(variants_dir)), len(IMAGE_VARIANT_SIZES) * len(IMAGE_VARIANT_FORMATS))
+        images[1].refresh_from_db()
+        self.assertEqual(images[1].variants["thumb"]["webp"]["width"], 320)
+
+    def test_bulk_upload_appends_all_urls_at_once(self):
+        """
+        Test that a gallery upload inserts every image and appends their URLs in one update.
+        """
+        files = [SimpleUploadedFile(f"photo{index}.jpg", b"data") for index in range(3)]
+        # INSERT images, upsert blob references, UPDATE the images array,
+        # INSERT the resize job, plus the savepoint pair
+        with self.assertNumQueries(6):
+            images = AccommodationImage.objects.bulk_upload(self.accommodation, files)
+
+        self.accommodation.refresh_from_db()
+        self.assertEqual(self.accommodation.images, [image.image.url for image in images])
+        job = Job.objects.get(kind=Job.KIND_IMAGE_VARIANTS)
+        self.assertEqual(job.options["image_ids"], [image.pk for image in images])
+
+
+# Image Storage Test
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedImageStorageTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="owner", password="test1234")
+        location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        self.accommodation = Accommodation.objects.create(
+            id="1", title="Luxury Apartment", country_code="US", bedroom_count=3, usd_rate=150.00,
+            center=Point(-74.006, 40.7128), location=location, user=user, published=True,
+        )
+
+    def upload(self, filename, content):
+        return AccommodationImage.objects.create(
+            accommodation=self.accommodation, image=SimpleUploadedFile(filename, content))
+
+    def test_identical_uploads_share_one_blob(self):
+        """
+        Test that re-uploading the same bytes reuses the stored file and counts references.
+        """
+        first = self.upload("photo.jpg", b"same bytes")
+        second = self.upload("copy of photo.JPG", b"same bytes")
+        other = self.upload("photo.jpg", b"other bytes")
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertTrue(first.image.name.startswith("blobs/"))
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).refcount, 2)
+        self.accommodation.refresh_from_db()
+        self.assertEqual(self.accommodation.images[0], first.image.url)
+
+    def test_replacing_the_file_replaces_its_url(self):
+        """
+        Test that a new file for an image takes the place of the old URL, whose blob is released.
+        """
+        image = self.upload("photo.jpg", b"old bytes")
+        old_url = image.image.url
+        image.image = SimpleUploadedFile("photo.jpg", b"new bytes")
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+
+        self.accommodation.refresh_from_db()
+        self.assertEqual(self.accommodation.images, [image.image.url])
+        self.assertNotEqual(image.image.url, old_url)
+        self.assertFalse(MediaBlob.objects.filter(refcount=0).exists())
+
+    def test_blob_is_deleted_with_its_last_reference(self):
+        first = self.upload("photo.jpg", b"same bytes")
+        second = self.upload("photo.jpg", b"same bytes")
+        path = first.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(MediaBlob.objects.get(name=second.image.name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaBlob.objects.exists())
+        self.accommodation.refresh_from_db()
+        self.assertEqual(self.accommodation.images, [])
+
+    def test_blob_reused_before_its_deletion_runs_is_kept(self):
+        """
+        Test that an upload deduplicated onto a released blob keeps the file and its variants.
+        """
+        buffer = io.BytesIO()
+        PILImage.new("RGB", (400, 200), "red").save(buffer, "JPEG")
+        first = self.upload("photo.jpg", buffer.getvalue())
+        work(once=True)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        second = self.upload("again.jpg", buffer.getvalue())
+        for callback in callbacks:
+            callback()
+
+        self.assertTrue(os.path.exists(second.image.path))
+        self.assertEqual(MediaBlob.objects.get(name=second.image.name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(second.image.path))
+        variants_dir = os.path.join(os.path.dirname(second.image.path), "variants")
+        self.assertEqual(os.listdir(variants_dir), [])
+
+
+# Media Serving Test
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class MediaServingTest(TestCase):
+    def setUp(self):
+        from django.conf import settings
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "blobs"), exist_ok=True)
+        with open(os.path.join(settings.MEDIA_ROOT, "blobs", "photo.jpg"), "wb") as f:
+            f.write(bytes(range(256)) * 4)
+        self.url = reverse("media", args=["blobs/photo.jpg"])
+
+    def test_full_and_conditional_requests(self):
+        """
+        Test that media is served with validators and revalidated with a 304.
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b"".join(response.streaming_content)), 1024)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=256-511")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 256-511/1024")
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(256)))
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2048-")
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(MEDIA_SENDFILE_BACKEND="nginx")
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/blobs/photo.jpg")
+        self.assertEqual(response.content, b"")
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get(reverse("media", args=["blobs/missing.jpg"])).status_code, 404)
+        self.assertEqual(self.client.get("/media/../settings.py").status_code, 404)
+
+    def test_private_media_is_not_served(self):
+        """
+        Test that job files below MEDIA_ROOT are not reachable through the public media URL.
+        """
+        from django.conf import settings
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "jobs", "results"), exist_ok=True)
+        with open(os.path.join(settings.MEDIA_ROOT, "jobs", "results", "locations-1.csv"), "w") as f:
+            f.write("id,title\n")
+        for path in ("jobs/results/locations-1.csv", "blobs/../jobs/results/locations-1.csv"):
+            self.assertEqual(self.client.get(reverse("media", args=[path])).status_code, 404)
+
+    def test_only_blobs_are_cached_as_immutable(self):
+        """
+        Test that a mutable file reached through a path starting with the blob prefix is not cached for good.
+        """
+        from django.conf import settings
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "accommodations"), exist_ok=True)
+        with open(os.path.join(settings.MEDIA_ROOT, "accommodations", "photo.jpg"), "wb") as f:
+            f.write(b"mutable")
+        for path in ("accommodations/photo.jpg", "blobs/../accommodations/photo.jpg"):
+            response = self.client.get(reverse("media", args=[path]))
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("immutable", response["Cache-Control"])
+
+
+# Admin Changelist Query Budget Test
+
+
+class AdminChangelistQueryBudgetTest(TestCase):
+    """
+    Every changelist must run a fixed number of queries, however many rows the page shows.
+    """
+    # Session, user, count and page queries plus a few admin extras
+    QUERY_BUDGET = 8
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="test1234")
+        self.owner = User.objects.create_user(username="owner", password="test1234")
+        self.location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = Accommodation.objects.count()
+        for index in range(start, start + count):
+            accommodation = Accommodation.objects.create(
+                id=f"A{index}", title=f"Apartment {index}", country_code="US", bedroom_count=2,
+                usd_rate=100, center=Point(-74.006, 40.7128), location=self.location, user=self.owner,
+            )
+            AccommodationImage.objects.create(accommodation=accommodation, image=f"photos/{index}.jpg")
+            LocalizeAccommodation.objects.create(property=accommodation, language="en", description="Flat")
+
+    def changelist_queries(self, model_name):
+        url = reverse(f"admin:property_management_{model_name}_changelist")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertChangelistWithinBudget(self, model_name):
+        self.add_rows(2)
+        few = self.changelist_queries(model_name)
+        self.add_rows(20)
+        many = self.changelist_queries(model_name)
+        self.assertEqual(few, many, f"{model_name} changelist queries grow with the number of rows")
+        self.assertLessEqual(many, self.QUERY_BUDGET)
+
+    def test_accommodation_changelist(self):
+        self.assertChangelistWithinBudget("accommodation")
+
+    def test_accommodation_image_changelist(self):
+        self.assertChangelistWithinBudget("accommodationimage")
+
+    def test_localize_accommodation_changelist(self):
+        self.assertChangelistWithinBudget("localizeaccommodation")
+
+    def test_large_unfiltered_tables_use_the_estimate(self):
+        # Sums the partitions of the partitioned table; never analyzed here
+        self.assertGreaterEqual(estimated_row_count(Accommodation), 0)
+        with patch("property_management.pagination.ESTIMATED_COUNT_THRESHOLD", 0), \
+                patch("property_management.pagination.estimated_row_count", return_value=123456):
+            self.assertEqual(EstimatedCountPaginator(Accommodation.objects.all(), 100).count, 123456)
+            # Filtered querysets are always counted exactly
+            self.assertEqual(EstimatedCountPaginator(Accommodation.objects.filter(published=True), 100).count, 0)
+
+
+# Admin Permission Cache Test
+
+
+class AdminPermissionCacheTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="test1234", is_staff=True)
+        self.owner.groups.add(Group.objects.create(name="Property Owners"))
+        other = User.objects.create_user(username="other", password="test1234")
+        location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        self.accommodations = [
+            Accommodation.objects.create(
+                id=accommodation_id, title=accommodation_id, country_code="US", bedroom_count=2,
+                usd_rate=100, center=Point(-74.006, 40.7128), location=location, user=user,
+            )
+            for accommodation_id, user in [("A1", self.owner), ("A2", other)]
+        ]
+        for accommodation in self.accommodations:
+            LocalizeAccommodation.objects.create(property=accommodation, language="en", description="Flat")
+            AccommodationImage.objects.create(accommodation=accommodation, image="photos/photo.jpg")
+        # Fresh instances, so checks cannot reuse already loaded parents
+        self.images = list(AccommodationImage.objects.order_by("accommodation_id"))
+        self.localizations = list(LocalizeAccommodation.objects.order_by("property_id"))
+        self.request = RequestFactory().get("/admin/")
+        self.request.user = User.objects.get(pk=self.owner.pk)
+
+    def check_all(self):
+        site = AdminSite()
+        results = [LocationAdmin(Location, site).has_view_permission(self.request)]
+        accommodation_admin = AccommodationAdmin(Accommodation, site)
+        image_admin = AccommodationImageAdmin(AccommodationImage, site)
+        localization_admin = LocalizeAccommodationAdmin(LocalizeAccommodation, site)
+        results += [accommodation_admin.has_change_permission(self.request, obj) for obj in self.accommodations]
+        results += [image_admin.has_change_permission(self.request, obj) for obj in self.images]
+        results += [localization_admin.has_change_permission(self.request, obj) for obj in self.localizations]
+        return results
+
+    def test_permissions_are_loaded_once_per_request(self):
+        """
+        Test that group and ownership lookups run once and later checks add no queries.
+        """
+        expected = [True, True, False, True, False, True, False]
+        # One query for the groups, one for the owned accommodation ids
+        with self.assertNumQueries(2):
+            self.assertEqual(self.check_all(), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.check_all(), expected)
+
+
+# Request Metrics Test
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.staff = User.objects.create_user(username="staff", password="test1234", is_staff=True)
+
+    def test_sampled_requests_are_recorded(self):
+        """
+        Test that a request gets a Server-Timing header and shows up on /metrics.
+        """
+        response = self.client.get(reverse("home"))
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('inventory_request_duration_seconds_count{view="home"} 1', body)
+        self.assertIn('inventory_request_queries_quantile{view="home",quantile="0.99"}', body)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sampling_disabled(self):
+        response = self.client.get(reverse("home"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(metrics_registry.histograms, {})
+
+    @override_settings(METRICS_TOKEN="scraper-secret")
+    def test_metrics_require_staff_or_token(self):
+        """
+        Test that /metrics is refused to local anonymous requests and served with the bearer token.
+        """
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="127.0.0.1").status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer scraper-secret").status_code, 200)
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram((1, 2, 4))
+        for value in [0.5] * 50 + [3] * 50:
+            histogram.observe(value)
+        self.assertEqual(histogram.quantile(0.5), 1)
+        self.assertAlmostEqual(histogram.quantile(0.99), 3.96)
+
+
+# Accommodation Detail Cache Test
+
+
+@override_settings(LOCATION_TREE_CHECK_INTERVAL=60)
+class AccommodationDetailCacheTest(TestCase):
+    def setUp(self):
+        caches["accommodations"].clear()
+        metrics_registry.reset()
+        user = User.objects.create_user(username="owner", password="test1234")
+        location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        self.accommodation = Accommodation.objects.create(
+            id="A1", title="Loft", country_code="US", bedroom_count=2, usd_rate=100,
+            center=Point(-74.006, 40.7128), location=location, user=user, published=True,
+            amenities=["Free Wi-Fi"],
+        )
+        self.localization = LocalizeAccommodation.objects.create(
+            property=self.accommodation, language="en", description="Bright loft")
+        self.url = reverse("accommodation_detail", args=["A1"])
+
+    def test_reads_are_cached_until_a_write(self):
+        """
+        Test that repeated reads are served from the cache and every write invalidates it.
+        """
+        self.assertEqual(self.client.get(self.url).json()["description"], "Bright loft")
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        self.assertEqual(metrics_registry.counters["accommodation_cache_hits_total"], 1)
+        self.assertEqual(metrics_registry.counters["accommodation_cache_misses_total"], 1)
+
+        self.localization.description = "Sunny loft"
+        self.localization.save()
+        self.assertEqual(self.client.get(self.url).json()["description"], "Sunny loft")
+
+        AccommodationImage.objects.create(accommodation=self.accommodation, image="photos/loft.jpg")
+        self.assertEqual(self.client.get(self.url).json()["images"], ["/media/photos/loft.jpg"])
+
+        self.accommodation.published = False
+        self.accommodation.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_languages_are_cached_separately(self):
+        LocalizeAccommodation.objects.create(property=self.accommodation, language="es", description="Loft luminoso")
+        self.assertEqual(self.client.get(self.url, {"lang": "es"}).json()["description"], "Loft luminoso")
+        self.assertEqual(self.client.get(self.url).json()["description"], "Bright loft")
+
+
+# Location Tree Cache Test
+
+
+@override_settings(LOCATION_TREE_CHECK_INTERVAL=0)
+class LocationTreeCacheTest(TestCase):
+    def setUp(self):
+        for location_id, title, location_type, parent, state, city in [
+            ("US", "United States", "country", None, None, None),
+            ("US-CA", "California", "state", "US", "CA", None),
+            ("US-CA-SF", "San Francisco", "city", "US-CA", "CA", "San Francisco"),
+            ("GB", "United Kingdom", "country", None, None, None),
+        ]:
+            Location.objects.create(
+                id=location_id, title=title, center=Point(0, 0), location_type=location_type,
+                country_code=location_id[:2], state_abbr=state, city=city, parent_id=parent,
+            )
+
+    def test_lookups_use_the_loaded_tree(self):
+        """
+        Test that hierarchy lookups only compare the version once the tree is loaded.
+        """
+        get_location_tree()
+        # The version check is a single primary key lookup on CacheVersion
+        with self.assertNumQueries(1):
+            tree = get_location_tree()
+            self.assertEqual([node.id for node in tree.roots()], ["GB", "US"])
+            self.assertEqual([node.id for node in tree.children_of("US")], ["US-CA"])
+            self.assertEqual(
+                [crumb["title"] for crumb in tree.breadcrumbs("US-CA-SF")],
+                ["United States", "California", "San Francisco"],
+            )
+            self.assertEqual(tree.lookup("us", "ca", "san francisco").id, "US-CA-SF")
+            self.assertEqual(tree.lookup("US").id, "US")
+            self.assertEqual(sorted(tree.descendant_ids("US")), ["US", "US-CA", "US-CA-SF"])
+
+    def test_writes_from_any_path_reload_the_tree(self):
+        tree = get_location_tree()
+        # A bulk UPDATE bypasses signals; the trigger still bumps the version
+        Location.objects.filter(pk="GB").update(title="Britain")
+        reloaded = get_location_tree()
+        self.assertGreater(reloaded.version, tree.version)
+        self.assertEqual(reloaded.get("GB").title, "Britain")
+
+    def test_search_filters_by_location(self):
+        user = User.objects.create_user(username="owner", password="test1234")
+        for accommodation_id, location_id in [("A1", "US-CA-SF"), ("A2", "GB")]:
+            Accommodation.objects.create(
+                id=accommodation_id, title=accommodation_id, country_code=location_id[:2], bedroom_count=2,
+                usd_rate=100, center=Point(0, 0), location_id=location_id, user=user, published=True,
+            )
+        response = self.client.get(reverse("accommodation_search"), {"location": "US"}).json()
+        self.assertEqual([row["id"] for row in response["results"]], ["A1"])
+        response = self.client.get(reverse("accommodation_search"), {"location": "XX"})
+        self.assertEqual(response.status_code, 400)
+
+
+# Admin Autocomplete Test
+
+
+class AdminAutocompleteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username="admin", password="test1234")
+        for location_id, title, location_type, city in [
+            ("SM", "San Marino", "country", None),
+            ("US-CA-SF", "San Francisco", "city", "San Francisco"),
+            ("US-CA", "California", "state", None),
+            ("US-CA-SD", "Santa Cruz", "city", "Santa Cruz"),
+        ]:
+            Location.objects.create(
+                id=location_id, title=title, center=Point(0, 0), location_type=location_type,
+                country_code=location_id[:2], city=city,
+            )
+        self.client.force_login(self.admin)
+
+    def autocomplete(self, field_name, term):
+        return self.client.get(reverse("admin:autocomplete"), {
+            "term": term, "app_label": "property_management",
+            "model_name": "accommodation", "field_name": field_name,
+        })
+
+    def test_location_prefix_matches_ranked_by_type(self):
+        """
+        Test that locations are matched by prefix, countries first, and the ranking is cached.
+        """
+        response = self.autocomplete("location", "san")
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]], ["SM", "US-CA-SF", "US-CA-SD"])
+
+        with CaptureQueriesContext(connection) as cached:
+            self.autocomplete("location", "san")
+        self.assertFalse(any("LIKE" in query["sql"] for query in cached.captured_queries))
+
+    def test_user_prefix_matches(self):
+        User.objects.create_user(username="owner1", password="test1234")
+        User.objects.create_user(username="other", password="test1234")
+        response = self.autocomplete("user", "own")
+        self.assertEqual([result["text"] for result in response.json()["results"]], ["owner1"])
+
+    def test_change_form_does_not_list_every_location(self):
+        url = reverse("admin:property_management_accommodation_add")
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for index in range(20):
+            Location.objects.create(
+                id=f"X{index}", title=f"Place {index}", center=Point(0, 0),
+                location_type="city", country_code="XX",
+            )
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertNotContains(response, "Place 19")
+        self.assertEqual(len(few), len(many))
+
+
+# Partition Management Test
+
+
+class PartitionManagerTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="owner", password="test1234")
+        location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        for index, feed in enumerate([10, 10, 20, 300, 600]):
+            Accommodation.objects.create(
+                id=f"A{index}", feed=feed, title=f"A{index}", country_code="US", bedroom_count=1,
+                usd_rate=100, center=Point(-74.006, 40.7128), location=location, user=user,
+            )
+
+    def test_list_partitions(self):
+        partitions = Accommodation.partitions.list(exact=True)
+        self.assertEqual(
+            [(p.name, p.lower, p.upper, p.rows) for p in partitions],
+            [
+                ("accommodation_feed_0_500", 0, 501, 4),
+                ("accommodation_feed_501_2000", 501, 2001, 1),
+                ("accommodation_feed_2001_5000", 2001, 5001, 0),
+                ("accommodation_feed_5000_plus", 5001, None, 0),
+            ],
+        )
+
+    def test_split_refused_inside_transaction(self):
+        """
+        Test that a split is refused inside a transaction, where its steps could not commit one by one.
+        """
+        with self.assertRaises(transaction.TransactionManagementError):
+            Accommodation.partitions.split("accommodation_feed_0_500", [20, 100])
+        self.assertIn("accommodation_feed_0_500", [p.name for p in Accommodation.partitions.list()])
+
+    def test_rebalance_plan_from_feed_distribution(self):
+        self.assertEqual(Accommodation.partitions.plan_rebalance(max_rows=2), {"accommodation_feed_0_500": [20]})
+        with self.assertRaises(ValueError):
+            Accommodation.partitions.split("accommodation_feed_0_500", [0])
+
+
+class PartitionSplitTest(TransactionTestCase):
+    def setUp(self):
+        user = User.objects.create_user(username="owner", password="test1234")
+        self.location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        for index, feed in enumerate([10, 10, 20, 300, 600]):
+            Accommodation.objects.create(
+                id=f"A{index}", feed=feed, title=f"A{index}", country_code="US", bedroom_count=1,
+                usd_rate=100, center=Point(-74.006, 40.7128), location=self.location, user=user,
+            )
+
+    def tearDown(self):
+        # Put back the partition layout of the migrations for the next tests
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DROP TABLE IF EXISTS accommodation_feed_0_19, accommodation_feed_20_99, accommodation_feed_100_500, "
+                "accommodation_feed_0_500, accommodation_feed_0_500_split_log CASCADE")
+            cursor.execute("DROP FUNCTION IF EXISTS accommodation_feed_0_500_split_log()")
+            cursor.execute(
+                "CREATE TABLE accommodation_feed_0_500 PARTITION OF property_management_accommodation "
+                "FOR VALUES FROM (0) TO (501)")
+
+    def partition_ids(self):
+        ids = {}
+        with connection.cursor() as cursor:
+            for name in ("accommodation_feed_0_19", "accommodation_feed_20_99", "accommodation_feed_100_500"):
+                cursor.execute(f'SELECT id FROM "{name}" ORDER BY id')
+                ids[name] = [row[0] for row in cursor.fetchall()]
+        return ids
+
+    def test_split_keeps_rows_written_while_copying(self):
+        """
+        Test that rows written while the split copies are in the new partitions, with their latest values.
+        """
+        written = []
+
+        def write_rows(copied):
+            if written:
+                return
+            written.append(copied)
+            Accommodation.objects.filter(id="A0").update(title="Renamed")
+            Accommodation.objects.filter(id="A1").delete()
+            Accommodation.objects.create(
+                id="A5", feed=50, title="A5", country_code="US", bedroom_count=1,
+                usd_rate=100, center=Point(-74.006, 40.7128), location=self.location,
+            )
+            moved = Accommodation.objects.get(id="A3")
+            moved.feed = 30
+            moved.save()
+
+        created = Accommodation.partitions.split(
+            "accommodation_feed_0_500", [20, 100], batch_size=2, progress=write_rows)
+        self.assertEqual(len(created), 3)
+        self.assertNotIn("accommodation_feed_0_500", [p.name for p in Accommodation.partitions.list()])
+        self.assertEqual(self.partition_ids(), {
+            "accommodation_feed_0_19": ["A0"],
+            "accommodation_feed_20_99": ["A2", "A3", "A5"],
+            "accommodation_feed_100_500": [],
+        })
+        self.assertEqual(Accommodation.objects.count(), 5)
+        self.assertEqual(Accommodation.objects.get(id="A0").title, "Renamed")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_indexes WHERE tablename = 'accommodation_feed_20_99'")
+            self.assertGreater(cursor.fetchone()[0], 1)
+            cursor.execute("SELECT to_regclass('accommodation_feed_0_500_split_log')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_interrupted_split_keeps_rows_readable_and_resumes(self):
+        """
+        Test that rows stay readable when the final swap fails and that calling the split again finishes it.
+        """
+        with patch.object(PartitionManager, "_swap", side_effect=OperationalError("lock timeout")):
+            with self.assertRaises(OperationalError):
+                Accommodation.partitions.split("accommodation_feed_0_500", [20, 100], batch_size=2)
+        self.assertIn("accommodation_feed_0_500", [p.name for p in Accommodation.partitions.list()])
+        self.assertEqual(Accommodation.objects.count(), 5)
+
+        Accommodation.objects.filter(id="A2").delete()
+        Accommodation.partitions.split("accommodation_feed_0_500", [20, 100], batch_size=2)
+        self.assertEqual(self.partition_ids(), {
+            "accommodation_feed_0_19": ["A0", "A1"],
+            "accommodation_feed_20_99": [],
+            "accommodation_feed_100_500": ["A3"],
+        })
+        self.assertEqual(Accommodation.objects.count(), 4)
+
+
+# Partition Routing Test
+
+
+class PartitionRoutingTest(TestCase):
+    def setUp(self):
+        caches["accommodations"].clear()
+        user = User.objects.create_user(username="owner", password="test1234")
+        self.location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        for accommodation_id, feed in [("A1", 10), ("A2", 600)]:
+            Accommodation.objects.create(
+                id=accommodation_id, feed=feed, title=accommodation_id, country_code="US", bedroom_count=1,
+                usd_rate=100, center=Point(-74.006, 40.7128), location=self.location, user=user,
+            )
+
+    def test_get_by_id_reads_one_partition(self):
+        """
+        Test that get() by id is pruned to the partition of the id once its feed is known.
+        """
+        caches["accommodations"].clear()
+        self.assertGreater(len(scanned_relations(Accommodation.objects.filter(pk="A1"))), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Accommodation.objects.get(pk="A1").feed, 10)
+        self.assertNotIn('"feed"', queries[0]["sql"].split("WHERE")[1])
+        self.assertEqual(cached_feeds(["A1"]), {"A1": 10})
+
+        with CaptureQueriesContext(connection) as queries:
+            Accommodation.objects.get(pk="A1")
+        self.assertIn('"feed" = 10', queries[0]["sql"])
+        self.assertEqual(
+            scanned_relations(Accommodation.objects.filter(pk="A1", feed=10)), {"accommodation_feed_0_500"})
+
+    def test_related_access_routes_by_feed(self):
+        image = AccommodationImage.objects.create(accommodation_id="A2", image="photos/a2.jpg")
+        image = AccommodationImage.objects.get(pk=image.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(image.accommodation.title, "A2")
+        self.assertIn('"feed" = 600', queries[0]["sql"])
+
+    def test_save_updates_the_loaded_partition(self):
+        accommodation = Accommodation.objects.get(pk="A2")
+        accommodation.title = "Renamed"
+        with CaptureQueriesContext(connection) as queries:
+            accommodation.save()
+        updates = [query["sql"] for query in queries if query["sql"].startswith(
+            'UPDATE "property_management_accommodation"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"feed" = 600', updates[0].split("WHERE")[1])
+
+    def test_feed_changes_keep_lookups_correct(self):
+        """
+        Test that moving a row to another partition, or a stale cached feed, never hides it.
+        """
+        accommodation = Accommodation.objects.get(pk="A1")
+        accommodation.feed = 2500
+        accommodation.save()
+        self.assertEqual(cached_feeds(["A1"]), {"A1": 2500})
+        self.assertEqual(Accommodation.objects.filter(pk="A1").count(), 1)
+
+        Accommodation.objects.filter(pk="A1").update(feed=20)
+        self.assertEqual(cached_feeds(["A1"]), {})
+        self.assertEqual(Accommodation.objects.get(pk="A1").feed, 20)
+
+        remember_feeds({"A1": 600})
+        self.assertEqual(Accommodation.objects.get(pk="A1").feed, 20)
+        self.assertEqual(cached_feeds(["A1"]), {"A1": 20})
+
+        Accommodation.objects.get(pk="A1").delete()
+        self.assertEqual(cached_feeds(["A1"]), {})
+
+    def test_stale_feed_from_another_process_is_harmless(self):
+        """
+        Test that filter(), update() and save() find rows moved behind the feed cache's back.
+        """
+        loaded = Accommodation.objects.get(pk="A1")
+        # Another process moves the row; this process still caches feed 10
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE property_management_accommodation SET feed = 20 WHERE id = 'A1'")
+        self.assertEqual(cached_feeds(["A1"]), {"A1": 10})
+
+        self.assertEqual(Accommodation.objects.filter(pk="A1").count(), 1)
+        self.assertEqual(Accommodation.objects.filter(pk="A1").update(title="Updated"), 1)
+        loaded.title = "Saved"
+        loaded.save()
+        self.assertEqual(list(Accommodation.objects.filter(pk="A1").values_list("title", flat=True)), ["Saved"])
+
+    def test_pruning_check(self):
+        caches["accommodations"].clear()
+        self.assertEqual(check_accommodation_partition_pruning(None, databases=["default"]), [])
+        self.assertEqual(check_accommodation_partition_pruning(None), [])
+        # The check covers the cold cache path without warming the cache
+        self.assertEqual(cached_feeds(["A1", "A2"]), {})
+
+        with connection.cursor() as cursor:
+            cursor.execute("DROP INDEX accommodation_id")
+        warnings = check_accommodation_partition_pruning(None, databases=["default"])
+        self.assertEqual(
+            {warning.msg.split(" query")[0] for warning in warnings},
+            {"The cold cache get by id", "The id list", "The image join", "The localization join"},
+        )
+        self.assertEqual({warning.id for warning in warnings}, {"property_management.W002"})
+
+    def test_pruning_check_stays_out_of_migrate(self):
+        """
+        Test that the check only runs as a deployment check and finds nothing on an unmigrated schema.
+        """
+        self.assertNotIn(check_accommodation_partition_pruning, checks_registry.get_checks())
+        self.assertIn(check_accommodation_partition_pruning, checks_registry.get_checks(include_deployment_checks=True))
+        with connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE property_management_accommodation RENAME COLUMN content_hash TO old_hash")
+        self.assertEqual(check_accommodation_partition_pruning(None, databases=["default"]), [])
+        # The failed EXPLAIN did not abort the surrounding transaction
+        self.assertEqual(len(Accommodation.partitions.list()), 4)
+
+
+# Feed Ingestion Test
+
+
+@override_settings(LOCATION_TREE_CHECK_INTERVAL=0)
+class FeedIngestionTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="partner", password="test1234")
+        Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        # Same partition, other feed: never touched by feed 10 ingests
+        Accommodation.objects.create(
+            id="OTHER", feed=20, title="Other", country_code="US", bedroom_count=1, usd_rate=90,
+            center=Point(-74.0, 40.7), location_id="1", user=self.owner, published=True,
+        )
+
+    def record(self, accommodation_id, **fields):
+        return json.dumps({
+            "id": accommodation_id, "title": f"Loft {accommodation_id}", "country_code": "us",
+            "bedroom_count": 2, "usd_rate": "120.50", "center": [-74.006, 40.7128], "location": "1",
+            "amenities": ["Free Wi-Fi"], "images": ["https://cdn.example.com/a.jpg"], **fields,
+        })
+
+    def ingest(self, *lines, **kwargs):
+        return ingest_accommodation_feed(io.StringIO("\n".join(lines) + "\n"), 10, self.owner, **kwargs)
+
+    def test_serial_time_leaves_out_lock_waits(self):
+        run = FeedRunReport()
+        for feed, lock_wait in ((10, 0.0), (20, 3.0)):
+            report = FeedIngestReport(feed)
+            report.started, report.finished, report.lock_wait = 0.0, 4.0, lock_wait
+            run.add(None, report)
+        self.assertEqual(run.serial_seconds, 5.0)
+
+    def test_ingest_inserts_updates_and_unpublishes(self):
+        """
+        Test that a second ingest rewrites only changed records and unpublishes the vanished ones.
+        """
+        report = self.ingest(
+            self.record("F1"), self.record("F2"), self.record("F3"),
+            self.record("BAD", usd_rate="cheap"), "not json", self.record("F4", location="nowhere"),
+            batch_size=2,
+        )
+        self.assertEqual((report.rows, report.loaded, report.inserted), (6, 3, 3))
+        self.assertEqual([error[1] for error in report.errors], ["BAD", None, "F4"])
+        self.assertEqual(report.partition, "accommodation_feed_0_500")
+        f1 = Accommodation.objects.get(pk="F1")
+        self.assertEqual((f1.feed, f1.country_code, f1.images, f1.user), (10, "US", ["https://cdn.example.com/a.jpg"], self.owner))
+        self.assertTrue(f1.published)
+
+        report = self.ingest(self.record("F1"), self.record("F2", title="Renamed"), self.record("BAD", usd_rate="x"))
+        self.assertEqual((report.inserted, report.updated, report.unchanged, report.unpublished), (0, 1, 1, 1))
+        self.assertEqual(Accommodation.objects.get(pk="F2").title, "Renamed")
+        self.assertFalse(Accommodation.objects.get(pk="F3").published)
+        self.assertTrue(Accommodation.objects.get(pk="OTHER").published)
+        self.assertGreater(report.rows_per_second, 0)
+
+        # A vanished record that comes back is published again
+        report = self.ingest(self.record("F1"), self.record("F2", title="Renamed"), self.record("F3"))
+        self.assertEqual(report.updated, 1)
+        self.assertTrue(Accommodation.objects.get(pk="F3").published)
+
+    def test_records_of_other_feeds_are_rejected(self):
+        report = self.ingest(self.record("OTHER"), self.record("F5", feed=30))
+        self.assertEqual(report.loaded, 0)
+        self.assertEqual([error[2] for error in report.errors], ["Record of feed 30", "Already listed in feed 20"])
+        # Nothing was loaded, so nothing is unpublished
+        self.assertEqual(report.unpublished, 0)
+
+    def test_ids_listed_by_another_feed_meanwhile_are_rejected_in_the_merge(self):
+        """
+        Test that the merge rejects an id another feed inserted after the batch was checked.
+        """
+        accept_all = lambda cursor, batch, feed, report: [values for _, values in batch]
+        with patch("property_management.feeds.check_batch", side_effect=accept_all):
+            report = self.ingest(self.record("N1"), self.record("OTHER"))
+        self.assertEqual((report.loaded, report.inserted), (1, 1))
+        self.assertEqual(report.errors, [(2, "OTHER", "Already listed in feed 20")])
+        self.assertEqual(list(Accommodation.objects.filter(pk="OTHER").values_list("feed", flat=True)), [20])
+
+    def test_ingest_feed_command_reads_csv(self):
+        path = os.path.join(tempfile.mkdtemp(), "feed.csv")
+        with open(path, "w", newline="") as f:
+            f.write(
+                "id,title,country_code,bedroom_count,usd_rate,latitude,longitude,location,amenities,published\n"
+                'C1,Cabin,US,3,80,40.7,-74.0,1,"[""Parking""]",true\n'
+            )
+        out = io.StringIO()
+        call_command("ingest_feed", path, feed=10, owner="partner", stdout=out)
+        self.assertIn("1 inserted", out.getvalue())
+        self.assertEqual(Accommodation.objects.get(pk="C1").amenities, ["Parking"])
+
+    def test_feed_directory_is_ingested_by_partition(self):
+        """
+        Test that a directory of feed files is mapped to partitions and ingested with one aggregated report.
+        """
+        directory = tempfile.mkdtemp()
+        for name, lines in [
+            ("feed_10.ndjson", [self.record("F1"), self.record("F2")]),
+            ("feed_600.ndjson", [self.record("G1", usd_rate="nope")]),
+            ("notes.txt", ["ignored"]),
+        ]:
+            with open(os.path.join(directory, name), "w") as f:
+                f.write("\n".join(lines) + "\n")
+        with open(os.path.join(directory, "feed_2500.csv"), "w") as f:
+            f.write("id,title,country_code,bedroom_count,usd_rate,center,location\nH1,Hut,US,1,40,POINT(-74 40.7),1\n")
+
+        feed_files = discover_feed_files(directory)
+        self.assertEqual(
+            sorted((feed_file.feed, feed_file.format, feed_file.partition) for feed_file in feed_files),
+            [(10, "ndjson", "accommodation_feed_0_500"), (600, "ndjson", "accommodation_feed_501_2000"),
+             (2500, "csv", "accommodation_feed_2001_5000")],
+        )
+
+        finished = []
+        run = ingest_feed_files(
+            feed_files, self.owner, workers=1, progress=lambda feed_file, report, error: finished.append(feed_file.feed))
+        self.assertEqual(sorted(finished), [10, 600, 2500])
+        self.assertEqual(run.failures, [])
+        self.assertEqual((run.total("rows"), run.total("inserted"), run.rejected), (4, 3, 1))
+        self.assertEqual(Accommodation.objects.get(pk="H1").feed, 2500)
+
+        with open(os.path.join(directory, "10.csv"), "w") as f:
+            f.write("id\n")
+        with self.assertRaises(ValueError):
+            discover_feed_files(directory)
+
+
+def record_feed_ingest(path, feed, owner_id, file_format, batch_size, unpublish_missing, excluded_ids=None):
+    # Stands in for ingest_feed_file in the worker processes, noting when it ran
+    started = time.time()
+    time.sleep(0.3)
+    with open(f"{path}.ran", "w") as f:
+        f.write(f"{started} {time.time()}")
+    return FeedIngestReport(feed)
+
+
+@override_settings(LOCATION_TREE_CHECK_INTERVAL=0)
+class ParallelFeedIngestionTest(TransactionTestCase):
+    """
+    Worker processes use their own connections, so their writes must be committed to be seen.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="partner", password="test1234")
+        Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        self.directory = tempfile.mkdtemp()
+
+    def write_feed(self, name, *ids):
+        with open(os.path.join(self.directory, name), "w") as f:
+            for accommodation_id in ids:
+                f.write(json.dumps({
+                    "id": accommodation_id, "title": accommodation_id, "country_code": "US", "bedroom_count": 1,
+                    "usd_rate": 50, "center": [-74.006, 40.7128], "location": "1",
+                }) + "\n")
+
+    def test_worker_processes_ingest_and_reject_ids_shared_by_files(self):
+        """
+        Test that forked workers ingest through their own connections and ids listed in two files are rejected.
+        """
+        self.write_feed("feed_10.ndjson", "P1", "S1")
+        self.write_feed("feed_600.ndjson", "P2", "S1")
+        self.write_feed("feed_20.ndjson", "P3")
+        connections_at_fork = []
+
+        def process_pool(*args, **kwargs):
+            connections_at_fork.append(connection.connection)
+            return ProcessPoolExecutor(*args, **kwargs)
+
+        with patch("property_management.feeds.ProcessPoolExecutor", side_effect=process_pool):
+            run = ingest_feed_files(discover_feed_files(self.directory), self.owner, workers=2)
+
+        self.assertEqual(connections_at_fork, [None])
+        self.assertEqual(run.failures, [])
+        self.assertEqual(run.total("inserted"), 3)
+        self.assertEqual(sorted(Accommodation.objects.values_list("id", flat=True)), ["P1", "P2", "P3"])
+        errors = {report.feed: [error[1:] for error in report.errors] for report in run.reports}
+        self.assertEqual(errors[10], [("S1", "Also listed in the file of feed 600")])
+        self.assertEqual(errors[600], [("S1", "Also listed in the file of feed 10")])
+        self.assertEqual(errors[20], [])
+
+    def test_merge_waits_only_for_ids_it_inserts(self):
+        """
+        Test that a merge is not held up by another ingest's id locks unless it inserts one of those ids.
+        """
+        self.write_feed("feed_10.ndjson", "L1")
+        ingest_accommodation_feed(open(os.path.join(self.directory, "feed_10.ndjson")), 10, self.owner)
+        self.write_feed("feed_10.ndjson", "L1", "L2")
+        self.write_feed("feed_20.ndjson", "L3")
+        other = connection.copy()
+        try:
+            with other.cursor() as cursor:
+                cursor.execute("BEGIN")
+                cursor.execute(
+                    "SELECT pg_advisory_xact_lock(%s, hashtext(id)) FROM unnest(%s::text[]) id",
+                    [FEED_ID_LOCK_CLASS, ["L1", "L2"]])
+                with connection.cursor() as own:
+                    own.execute("SET lock_timeout = '2s'")
+                ingest_accommodation_feed(open(os.path.join(self.directory, "feed_20.ndjson")), 20, self.owner)
+                with self.assertRaises(OperationalError):
+                    ingest_accommodation_feed(open(os.path.join(self.directory, "feed_10.ndjson")), 10, self.owner)
+                cursor.execute("ROLLBACK")
+        finally:
+            other.close()
+            with connection.cursor() as own:
+                own.execute("RESET lock_timeout")
+        self.assertEqual(sorted(Accommodation.objects.values_list("id", flat=True)), ["L1", "L3"])
+
+    def test_partition_cap_limits_concurrent_ingests(self):
+        """
+        Test that at most per_partition files of one partition are ingested at once, while others run alongside.
+        """
+        for feed in (1, 2, 3, 600):
+            self.write_feed(f"feed_{feed}.ndjson", f"R{feed}")
+        feed_files = discover_feed_files(self.directory)
+
+        with patch("property_management.feeds.ingest_feed_file", record_feed_ingest):
+            run = ingest_feed_files(feed_files, self.owner, workers=4, per_partition=1)
+
+        self.assertEqual(run.failures, [])
+        intervals = {}
+        for feed_file in feed_files:
+            with open(f"{feed_file.path}.ran") as f:
+                intervals[feed_file.feed] = tuple(float(value) for value in f.read().split())
+        same_partition = sorted(intervals[feed] for feed in (1, 2, 3))
+        for (_, end), (start, _) in zip(same_partition, same_partition[1:]):
+            self.assertLessEqual(end, start)
+        start, end = intervals[600]
+        self.assertTrue(any(start < other_end and other_start < end for other_start, other_end in same_partition))
+
+
+# Streaming Export Test
+
+
+class StreamingExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="admin", password="test1234")
+        location = Location.objects.create(
+            id="1", title="New York", center=Point(-74.006, 40.7128),
+            location_type="City", country_code="US", state_abbr="NY", city="New York",
+        )
+        for accommodation_id, feed, published in [("A1", 10, True), ("A2", 10, False), ("A3", 600, True)]:
+            Accommodation.objects.create(
+                id=accommodation_id, feed=feed, title=accommodation_id, country_code="US", bedroom_count=1,
+                usd_rate=100, center=Point(-74.006, 40.7128), location=location, user=self.user,
+                published=published, amenities=["Free Wi-Fi"],
+            )
+
+    def test_export_is_streamed_in_chunks(self):
+        """
+        Test that rows are filtered, read in chunks and written as NDJSON.
+        """
+        export = StreamingExport("accommodations", "ndjson", chunk_size=1, feed=10)
+        chunks = list(export)
+        self.assertEqual(len(chunks), 2)
+        records = [json.loads(chunk) for chunk in chunks]
+        self.assertEqual([record["id"] for record in records], ["A1", "A2"])
+        self.assertEqual(records[0]["amenities"], ["Free Wi-Fi"])
+        self.assertAlmostEqual(records[0]["latitude"], 40.7128)
+        self.assertEqual(export.rows, 2)
+
+        published = "".join(StreamingExport("accommodations", "csv", published=True)).splitlines()
+        self.assertEqual(published[0].split(",")[:3], ["id", "feed", "title"])
+        self.assertEqual([line.split(",")[0] for line in published[1:]], ["A1", "A3"])
+        row = next(csv.DictReader(io.StringIO("".join(StreamingExport("accommodations", "csv", feed=600)))))
+        self.assertEqual(json.loads(row["amenities"]), ["Free Wi-Fi"])
+
+        with self.assertRaises(ValueError):
+            StreamingExport("locations", "csv", feed=10)
+
+    def test_admin_streaming_export(self):
+        self.client.force_login(self.user)
+        url = reverse("admin:property_management_accommodation_stream_export")
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        response = self.client.get(url, {"format": "csv", "feed": 600, "published": "true"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="accommodations.csv"')
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([line.split(",")[0] for line in lines[1:]], ["A3"])
+
+    def test_stream_export_command(self):
+        out = io.StringIO()
+        call_command("stream_export", "locations", "--format", "ndjson", "--country", "us", stdout=out)
+        record = json.loads(out.getvalue())
+        self.assertEqual((record["id"], record["center"]), ("1", "POINT(-74.006 40.7128)"))
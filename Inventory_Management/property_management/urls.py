@@ -7,4 +7,10 @@ urlpatterns = [
     path("", views.home, name="home"),
     path('sign-up/', views.property_owner_sign_up, name='property_owner_sign_up'),
     path('sign-up/success/', views.property_owner_sign_up_success, name='property_owner_sign_up_success'),
+    path('api/accommodations/nearby/', views.nearby_accommodations_api, name='nearby_accommodations'),
+    path('api/accommodations/search/', views.accommodation_search_api, name='accommodation_search'),
+    path('api/accommodations/text-search/', views.accommodation_text_search_api, name='accommodation_text_search'),
+    path('api/accommodations/<str:accommodation_id>/', views.accommodation_detail_api, name='accommodation_detail'),
+    path('tiles/<int:z>/<int:x>/<int:y>/', views.accommodation_tile_api, name='accommodation_tile'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
@@ -1,10 +1,26 @@
+import hmac
+
 from django.shortcuts import render, redirect
 from .forms import PropertyOwnerSignUpForm
 from django.contrib.auth import login
 from django.contrib import messages
 from django.shortcuts import render
 
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.views.decorators.http import require_GET
+from . import metrics
+from .detail_cache import get_accommodation_detail
+from .fulltext import search_localizations
+from .geo import MAX_TILE_ZOOM, accommodation_tile, decode_cursor, encode_cursor, nearby_accommodations
+from .location_tree import get_location_tree
+from .search import facet_counts, filter_accommodations, search_page
+from .serializers import accommodation_summary
+
+# Upper bounds for the public search endpoints
+MAX_PAGE_SIZE = 100
+MAX_RADIUS_KM = 500
 
 
 def home(request):
@@ -32,3 +48,158 @@ def property_owner_sign_up(request):
 
 def property_owner_sign_up_success(request):
     return render(request, 'property_owner_sign_up_success.html')
+
+
+def _float_param(request, name, minimum, maximum, default=None, required=True):
+    """
+    Read a float query parameter.
+    :param required: If False, a missing parameter is returned as None.
+    :raises ValueError: If it is missing, malformed or out of range.
+    """
+    value = request.GET.get(name, default)
+    if value in (None, ''):
+        if not required:
+            return None
+        raise ValueError(f'{name} is required')
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number')
+    if not minimum <= value <= maximum:
+        raise ValueError(f'{name} must be between {minimum} and {maximum}')
+    return value
+
+
+@require_GET
+def nearby_accommodations_api(request):
+    """
+    Published accommodations within radius_km of lat/lon, nearest first.
+    Pass the returned next_cursor back as cursor to fetch the next page.
+    """
+    try:
+        lat = _float_param(request, 'lat', -90, 90)
+        lon = _float_param(request, 'lon', -180, 180)
+        radius_km = _float_param(request, 'radius_km', 0, MAX_RADIUS_KM, default=10)
+        limit = int(_float_param(request, 'limit', 1, MAX_PAGE_SIZE, default=20))
+        after = decode_cursor(request.GET['cursor'], (float, str)) if request.GET.get('cursor') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    accommodations, last = nearby_accommodations(lat, lon, radius_km, limit=limit, after=after)
+    results = []
+    for accommodation in accommodations:
+        data = accommodation_summary(accommodation)
+        data['distance_km'] = round(accommodation.distance / 1000, 3)
+        results.append(data)
+
+    return JsonResponse({
+        'results': results,
+        'next_cursor': encode_cursor(*last) if last else None,
+    })
+
+
+@require_GET
+def accommodation_tile_api(request, z, x, y):
+    """
+    Clustered published accommodations for one XYZ map tile.
+    """
+    if z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        raise Http404('No such tile')
+    response = JsonResponse(accommodation_tile(z, x, y))
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+@require_GET
+def accommodation_search_api(request):
+    """
+    Faceted search over published accommodations.
+
+    Filters: amenity (repeatable, all must match), country, location (matches
+    at any depth below it), min_bedrooms, max_bedrooms, min_price, max_price
+    and min_review. The response carries one page of results plus amenity
+    and price facet counts for all matches.
+    """
+    try:
+        qs = filter_accommodations(
+            amenities=request.GET.getlist('amenity'),
+            country=request.GET.get('country'),
+            min_bedrooms=_float_param(request, 'min_bedrooms', 0, 1000, required=False),
+            max_bedrooms=_float_param(request, 'max_bedrooms', 0, 1000, required=False),
+            min_price=_float_param(request, 'min_price', 0, 10 ** 8, required=False),
+            max_price=_float_param(request, 'max_price', 0, 10 ** 8, required=False),
+            min_review=_float_param(request, 'min_review', 0, 10, required=False),
+            location=request.GET.get('location'),
+        )
+        limit = int(_float_param(request, 'limit', 1, MAX_PAGE_SIZE, default=20))
+        after = decode_cursor(request.GET['cursor'], (str, str)) if request.GET.get('cursor') else None
+        accommodations, last = search_page(qs, limit=limit, after=after)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'results': [accommodation_summary(accommodation) for accommodation in accommodations],
+        'facets': facet_counts(qs),
+        'next_cursor': encode_cursor(*last) if last else None,
+    })
+
+
+@require_GET
+def accommodation_text_search_api(request):
+    """
+    Full-text search over localized descriptions in one language (lang, default "en").
+    """
+    text = request.GET.get('q', '').strip()
+    language = request.GET.get('lang', 'en').lower()
+    try:
+        if not text:
+            raise ValueError('q is required')
+        if len(language) != 2:
+            raise ValueError('lang must be a two-letter language code')
+        limit = int(_float_param(request, 'limit', 1, MAX_PAGE_SIZE, default=20))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    results = []
+    for localization in search_localizations(text, language, limit):
+        data = accommodation_summary(localization.property)
+        data['language'] = localization.language
+        data['rank'] = localization.rank
+        results.append(data)
+    return JsonResponse({'results': results})
+
+
+@require_GET
+def accommodation_detail_api(request, accommodation_id):
+    """
+    One published accommodation with its images, amenities and the
+    localization in lang (default "en"), served from the detail cache.
+    """
+    language = request.GET.get('lang', 'en').lower()
+    if len(language) != 2:
+        return JsonResponse({'error': 'lang must be a two-letter language code'}, status=400)
+    detail = get_accommodation_detail(accommodation_id, language)
+    if detail is None:
+        raise Http404('No such accommodation')
+    # Not part of the cached detail, so renamed locations show up right away
+    breadcrumbs = get_location_tree().breadcrumbs(detail['location_id'])
+    return JsonResponse({**detail, 'breadcrumbs': breadcrumbs})
+
+
+def _has_metrics_token(request):
+    token = settings.METRICS_TOKEN
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Request metrics of this process in the Prometheus text format.
+    Open to staff users and to scrapers sending "Authorization: Bearer
+    <METRICS_TOKEN>". The client address is not trusted: behind a reverse
+    proxy on the same host every request comes from 127.0.0.1.
+    """
+    if not (request.user.is_staff or _has_metrics_token(request)):
+        raise PermissionDenied
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')